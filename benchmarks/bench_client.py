@@ -0,0 +1,294 @@
+"""Offline benchmarks of Tratum API clients against the mock server.
+
+Reports throughput and p50/p99 latency of single requests, bulk calls,
+journaled bulk jobs and document downloads. Run from the repository root:
+
+    python benchmarks/bench_client.py --requests 500 --latency 0.02
+
+Use `--json` to save the results and compare them between versions.
+"""
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tratum_api.bulk import bounded_map  # NOQA: E402
+from tratum_api.data import TratumAPI  # NOQA: E402
+from tratum_api.jobs import JobJournal, JobRunner  # NOQA: E402
+from tratum_api.mock_server import MockTratumServer  # NOQA: E402
+
+
+def make_process_number(index: int) -> str:
+    """Valid CNJ process number for the index."""
+    sequence = "{:07d}".format(index % 10_000_000)
+    rest = "2024" + "8" + "26" + "0100"
+    dv = 98 - int(sequence + rest) * 100 % 97
+    return "{sequence}{dv:02d}{rest}".format(
+        sequence=sequence, dv=dv, rest=rest)
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Percentile of values using nearest rank."""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Timer:
+    """Collect latency of calls made by many threads."""
+
+    def __init__(self):
+        """__init__."""
+        self.latencies = []
+
+    def wrap(self, func):
+        """Wrap function recording its latency."""
+        def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.latencies.append(time.perf_counter() - started_at)
+        return timed
+
+
+def report(name: str, count: int, elapsed: float, latencies: list,
+           nbytes: int = 0) -> dict:
+    """Summarize a benchmark run."""
+    result = {
+        "name": name,
+        "count": count,
+        "elapsed": elapsed,
+        "throughput": count / elapsed if elapsed else float('nan'),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": (statistics.mean(latencies) * 1000
+                    if latencies else float('nan')),
+        "mb_per_s": nbytes / elapsed / 1e6 if elapsed else 0.0,
+    }
+    print(
+        "{name:<18} {count:>7} {throughput:>10.1f}/s {p50_ms:>9.2f} "
+        "{p99_ms:>9.2f} {mb_per_s:>9.1f}".format(**result))
+    return result
+
+
+def bench_single(tratum_api, args) -> dict:
+    """Sequential process details."""
+    timer = Timer()
+    get_detail = timer.wrap(tratum_api.get_process_detail)
+    started_at = time.perf_counter()
+    for index in range(args.requests):
+        get_detail(make_process_number(index))
+    return report(
+        "single_detail", args.requests, time.perf_counter() - started_at,
+        timer.latencies)
+
+
+def bench_bulk_detail(tratum_api, args) -> dict:
+    """Process details fetched with a thread pool."""
+    timer = Timer()
+    get_detail = timer.wrap(tratum_api.get_process_detail)
+    process_numbers = (
+        make_process_number(index) for index in range(args.requests))
+    started_at = time.perf_counter()
+    for _, _, exception in bounded_map(
+            get_detail, process_numbers, max_workers=args.workers):
+        if exception is not None:
+            raise exception
+    return report(
+        "bulk_detail", args.requests, time.perf_counter() - started_at,
+        timer.latencies)
+
+
+def bench_bulk_monitor(tratum_api, args) -> dict:
+    """Bulk monitoring with `monitor_processes`."""
+    timer = Timer()
+    original = tratum_api.monitor_process
+    tratum_api.monitor_process = timer.wrap(original)
+    process_numbers = (
+        make_process_number(index) for index in range(args.requests))
+    started_at = time.perf_counter()
+    try:
+        results = list(tratum_api.monitor_processes(
+            process_numbers, max_workers=args.workers))
+    finally:
+        tratum_api.monitor_process = original
+    failed = sum(not result["success"] for result in results)
+    if failed:
+        print("bulk_monitor: {} failed".format(failed))
+    return report(
+        "bulk_monitor", args.requests, time.perf_counter() - started_at,
+        timer.latencies)
+
+
+def bench_journal_monitor(tratum_api, args) -> dict:
+    """Bulk monitoring recorded at an on-disk job journal."""
+    timer = Timer()
+    original = tratum_api.monitor_process
+    tratum_api.monitor_process = timer.wrap(original)
+    process_numbers = (
+        make_process_number(index) for index in range(args.requests))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        journal = JobJournal(os.path.join(tmp_dir, "jobs.sqlite3"))
+        runner = JobRunner(tratum_api, journal, max_workers=args.workers)
+        started_at = time.perf_counter()
+        try:
+            runner.create("bench", "monitor", process_numbers)
+            counts = runner.run("bench")
+        finally:
+            tratum_api.monitor_process = original
+            journal.close()
+        elapsed = time.perf_counter() - started_at
+    if counts["failed"]:
+        print("journal_monitor: {} failed".format(counts["failed"]))
+    return report(
+        "journal_monitor", args.requests, elapsed, timer.latencies)
+
+
+def bench_download(tratum_api, args) -> dict:
+    """Sequential streamed downloads to memory."""
+    timer = Timer()
+    save = timer.wrap(tratum_api.save_process_document)
+    count = max(1, args.requests // 10)
+    nbytes = 0
+    started_at = time.perf_counter()
+    for index in range(count):
+        buffer = io.BytesIO()
+        result = save("Processos/401/1/doc-{}.pdf".format(index), buffer)
+        nbytes += result["size"]
+    return report(
+        "download", count, time.perf_counter() - started_at,
+        timer.latencies, nbytes)
+
+
+def bench_download_process(tratum_api, args) -> dict:
+    """Parallel download of every document of processes to disk."""
+    count = max(1, args.requests // 50)
+    timer = Timer()
+    nbytes = 0
+    documents = 0
+    with tempfile.TemporaryDirectory() as dest_dir:
+        started_at = time.perf_counter()
+        for index in range(count):
+            document_started_at = time.perf_counter()
+            for result in tratum_api.download_process_documents(
+                    make_process_number(index), dest_dir,
+                    max_workers=args.workers):
+                if not result["success"]:
+                    raise RuntimeError(result["error"])
+                documents += 1
+                nbytes += result["size"]
+            timer.latencies.append(
+                time.perf_counter() - document_started_at)
+        elapsed = time.perf_counter() - started_at
+    return report(
+        "download_process", documents, elapsed, timer.latencies, nbytes)
+
+
+def bench_async_detail(args, server) -> dict:
+    """Process details fetched by the asyncio client."""
+    try:
+        import aiohttp  # NOQA: F401
+        from tratum_api.async_data import AsyncTratumAPI
+    except ImportError:
+        print("async_detail       skipped, aiohttp is not installed")
+        return None
+
+    latencies = []
+
+    async def fetch(tratum_api, process_number):
+        started_at = time.perf_counter()
+        await tratum_api.get_process_detail(process_number)
+        latencies.append(time.perf_counter() - started_at)
+
+    async def run():
+        async with AsyncTratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                max_concurrency=args.workers,
+                base_url=server.url) as tratum_api:
+            started_at = time.perf_counter()
+            await asyncio.gather(*[
+                fetch(tratum_api, make_process_number(index))
+                for index in range(args.requests)])
+            return time.perf_counter() - started_at
+
+    elapsed = asyncio.run(run())
+    return report("async_detail", args.requests, elapsed, latencies)
+
+
+SCENARIOS = {
+    "single_detail": bench_single,
+    "bulk_detail": bench_bulk_detail,
+    "bulk_monitor": bench_bulk_monitor,
+    "journal_monitor": bench_journal_monitor,
+    "download": bench_download,
+    "download_process": bench_download_process,
+}
+
+
+def main(argv: list = None) -> int:
+    """Run benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests of each scenario")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="parallel requests of bulk scenarios")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random latency added by server in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 503")
+    parser.add_argument("--detail-size", type=int, default=20_000,
+                        help="size of content_all at details in bytes")
+    parser.add_argument("--document-size", type=int, default=256_000,
+                        help="size of documents in bytes")
+    parser.add_argument("--scenarios", nargs="+",
+                        default=list(SCENARIOS) + ["async_detail"],
+                        choices=list(SCENARIOS) + ["async_detail"])
+    parser.add_argument("--json", help="save results to this JSON file")
+    args = parser.parse_args(argv)
+
+    server = MockTratumServer(
+        latency=args.latency, latency_jitter=args.jitter,
+        error_rate=args.error_rate, detail_size=args.detail_size,
+        document_size=args.document_size, seed=0)
+    results = []
+    with server:
+        tratum_api = TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            pool_maxsize=args.workers, base_url=server.url)
+        print("{:<18} {:>7} {:>12} {:>9} {:>9} {:>9}".format(
+            "scenario", "count", "throughput", "p50 ms", "p99 ms", "MB/s"))
+        for name in args.scenarios:
+            if name == "async_detail":
+                result = bench_async_detail(args, server)
+            else:
+                result = SCENARIOS[name](tratum_api, args)
+            if result is not None:
+                results.append(result)
+        requests_count = dict(server.requests)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({
+                "arguments": vars(args),
+                "results": results,
+                "server_requests": requests_count}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Micro-benchmark of JSON decoding of process detail payloads.
+
+Compares CPU time per response of `requests.Response.json()`, used by
+previous versions, with each installed decoder of `tratum_api.json_codec`
+decoding the body bytes, and reports gzip size and decompression cost.
+Recorded responses are read from a directory of `.json` files, otherwise
+payloads are generated by the mock server:
+
+    python benchmarks/bench_json.py --payloads recorded/ --repeat 200
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import time
+import argparse
+
+import requests
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tratum_api.json_codec import DECODERS  # NOQA: E402
+from tratum_api.mock_server import MockTratumServer  # NOQA: E402
+
+# Process number of generated payloads
+PROCESS_NUMBER = "19777928520247108243"
+
+
+def load_payloads(args) -> list:
+    """Recorded payloads or generated ones, as `(name, body)` tuples."""
+    if args.payloads:
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(args.payloads, "*.json"))):
+            with open(path, "rb") as file:
+                payloads.append((os.path.basename(path), file.read()))
+        if not payloads:
+            raise SystemExit(
+                "no .json files at {}".format(args.payloads))
+        return payloads
+
+    payloads = []
+    with MockTratumServer() as server:
+        for detail_size in args.detail_sizes:
+            server.detail_size = detail_size
+            body = json.dumps(
+                server.process_detail(PROCESS_NUMBER)).encode('utf-8')
+            payloads.append(
+                ("detail_{}k".format(detail_size // 1000), body))
+    return payloads
+
+
+def cpu_per_call(func, body: bytes, repeat: int) -> float:
+    """Mean CPU seconds of `func(body)`."""
+    func(body)
+    started_at = time.process_time()
+    for _ in range(repeat):
+        func(body)
+    return (time.process_time() - started_at) / repeat
+
+
+def requests_json(body: bytes):
+    """Decode as `requests.Response.json()`."""
+    response = requests.Response()
+    response._content = body
+    response.encoding = None
+    return response.json()
+
+
+def main(argv: list = None) -> int:
+    """Run benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payloads",
+                        help="directory with recorded .json responses")
+    parser.add_argument("--detail-sizes", type=int, nargs="+",
+                        default=[2_000, 20_000, 200_000, 2_000_000],
+                        help="content_all sizes of generated payloads")
+    parser.add_argument("--repeat", type=int, default=100,
+                        help="decodes of each payload")
+    parser.add_argument("--json", help="save results to this JSON file")
+    args = parser.parse_args(argv)
+
+    decoders = {"requests": requests_json}
+    decoders.update(
+        (name, loads) for name, loads in DECODERS.items()
+        if loads is not None)
+
+    print("{:<16} {:>10} {:>9} {:<10} {:>10} {:>8}".format(
+        "payload", "bytes", "gzip", "decoder", "us/decode", "speedup"))
+    results = []
+    for name, body in load_payloads(args):
+        compressed = gzip.compress(body, compresslevel=6)
+        # Large payloads are decoded less times to bound the run time
+        repeat = max(10, args.repeat * 20_000 // max(len(body), 20_000))
+        baseline = None
+        for decoder, loads in list(decoders.items()) + [
+                ("gunzip", gzip.decompress)]:
+            data = compressed if decoder == "gunzip" else body
+            seconds = cpu_per_call(loads, data, repeat)
+            if baseline is None:
+                baseline = seconds
+            # Decompression is reported as its own cost, not compared
+            speedup = None
+            if decoder != "gunzip" and seconds:
+                speedup = baseline / seconds
+            result = {
+                "payload": name,
+                "bytes": len(body),
+                "gzip_bytes": len(compressed),
+                "decoder": decoder,
+                "us_per_decode": seconds * 1e6,
+                "speedup": speedup,
+            }
+            results.append(result)
+            speedup_text = (
+                "-" if speedup is None else "{:.2f}x".format(speedup))
+            print(
+                "{payload:<16} {bytes:>10} {gzip_bytes:>9} {decoder:<10} "
+                "{us_per_decode:>10.1f} {speedup_text:>8}".format(
+                    speedup_text=speedup_text, **result))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"arguments": vars(args), "results": results},
+                      file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
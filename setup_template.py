@@ -36,6 +36,18 @@ setup(
     name='tratum-api',
     version='{VERSION}',
     install_requires=requirements,  # Uses parsed requirements.txt
+    extras_require={
+        "async": ["aiohttp"],
+        "numpy": ["numpy"],
+        "arrow": ["pyarrow"],
+        "orjson": ["orjson"],
+        "ujson": ["ujson"],
+        "prometheus": ["prometheus_client"],
+        "opentelemetry": ["opentelemetry-api"],
+    },
+    entry_points={
+        "console_scripts": ["tratum=tratum_api.cli:main"],
+    },
     include_package_data=True,
     license='BSD-3-Clause License',
     description='Python API for Tratum endpoints',
@@ -50,5 +62,5 @@ setup(
     ],
     package_dir={"": "src"},
     packages=find_packages(where="src"),
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
@@ -0,0 +1,669 @@
+"""Tratum Python API using asyncio."""
+import os
+import json
+import time
+import asyncio
+from tratum_api.auth import decode_jwt_expiry, token_refresh_time
+from tratum_api.circuit_breaker import CircuitBreakers
+from tratum_api.data import DEFAULT_BASE_URL, TratumAPI
+from tratum_api.instrumentation import RequestEvent, body_size, emit
+from tratum_api.json_codec import get_decoder
+from tratum_api.models import ProcessDetail
+from tratum_api.rate_limit import RateLimiter, parse_retry_after
+from tratum_api.retry import DEFAULT_RETRY_POLICIES
+from tratum_api.exceptions import (
+    TratumAPILoginError, TratumAPIProblemAPIException,
+    TratumAPIInvalidDocumentException, TratumAPICircuitOpenException)
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+
+
+def _attempt_timeout(timeout: "aiohttp.ClientTimeout",
+                     remaining: float) -> "aiohttp.ClientTimeout":
+    """Timeout with total limited to `remaining` seconds."""
+    total = remaining
+    if timeout.total is not None:
+        total = min(timeout.total, remaining)
+    return aiohttp.ClientTimeout(
+        total=total, connect=timeout.connect,
+        sock_read=timeout.sock_read, sock_connect=timeout.sock_connect)
+
+
+class AsyncTratumAPI:
+    """Asyncio Tratum API to help comunication with end-points.
+
+    All requests share the same `aiohttp.ClientSession` and its connection
+    pool, the number of requests in flight is limited by
+    `max_concurrency`. Use it as an async context manager to login and
+    release the connections at the end:
+
+        async with AsyncTratumAPI(...) as tratum_api:
+            await tratum_api.get_process_detail(process_number)
+    """
+
+    def __init__(self, tratum_email: str, tratum_password: str,
+                 organization_id: int, holder_id: int, cnpj: str,
+                 proxy: str = None, session=None,
+                 max_connections: int = 100,
+                 max_connections_per_host: int = 0,
+                 max_concurrency: int = 100,
+                 token_refresh_margin: float = 60,
+                 connect_timeout: float = 10, read_timeout: float = 60,
+                 rate_limiter: RateLimiter = None,
+                 retry_policies: dict = None,
+                 base_url: str = None, hooks: list = None,
+                 json_decoder=None,
+                 circuit_breakers: CircuitBreakers = None):
+        """__init__.
+
+        Args:
+            tratum_email (str):
+                E-mail for Tratum API.
+            tratum_password (str):
+                Password for Tratum API.
+            organization_id (int):
+                Organization ID in Tratum API.
+            holder_id (int):
+                Holder ID in Tratum API.
+            cnpj (str):
+                Organization document.
+            proxy (str): = None
+                Proxy server for end-point calls.
+            session (aiohttp.ClientSession): = None
+                Session to be used on requests, it makes possible to share
+                the same connection pool between clients. If None a new
+                session will be created on first request and closed at
+                `close`.
+            max_connections (int): = 100
+                Total number of connections in the pool, used only if
+                session is not informed. 0 means no limit.
+            max_connections_per_host (int): = 0
+                Number of connections to the same host in the pool, used
+                only if session is not informed. 0 means no limit.
+            max_concurrency (int): = 100
+                Maximum number of requests in flight for this client.
+            token_refresh_margin (float): = 60
+                Seconds before token expiry to login again.
+            connect_timeout (float): = 10
+                Seconds to wait for a connection on every request.
+            read_timeout (float): = 60
+                Seconds to wait for data from server on every request.
+            rate_limiter (RateLimiter): = None
+                Rate limits and adaptive concurrency applied to requests,
+                it may be shared with other clients, sync or async.
+            retry_policies (dict): = None
+                `RetryPolicy` for each end-point name, end-points without
+                policy are not retried. If None `DEFAULT_RETRY_POLICIES`
+                is used.
+            base_url (str): = None
+                Base URL of Tratum API, useful for tests against a local
+                server. If None `TRATUM_API_BASE_URL` environment variable
+                is used, defaulting to `DEFAULT_BASE_URL`.
+            hooks (list): = None
+                Callables receiving a `RequestEvent` at the end of each
+                call to an end-point, see `tratum_api.instrumentation`.
+            json_decoder (str | Callable): = None
+                Decoder of response bodies, `orjson`, `ujson`, `json` or a
+                function receiving bytes. If None the fastest installed
+                decoder is used.
+            circuit_breakers (CircuitBreakers): = None
+                Circuit breaker of each end-point, requests to end-points
+                with open circuit fail at once with
+                `TratumAPICircuitOpenException`. It may be shared with
+                other clients, sync or async.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "aiohttp is necessary to use AsyncTratumAPI, install it "
+                "with `pip install tratum-api[async]`")
+
+        if base_url is None:
+            base_url = os.getenv('TRATUM_API_BASE_URL', DEFAULT_BASE_URL)
+        self.base_url = base_url.rstrip('/')
+        if proxy is None:
+            proxy = os.getenv('TRATUM_API_PROXY')
+        self._proxy = proxy
+
+        # Session is created on first request to be attached to the
+        # running event loop
+        self.session = session
+        self._owns_session = session is None
+        self._max_connections = max_connections
+        self._max_connections_per_host = max_connections_per_host
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        self.rate_limiter = rate_limiter
+        self.circuit_breakers = circuit_breakers
+        if retry_policies is None:
+            retry_policies = DEFAULT_RETRY_POLICIES
+        self.retry_policies = retry_policies
+        self.hooks = list(hooks or [])
+        self.json_loads = get_decoder(json_decoder)
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=connect_timeout, sock_read=read_timeout)
+
+        # Set global variables
+        self.organization_id = organization_id
+        self.holder_id = holder_id
+        self.cnpj = cnpj
+
+        # Store credentials if token is expired
+        self._tratum_email = tratum_email
+        self._tratum_password = tratum_password
+        self.token = None
+        self.token_expires_at = None
+        self._token_refresh_at = None
+        self._token_refresh_margin = token_refresh_margin
+        self._token_lock = None
+
+    async def __aenter__(self):
+        """__aenter__."""
+        try:
+            await self.login()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """__aexit__."""
+        await self.close()
+
+    async def close(self):
+        """Close the session if it was created by the client."""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        """Return session creating it if necessary."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self._max_connections,
+                limit_per_host=self._max_connections_per_host)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _get_semaphore(self):
+        """Return semaphore limiting requests in flight."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+
+    def _is_token_expiring(self) -> bool:
+        """Check if token is missing or close to expire."""
+        if self.token is None:
+            return True
+        if self._token_refresh_at is None:
+            return False
+        return time.time() >= self._token_refresh_at
+
+    async def _refresh_token(self, stale_token: str = None) -> str:
+        """Login again if token was not already refreshed by other task.
+
+        Args:
+            stale_token (str): = None
+                Token that was found expired or rejected by the API.
+
+        Returns:
+            str: Valid token.
+        """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self.token == stale_token or self._is_token_expiring():
+                await self.login()
+            return self.token
+
+    async def _get_token(self) -> str:
+        """Return token refreshing it ahead of expiry."""
+        token = self.token
+        if self._is_token_expiring():
+            token = await self._refresh_token(token)
+        return token
+
+    async def _send(self, endpoint: str, method: str, url: str,
+                    event: RequestEvent = None, **kwargs):
+        """Make a request and read the response body.
+
+        Body is read before releasing the connection to the pool and kept
+        at `response.body`, since released responses can not be read. If
+        `event` is informed, timings and sizes of the attempt are added to
+        it. Requests to end-points with open circuit breaker raise
+        `TratumAPICircuitOpenException` without waiting for a slot.
+        """
+        breakers = self.circuit_breakers
+        if breakers is not None:
+            breakers.acquire(endpoint)
+        # Half-open probe is released on exits without outcome, such as
+        # cancellation, otherwise the circuit would never close
+        recorded = False
+        try:
+            session = self._get_session()
+            kwargs.setdefault('timeout', self.timeout)
+            if event is not None:
+                queued_at = time.perf_counter()
+            async with self._get_semaphore():
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire_async(endpoint)
+                if event is not None:
+                    sent_at = time.perf_counter()
+                    event.queue_time += sent_at - queued_at
+                    event.attempts += 1
+                    event.bytes_sent += body_size(kwargs.get('data'))
+                    if kwargs.get('json') is not None:
+                        event.bytes_sent += body_size(
+                            json.dumps(kwargs['json']))
+                started_at = time.monotonic()
+                response = None
+                try:
+                    try:
+                        async with session.request(
+                                method, url, proxy=self._proxy,
+                                **kwargs) as received:
+                            if event is not None:
+                                headers_at = time.perf_counter()
+                            received.body = await received.read()
+                        response = received
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        if breakers is not None:
+                            breakers.record(
+                                endpoint, failed=True,
+                                duration=time.monotonic() - started_at)
+                            recorded = True
+                        if event is not None:
+                            event.error = e.__class__.__name__
+                        raise
+                    if event is not None:
+                        event.response_time += headers_at - sent_at
+                        event.transfer_time += (
+                            time.perf_counter() - headers_at)
+                        event.bytes_received += len(response.body)
+                        event.status_code = response.status
+                        event.error = None
+                    if breakers is not None:
+                        breakers.record(
+                            endpoint, status_code=response.status,
+                            duration=time.monotonic() - started_at)
+                        recorded = True
+                finally:
+                    # Slot is released even if the task is cancelled,
+                    # otherwise the concurrency limit shrinks with each
+                    # cancellation
+                    if self.rate_limiter is not None:
+                        if response is None:
+                            self.rate_limiter.release(endpoint, failed=True)
+                        else:
+                            self.rate_limiter.release(
+                                endpoint, status_code=response.status,
+                                retry_after=parse_retry_after(
+                                    response.headers.get('Retry-After')))
+        finally:
+            if breakers is not None and not recorded:
+                breakers.release(endpoint)
+        return response
+
+    async def _send_authenticated(self, endpoint: str, method: str,
+                                  url: str, event: RequestEvent = None,
+                                  **kwargs):
+        """Send request with token, login again once on status 401."""
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = await self._get_token()
+        headers['Authorization'] = 'Bearer {token}'.format(token=token)
+        response = await self._send(
+            endpoint, method, url, event=event, headers=headers, **kwargs)
+        if response.status == 401:
+            token = await self._refresh_token(token)
+            headers['Authorization'] = 'Bearer {token}'.format(token=token)
+            response = await self._send(
+                endpoint, method, url, event=event, headers=headers,
+                **kwargs)
+        return response
+
+    async def _request(self, endpoint: str, method: str, url: str,
+                       authenticate: bool = True, parse_json: bool = False,
+                       **kwargs):
+        """Make a request to Tratum API.
+
+        Authenticated requests that receive status 401 are retried once
+        after a new login. Connection errors, timeouts and status codes
+        are retried following the end-point retry policy, the number of
+        retries is set at `response.retries`. If client has hooks they
+        receive a `RequestEvent` when the call finishes.
+
+        Args:
+            endpoint (str):
+                Name of the end-point, one of `ENDPOINTS`.
+            method (str):
+                HTTP method.
+            url (str):
+                URL of the request.
+            authenticate (bool): = True
+                If Authorization header must be added to request.
+            parse_json (bool): = False
+                Decode JSON body of the final response once, use `_json`
+                to get it.
+            **kwargs:
+                Other arguments passed to `aiohttp.ClientSession.request`.
+
+        Returns:
+            aiohttp.ClientResponse: Response with body at `response.body`.
+
+        Raises:
+            TratumAPIProblemAPIException:
+                Raise error if connection fails after all retries.
+            TratumAPICircuitOpenException:
+                Raise error without sending the request if the end-point
+                circuit breaker is open.
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        send = self._send_authenticated if authenticate else self._send
+        policy = self.retry_policies.get(endpoint)
+        event = None
+        if self.hooks:
+            event = RequestEvent(endpoint, method=method, url=str(url))
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            if policy is not None:
+                kwargs['timeout'] = _attempt_timeout(
+                    timeout, policy.remaining(started_at))
+            else:
+                kwargs['timeout'] = timeout
+            try:
+                response = await send(
+                    endpoint, method, url, event=event, **kwargs)
+            except TratumAPICircuitOpenException:
+                if event is not None:
+                    event.error = "CircuitOpen"
+                    emit(self.hooks, event)
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = None
+                if policy is not None and policy.should_retry_exception(e):
+                    delay = policy.next_delay(attempt, started_at)
+                if delay is None:
+                    msg = (
+                        "Error when connecting to Tratum API end-point "
+                        "[{endpoint}]: {error}").format(
+                        endpoint=endpoint, error=e.__class__.__name__)
+                    if event is not None:
+                        emit(self.hooks, event)
+                    raise TratumAPIProblemAPIException(
+                        message=msg, payload={
+                            "endpoint": endpoint,
+                            "error": repr(e),
+                            "retries": attempt - 1})
+                if event is not None:
+                    event.backoff_time += delay
+                await asyncio.sleep(delay)
+                continue
+
+            if policy is not None and \
+                    policy.should_retry_status(response.status):
+                delay = policy.next_delay(
+                    attempt, started_at, retry_after=parse_retry_after(
+                        response.headers.get('Retry-After')))
+                if delay is not None:
+                    if event is not None:
+                        event.backoff_time += delay
+                    await asyncio.sleep(delay)
+                    continue
+            response.retries = attempt - 1
+            if parse_json:
+                self._parse_json(response, event)
+            if event is not None:
+                emit(self.hooks, event)
+            return response
+
+    def _parse_json(self, response, event: RequestEvent = None):
+        """Decode JSON body keeping errors to be raised by `_json`."""
+        if event is not None:
+            parse_started_at = time.perf_counter()
+        try:
+            response.json_data = self.json_loads(response.body)
+            response.json_error = None
+        except ValueError as e:
+            response.json_data = None
+            response.json_error = e
+        if event is not None:
+            event.parse_time += time.perf_counter() - parse_started_at
+
+    def _json(self, response):
+        """Return JSON body decoded by `_request`.
+
+        Raises the decoding error if body is not a valid JSON, responses
+        not parsed by `_request` are decoded now.
+        """
+        if not hasattr(response, 'json_data'):
+            self._parse_json(response)
+        if response.json_error is not None:
+            raise response.json_error
+        return response.json_data
+
+    async def login(self):
+        """Login at Tratum API.
+
+        Uses attributes `_tratum_email` and `_tratum_password` to login
+        at Tratum and retrive token.
+        """
+        url = self.base_url + "/v1/login"
+        headers = {
+            "Content-Type": "application/json"
+        }
+        data = {
+            "email": self._tratum_email,
+            "password": self._tratum_password}
+
+        response = await self._request(
+            "login", "POST", url, authenticate=False, parse_json=True,
+            headers=headers, json=data)
+        if response.status >= 400:
+            status_code = response.status
+            response_text = response.body.decode(response.get_encoding())
+            msg = (
+                "Error when loggin to TratumAPI.\n"
+                "status_code: [{status_code}]").format(status_code=status_code)
+            raise TratumAPILoginError(
+                msg, payload={
+                    "status_code": status_code,
+                    "retries": response.retries,
+                    "response_payload": response_text})
+        self.token = self._json(response)['token']
+        self.token_expires_at = decode_jwt_expiry(self.token)
+        self._token_refresh_at = token_refresh_time(
+            self.token_expires_at, self._token_refresh_margin)
+        return True
+
+    # Validation does not depend on the client state
+    is__process_number__valid = TratumAPI.is__process_number__valid
+
+    async def monitor_process(self, process_number: str):
+        """Send process to monitoring.
+
+        Args:
+            process_number (str):
+                Process document.
+        """
+        url = (
+            self.base_url + "/v2/importProcess/" +
+            "{organization_id}/{process_number}/?document={cnpj}").format(
+            organization_id=self.organization_id,
+            process_number=process_number,
+            cnpj=self.cnpj)
+        response = await self._request(
+            "import_process", "POST", url, parse_json=True, json={})
+        response_json = self._json(response)
+        if response.status >= 400:
+            obs = response_json.get('obs', "")
+            msg = (
+                "Error related to internal problems in APIs "
+                "or services. Tratum message [{obs}]").format(obs=obs)
+            raise TratumAPIProblemAPIException(
+                message=msg, payload={
+                    "process_number": process_number,
+                    "status_code": response.status,
+                    "retries": response.retries,
+                    "response_payload": response_json})
+
+        # Invalid and other errors at processing are returned with status
+        # 200 at the API, but are results of errors. It is necessary to
+        # treat using the payload
+        is_status_ok = (
+            response_json.get('status', None)
+            not in ['sucess', 'processing'])
+        if is_status_ok:
+            obs = response_json.get('obs', "")
+            msg = (
+                "Error related to internal problems in APIs "
+                "or services. Tratum message:\n[{obs}]").format(obs=obs)
+            raise TratumAPIProblemAPIException(
+                message=msg, payload={
+                    "process_number": process_number,
+                    "status_code": response.status,
+                    "retries": response.retries,
+                    "response_payload": response_json})
+
+        # Get if process is INVALID
+        is_process_invalid = (
+            response_json.get('process', {}).get('status', None) == 'INVALID')
+        if is_process_invalid:
+            msg = "Invalid process number"
+            raise TratumAPIInvalidDocumentException(
+                message=msg, payload={
+                    "process_number": process_number,
+                    "response_payload": response_json
+                })
+        return response_json
+
+    async def remove_monitor_process(self, process_number: str) -> bool:
+        """Remove process from monitoring.
+
+        Args:
+            process_number (str):
+                Process document.
+
+        Returns:
+            bool: True if operation had success, otherwise false.
+
+        Raises:
+            TratumAPIProblemAPIException:
+                Raise error if get forbiden status.
+        """
+        url = (
+            self.base_url + "/v1/organization/" +
+            "{organization_id}/process/{process_number}/INACTIVE").format(
+            organization_id=self.organization_id,
+            process_number=process_number)
+        response = await self._request(
+            "remove_monitor", "PUT", url, parse_json=True, json={})
+        response_json = self._json(response)
+        if response.status >= 400:
+            obs = response_json.get('obs', "")
+            msg = (
+                "Error related to internal problems in APIs "
+                "or services. Tratum message [{obs}]").format(obs=obs)
+            raise TratumAPIProblemAPIException(
+                message=msg, payload={
+                    "process_number": process_number,
+                    "status_code": response.status,
+                    "retries": response.retries,
+                    "response_payload": response_json})
+        return response_json.get("sucess")
+
+    async def get_process_detail(self, process_number: str,
+                                 as_model: bool = False):
+        """Fetch process details in Tratum API.
+
+        Args:
+            process_number (str):
+                Process document.
+            as_model (bool): = False
+                Return a `ProcessDetail` instead of a dictionary.
+        """
+        url = (
+            self.base_url + "/v1/" +
+            "process/{organization_id}/{process_number}").format(
+            organization_id=self.organization_id,
+            process_number=process_number,
+        )
+        response = await self._request(
+            "process_detail", "GET", url, parse_json=True)
+        response_json = self._json(response)
+        if response.status != 200:
+            raise TratumAPIProblemAPIException(
+                message="error related to internal problems in APIs "
+                        "or services.",
+                payload={
+                    "status_code": response.status,
+                    "status_description": response_json.get('status', None),
+                    "retries": response.retries,
+                }
+            )
+        elif not self.is__process_number__valid(process_number):
+            raise TratumAPIInvalidDocumentException(
+                message="invalid process number",
+                payload={
+                    "process_number": process_number,
+                }
+            )
+        elif as_model:
+            return ProcessDetail(response_json)
+        else:
+            return response_json
+
+    async def get_process_document_url(self, document_url: str) -> str:
+        """Get a authenticated url to download the document.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+
+        Returns:
+            Return the AWS S3 authenticated URL.
+        """
+        url = self.base_url + "/v1/url?page={document_url}"\
+            .format(document_url=document_url)
+        response = await self._request("document_url", "GET", url)
+        if response.status >= 400:
+            raise TratumAPIProblemAPIException(
+                message="error related to internal problems in APIs "
+                        "or services.",
+                payload={
+                    "status_code": response.status,
+                    "retries": response.retries,
+                }
+            )
+        return response.body.decode(response.get_encoding())
+
+    async def download_process_document(self, document_url: str) -> bytes:
+        """Download pdf file from process.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+
+        Returns:
+            Return the content of the document at the URL.
+        """
+        authenticated_url = await self.get_process_document_url(
+            document_url=document_url)
+        # Signed URL must not be re-encoded or the signature is broken
+        response = await self._request(
+            "document_download", "GET", URL(authenticated_url, encoded=True),
+            authenticate=False)
+        if response.status >= 400:
+            msg = (
+                "Error when downloading file from AWS. Status code: "
+                "[{status_code}]").format(status_code=response.status)
+            raise TratumAPIProblemAPIException(
+                message=msg,
+                payload={
+                    "status_code": response.status,
+                    "retries": response.retries})
+        return response.body
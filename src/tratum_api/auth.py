@@ -0,0 +1,51 @@
+"""Helpers to manage Tratum API authentication tokens."""
+import json
+import base64
+import binascii
+import time
+
+
+def decode_jwt_expiry(token: str) -> float:
+    """Read expiry time of a JWT token.
+
+    The signature is not verified, the token is only decoded to know when
+    it must be refreshed.
+
+    Args:
+        token (str):
+            JWT token returned by login end-point.
+
+    Returns:
+        float: Expiry time as unix timestamp, None if token is not a JWT
+        or does not have the `exp` claim.
+    """
+    try:
+        payload = token.split('.')[1]
+        # JWT uses base64url without padding
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError,
+            binascii.Error):
+        return None
+
+
+def token_refresh_time(expires_at: float, margin: float) -> float:
+    """Compute when a token must be refreshed.
+
+    Margin is limited to half of the remaining token lifetime, so short
+    lived tokens are not refreshed on every request.
+
+    Args:
+        expires_at (float):
+            Expiry time as unix timestamp.
+        margin (float):
+            Seconds before expiry to refresh the token.
+
+    Returns:
+        float: Refresh time as unix timestamp, None if expiry is unknown.
+    """
+    if expires_at is None:
+        return None
+    lifetime = expires_at - time.time()
+    return expires_at - min(margin, max(lifetime, 0) / 2)
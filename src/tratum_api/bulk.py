@@ -0,0 +1,69 @@
+"""Helpers to run Tratum API calls in bulk."""
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Iterator
+from tratum_api.exceptions import TratumAPIException
+
+
+def exception_to_dict(exception: Exception) -> dict:
+    """Convert an exception to the same format of `TratumAPIException`.
+
+    Args:
+        exception (Exception):
+            Exception raised when processing an item.
+
+    Returns:
+        dict: Dictionary with `payload`, `type` and `message` keys.
+    """
+    if isinstance(exception, TratumAPIException):
+        return exception.to_dict()
+    return {
+        "payload": {},
+        "type": exception.__class__.__name__,
+        "message": str(exception)}
+
+
+def bounded_map(func: Callable, items: Iterable, max_workers: int = 10,
+                max_pending: int = None) -> Iterator[tuple]:
+    """Apply `func` over `items` using a thread pool.
+
+    Items are consumed lazily from the iterable, at most `max_pending`
+    calls are submitted to the pool at the same time so memory does not
+    grow with the number of items. Results are yielded as they complete,
+    not in the input order.
+
+    Args:
+        func (Callable):
+            Function to be called with each item.
+        items (Iterable):
+            Items to be processed.
+        max_workers (int): = 10
+            Number of threads in the pool.
+        max_pending (int): = None
+            Maximum number of submitted calls not yet yielded. If None
+            `2 * max_workers` is used.
+
+    Returns:
+        Iterator of tuples `(item, result, exception)`, exception is None
+        if the call succeeded, otherwise result is None.
+    """
+    if max_pending is None:
+        max_pending = 2 * max_workers
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for item in itertools.islice(items, max_pending):
+            pending[executor.submit(func, item)] = item
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                exception = future.exception()
+                if exception is None:
+                    yield item, future.result(), None
+                else:
+                    yield item, None, exception
+
+            for item in itertools.islice(items, len(done)):
+                pending[executor.submit(func, item)] = item
@@ -0,0 +1,500 @@
+"""Caches for Tratum API responses."""
+import time
+import sqlite3
+import calendar
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from tratum_api.json_codec import dumps, get_decoder
+
+# Fastest installed decoder, cached details are decoded at every hit
+_loads = get_decoder()
+
+
+class CacheEntry:
+    """Cached process detail and validators used to revalidate it."""
+
+    __slots__ = (
+        "value", "stored_at", "last_update", "etag", "last_modified")
+
+    def __init__(self, value: bytes, stored_at: float,
+                 last_update: str = None, etag: str = None,
+                 last_modified: str = None):
+        """__init__.
+
+        Args:
+            value (bytes):
+                Process detail serialized as JSON.
+            stored_at (float):
+                Unix timestamp when entry was stored or revalidated.
+            last_update (str): = None
+                `last_update` field of the process detail.
+            etag (str): = None
+                ETag header returned with the detail.
+            last_modified (str): = None
+                Last-Modified header returned with the detail.
+        """
+        self.value = value
+        self.stored_at = stored_at
+        self.last_update = last_update
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def size(self) -> int:
+        """Approximated size of the entry in bytes."""
+        return len(self.value)
+
+    def detail(self) -> dict:
+        """Return a new dictionary with the cached process detail."""
+        return _loads(self.value)
+
+    def conditional_headers(self) -> dict:
+        """Headers to revalidate the entry with the server."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache bounded by size of the stored entries."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """__init__.
+
+        Args:
+            max_bytes (int): = 64 MB
+                Maximum total size of the cached entries.
+        """
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry:
+        """Get entry marking it as recently used, None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        """Store entry evicting least recently used ones if necessary."""
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= old_entry.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def delete(self, key: str):
+        """Remove entry from cache."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def clear(self):
+        """Remove all entries from cache."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        """__len__."""
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Total size of cached entries in bytes."""
+        return self._size
+
+
+class SQLiteCacheBackend:
+    """On-disk LRU cache stored at a SQLite database.
+
+    It persists across process restarts and can be shared by the
+    processes of the same host. Total size of the entries is kept at a
+    metadata row updated in the same transaction as the entries, so
+    writes do not scan the table.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024):
+        """__init__.
+
+        Args:
+            path (str):
+                Path of the SQLite database file.
+            max_bytes (int): = 1 GB
+                Maximum total size of the cached entries.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS process_detail_cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " size INTEGER NOT NULL, stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL, last_update TEXT, etag TEXT,"
+            " last_modified TEXT)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS process_detail_cache_accessed_at "
+            "ON process_detail_cache (accessed_at)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS process_detail_cache_meta ("
+            " name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Databases created before the metadata row have their size
+        # computed once
+        self._connection.execute(
+            "INSERT OR IGNORE INTO process_detail_cache_meta (name, value) "
+            "SELECT 'size', COALESCE(SUM(size), 0) FROM process_detail_cache")
+
+    def _transaction(self, func, *args):
+        """Call `func` inside a write transaction, lock held."""
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        return result
+
+    def _add_size(self, delta: int) -> int:
+        """Add `delta` to the total size returning it, in transaction."""
+        if delta:
+            self._connection.execute(
+                "UPDATE process_detail_cache_meta SET value = value + ? "
+                "WHERE name = 'size'", (delta, ))
+        return self._connection.execute(
+            "SELECT value FROM process_detail_cache_meta "
+            "WHERE name = 'size'").fetchone()[0]
+
+    def _delete(self, key: str) -> int:
+        """Remove entry returning the total size, in transaction."""
+        row = self._connection.execute(
+            "SELECT size FROM process_detail_cache WHERE key = ?", (key, )
+        ).fetchone()
+        if row is None:
+            return self._add_size(0)
+        self._connection.execute(
+            "DELETE FROM process_detail_cache WHERE key = ?", (key, ))
+        return self._add_size(-row[0])
+
+    def get(self, key: str) -> CacheEntry:
+        """Get entry marking it as recently used, None if not cached."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at, last_update, etag, last_modified "
+                "FROM process_detail_cache WHERE key = ?", (key, )
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE process_detail_cache SET accessed_at = ? "
+                "WHERE key = ?", (time.time(), key))
+        return CacheEntry(*row)
+
+    def set(self, key: str, entry: CacheEntry):
+        """Store entry evicting least recently used ones if necessary."""
+        with self._lock:
+            self._transaction(self._set, key, entry)
+
+    def _set(self, key: str, entry: CacheEntry):
+        """Store entry and evict, in transaction."""
+        total_size = self._delete(key)
+        if entry.size > self.max_bytes:
+            return
+        self._connection.execute(
+            "INSERT INTO process_detail_cache "
+            "(key, value, size, stored_at, accessed_at, last_update, "
+            " etag, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+                key, entry.value, entry.size, entry.stored_at,
+                time.time(), entry.last_update, entry.etag,
+                entry.last_modified))
+        total_size = self._add_size(entry.size)
+        if total_size > self.max_bytes:
+            self._evict(total_size)
+
+    def _evict(self, total_size: int):
+        """Remove least recently used entries above `max_bytes`."""
+        rows = self._connection.execute(
+            "SELECT key, size FROM process_detail_cache "
+            "ORDER BY accessed_at")
+        evict_keys = []
+        evicted_size = 0
+        for key, size in rows:
+            if total_size - evicted_size <= self.max_bytes:
+                break
+            evict_keys.append((key, ))
+            evicted_size += size
+        self._connection.executemany(
+            "DELETE FROM process_detail_cache WHERE key = ?", evict_keys)
+        self._add_size(-evicted_size)
+        self.evictions += len(evict_keys)
+
+    def delete(self, key: str):
+        """Remove entry from cache."""
+        with self._lock:
+            self._transaction(self._delete, key)
+
+    def clear(self):
+        """Remove all entries from cache."""
+        with self._lock:
+            self._transaction(self._clear)
+
+    def _clear(self):
+        """Remove all entries, in transaction."""
+        self._connection.execute("DELETE FROM process_detail_cache")
+        self._connection.execute(
+            "UPDATE process_detail_cache_meta SET value = 0 "
+            "WHERE name = 'size'")
+
+    @property
+    def size(self) -> int:
+        """Total size of cached entries in bytes."""
+        with self._lock:
+            return self._add_size(0)
+
+    def __len__(self):
+        """__len__."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM process_detail_cache").fetchone()[0]
+
+    def close(self):
+        """Close database connection."""
+        self._connection.close()
+
+
+class ProcessDetailCache:
+    """Cache of process details keyed by organization and process number.
+
+    Entries are fresh during `ttl` seconds, after that they are
+    revalidated with the server using ETag/Last-Modified when the API
+    returns them.
+    """
+
+    def __init__(self, backend=None, ttl: float = 300):
+        """__init__.
+
+        Args:
+            backend (MemoryCacheBackend | SQLiteCacheBackend): = None
+                Storage of the entries, if None a `MemoryCacheBackend`
+                with default size is used.
+            ttl (float): = 300
+                Seconds an entry is used without going to the API.
+        """
+        if backend is None:
+            backend = MemoryCacheBackend()
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(organization_id, process_number: str) -> str:
+        return "{organization_id}/{process_number}".format(
+            organization_id=organization_id, process_number=process_number)
+
+    def lookup(self, organization_id, process_number: str,
+               last_update: str = None, revalidate: bool = False) -> tuple:
+        """Look for a cached process detail.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            process_number (str):
+                Process document.
+            last_update (str): = None
+                If informed the entry is considered fresh only if its
+                `last_update` is equal to this value.
+            revalidate (bool): = False
+                Consider the entry stale even inside the TTL, so it is
+                revalidated with a conditional request.
+
+        Returns:
+            tuple: `(entry, is_fresh)`, entry is None if process is not
+            cached, stale entries are returned to be revalidated.
+        """
+        entry = self.backend.get(self._key(organization_id, process_number))
+        is_fresh = (
+            entry is not None and not revalidate and
+            time.time() - entry.stored_at < self.ttl and
+            (last_update is None or entry.last_update == last_update))
+        with self._lock:
+            if is_fresh:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry, is_fresh
+
+    def store(self, organization_id, process_number: str, detail: dict,
+              etag: str = None, last_modified: str = None) -> CacheEntry:
+        """Store process detail at the cache.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            process_number (str):
+                Process document.
+            detail (dict):
+                Process detail returned by the API.
+            etag (str): = None
+                ETag header returned with the detail.
+            last_modified (str): = None
+                Last-Modified header returned with the detail.
+
+        Returns:
+            CacheEntry: Stored entry.
+        """
+        value = dumps(detail)
+        entry = CacheEntry(
+            value=value, stored_at=time.time(),
+            last_update=detail.get('last_update'), etag=etag,
+            last_modified=last_modified)
+        self.backend.set(self._key(organization_id, process_number), entry)
+        return entry
+
+    def revalidated(self, organization_id, process_number: str,
+                    entry: CacheEntry):
+        """Mark a stale entry as fresh after server returned 304."""
+        entry.stored_at = time.time()
+        self.backend.set(self._key(organization_id, process_number), entry)
+        with self._lock:
+            self.revalidations += 1
+
+    def invalidate(self, organization_id, process_number: str):
+        """Remove process detail from the cache."""
+        self.backend.delete(self._key(organization_id, process_number))
+
+    def stats(self) -> dict:
+        """Counters to help sizing the cache.
+
+        Returns:
+            dict: Number of `hits`, `misses`, `revalidations`, `evictions`
+            and cached `entries`.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend)}
+
+
+def signed_url_expiry(signed_url: str) -> float:
+    """Read expiry time of a presigned S3 URL.
+
+    Supports signature version 4 (`X-Amz-Date` and `X-Amz-Expires`) and
+    version 2 (`Expires`) query strings.
+
+    Args:
+        signed_url (str):
+            Presigned URL returned by `get_process_document_url`.
+
+    Returns:
+        float: Expiry time as unix timestamp, None if it is not possible
+        to find it at the URL.
+    """
+    query = parse_qs(urlsplit(signed_url).query)
+    try:
+        if "X-Amz-Date" in query and "X-Amz-Expires" in query:
+            signed_at = calendar.timegm(time.strptime(
+                query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ"))
+            return signed_at + int(query["X-Amz-Expires"][0])
+        if "Expires" in query:
+            return float(query["Expires"][0])
+    except ValueError:
+        return None
+    return None
+
+
+class SignedURLCache:
+    """Cache of presigned S3 URLs keyed by document URL.
+
+    URLs are reused until `refresh_margin` seconds before they expire,
+    URLs without a known expiry are not cached.
+    """
+
+    def __init__(self, refresh_margin: float = 60,
+                 max_entries: int = 10000):
+        """__init__.
+
+        Args:
+            refresh_margin (float): = 60
+                Seconds before expiry to stop using the URL, it must be
+                enough to finish the download.
+            max_entries (int): = 10000
+                Maximum number of cached URLs, least recently used are
+                evicted.
+        """
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document_url: str) -> str:
+        """Get a valid presigned URL, None if not cached or expiring."""
+        with self._lock:
+            entry = self._entries.get(document_url)
+            if entry is not None:
+                signed_url, expires_at = entry
+                if time.time() < expires_at - self.refresh_margin:
+                    self._entries.move_to_end(document_url)
+                    self.hits += 1
+                    return signed_url
+                del self._entries[document_url]
+            self.misses += 1
+            return None
+
+    def set(self, document_url: str, signed_url: str):
+        """Store presigned URL if its expiry is known."""
+        expires_at = signed_url_expiry(signed_url)
+        if expires_at is None:
+            return
+        with self._lock:
+            self._entries[document_url] = (signed_url, expires_at)
+            self._entries.move_to_end(document_url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, document_url: str):
+        """Remove presigned URL from the cache."""
+        with self._lock:
+            self._entries.pop(document_url, None)
+
+    def stats(self) -> dict:
+        """Counters of cache usage.
+
+        Returns:
+            dict: Number of `hits`, `misses`, `evictions` and cached
+            `entries`.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries)}
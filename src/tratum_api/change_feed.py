@@ -0,0 +1,377 @@
+"""Incremental change feed of monitored processes.
+
+`ChangeFeed` polls process details and yields only processes whose
+content changed since the previous poll. Watermarks (`last_update`,
+content hash and a hash of each field) are kept at a SQLite database, so
+the feed continues where it stopped after a restart, large fields like
+`content_all` are kept only as hashes. Processes that changed recently
+are polled more often than quiet ones.
+"""
+import json
+import time
+import hashlib
+import sqlite3
+from typing import Iterable, Iterator
+from tratum_api.bulk import bounded_map, exception_to_dict
+
+# Types kept at the watermark to report old values of changed fields
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+# Longer strings are kept only as hashes at the watermark
+_MAX_VALUE_LENGTH = 256
+
+
+def _hash_value(value) -> str:
+    """Stable hash of a JSON value."""
+    data = json.dumps(
+        value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ProcessChange:
+    """Process whose detail changed since the previous poll."""
+
+    __slots__ = ("process_number", "detail", "changed_fields", "is_new")
+
+    def __init__(self, process_number: str, detail: dict,
+                 changed_fields: dict, is_new: bool):
+        """__init__.
+
+        Args:
+            process_number (str):
+                Process document.
+            detail (dict):
+                Current process detail.
+            changed_fields (dict):
+                Changed top-level fields mapped to `(old, new)` tuples. Old
+                values are kept only for scalar fields and strings up to
+                256 characters, None otherwise.
+            is_new (bool):
+                True if it is the first time the process was fetched.
+        """
+        self.process_number = process_number
+        self.detail = detail
+        self.changed_fields = changed_fields
+        self.is_new = is_new
+
+    def __repr__(self):
+        """__repr__."""
+        return "ProcessChange({process_number}, fields={fields})".format(
+            process_number=self.process_number,
+            fields=sorted(self.changed_fields))
+
+
+class WatermarkStore:
+    """SQLite store of process watermarks and polling schedule."""
+
+    def __init__(self, path: str = ":memory:"):
+        """__init__.
+
+        Args:
+            path (str): = ":memory:"
+                Path of the SQLite database file.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS process_watermark ("
+            " organization_id TEXT NOT NULL, process_number TEXT NOT NULL,"
+            " last_update TEXT, content_hash TEXT, field_hashes TEXT,"
+            " field_values TEXT, last_checked_at REAL,"
+            " last_changed_at REAL, next_poll_at REAL NOT NULL,"
+            " PRIMARY KEY (organization_id, process_number))")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS process_watermark_next_poll_at "
+            "ON process_watermark (organization_id, next_poll_at)")
+        self._connection.commit()
+
+    def track(self, organization_id, process_numbers: Iterable[str],
+              next_poll_at: float = None):
+        """Add processes to be polled, already tracked are kept as is."""
+        if next_poll_at is None:
+            next_poll_at = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO process_watermark "
+                "(organization_id, process_number, next_poll_at) "
+                "VALUES (?, ?, ?)", (
+                    (str(organization_id), process_number, next_poll_at)
+                    for process_number in process_numbers))
+
+    def untrack(self, organization_id, process_numbers: Iterable[str]):
+        """Remove processes from the store."""
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM process_watermark "
+                "WHERE organization_id = ? AND process_number = ?", (
+                    (str(organization_id), process_number)
+                    for process_number in process_numbers))
+
+    def due(self, organization_id, now: float = None,
+            limit: int = None) -> list:
+        """Process numbers which poll is due, most late first."""
+        if now is None:
+            now = time.time()
+        rows = self._connection.execute(
+            "SELECT process_number FROM process_watermark "
+            "WHERE organization_id = ? AND next_poll_at <= ? "
+            "ORDER BY next_poll_at LIMIT ?",
+            (str(organization_id), now, -1 if limit is None else limit))
+        return [row[0] for row in rows]
+
+    def get(self, organization_id, process_number: str) -> dict:
+        """Watermark of the process, None if not tracked."""
+        row = self._connection.execute(
+            "SELECT last_update, content_hash, field_hashes, field_values, "
+            "last_checked_at, last_changed_at, next_poll_at "
+            "FROM process_watermark "
+            "WHERE organization_id = ? AND process_number = ?",
+            (str(organization_id), process_number)).fetchone()
+        if row is None:
+            return None
+        return {
+            "last_update": row[0],
+            "content_hash": row[1],
+            "field_hashes": json.loads(row[2]) if row[2] else None,
+            "field_values": json.loads(row[3]) if row[3] else None,
+            "last_checked_at": row[4],
+            "last_changed_at": row[5],
+            "next_poll_at": row[6]}
+
+    def update(self, organization_id, rows: list, schedules: list = ()):
+        """Save watermarks in a single transaction.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            rows (list):
+                Tuples with `(process_number, watermark)`, watermark is a
+                dictionary with the keys returned by `get`.
+            schedules (list): = ()
+                Tuples with `(process_number, watermark)` of processes
+                which content did not change, only `last_update` and
+                poll times are saved.
+        """
+        with self._connection:
+            self._connection.executemany(
+                "UPDATE process_watermark SET last_update = ?, "
+                "last_checked_at = ?, last_changed_at = ?, next_poll_at = ? "
+                "WHERE organization_id = ? AND process_number = ?", [(
+                    watermark["last_update"], watermark["last_checked_at"],
+                    watermark["last_changed_at"], watermark["next_poll_at"],
+                    str(organization_id), process_number)
+                    for process_number, watermark in schedules])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO process_watermark "
+                "(organization_id, process_number, last_update, "
+                " content_hash, field_hashes, field_values, "
+                " last_checked_at, last_changed_at, next_poll_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(
+                    str(organization_id), process_number,
+                    watermark["last_update"], watermark["content_hash"],
+                    json.dumps(watermark["field_hashes"])
+                    if watermark["field_hashes"] is not None else None,
+                    json.dumps(watermark["field_values"])
+                    if watermark["field_values"] is not None else None,
+                    watermark["last_checked_at"],
+                    watermark["last_changed_at"],
+                    watermark["next_poll_at"])
+                    for process_number, watermark in rows])
+
+    def close(self):
+        """Close database connection."""
+        self._connection.close()
+
+
+class ChangeFeed:
+    """Poll monitored processes yielding only the changed ones.
+
+    Poll interval of each process is proportional to the time since it
+    last changed, limited between `min_interval` and `max_interval`:
+    a process that changed an hour ago is polled again in
+    `interval_factor` hours.
+    """
+
+    def __init__(self, tratum_api, store: WatermarkStore = None,
+                 min_interval: float = 15 * 60,
+                 max_interval: float = 7 * 24 * 60 * 60,
+                 interval_factor: float = 0.5, max_workers: int = 8,
+                 commit_every: int = 500):
+        """__init__.
+
+        Args:
+            tratum_api (TratumAPI):
+                Client used to fetch process details.
+            store (WatermarkStore): = None
+                Store of watermarks, if None an in-memory store is used.
+            min_interval (float): = 15 minutes
+                Minimum seconds between polls of a process.
+            max_interval (float): = 7 days
+                Maximum seconds between polls of a process.
+            interval_factor (float): = 0.5
+                Poll interval as fraction of the time since last change.
+            max_workers (int): = 8
+                Number of parallel requests when polling.
+            commit_every (int): = 500
+                Number of polled processes saved in each transaction.
+        """
+        if store is None:
+            store = WatermarkStore()
+        self.tratum_api = tratum_api
+        self.store = store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval_factor = interval_factor
+        self.max_workers = max_workers
+        self.commit_every = commit_every
+        self.errors = {}
+
+    @property
+    def organization_id(self):
+        """Organization of the client."""
+        return self.tratum_api.organization_id
+
+    def track(self, process_numbers: Iterable[str]):
+        """Add processes to the feed, they are polled on next `poll`."""
+        self.store.track(self.organization_id, process_numbers)
+
+    def untrack(self, process_numbers: Iterable[str]):
+        """Remove processes from the feed."""
+        self.store.untrack(self.organization_id, process_numbers)
+
+    def next_interval(self, now: float, last_changed_at: float) -> float:
+        """Seconds until next poll of a process."""
+        if last_changed_at is None:
+            return self.min_interval
+        interval = (now - last_changed_at) * self.interval_factor
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def _compare(self, process_number: str, detail: dict,
+                 watermark: dict, now: float) -> tuple:
+        """Compare detail with watermark.
+
+        Returns:
+            Tuple with new watermark and `ProcessChange`, None if the
+            process did not change.
+        """
+        field_hashes = {
+            field: _hash_value(value) for field, value in detail.items()}
+        field_values = {
+            field: value for field, value in detail.items()
+            if isinstance(value, _SCALAR_TYPES) and not (
+                isinstance(value, str) and len(value) > _MAX_VALUE_LENGTH)}
+        content_hash = _hash_value(field_hashes)
+
+        previous_hashes = (watermark or {}).get("field_hashes")
+        is_new = previous_hashes is None
+        is_changed = (
+            is_new or
+            content_hash != watermark["content_hash"] or
+            detail.get("last_update") != watermark["last_update"])
+
+        change = None
+        last_changed_at = (watermark or {}).get("last_changed_at")
+        if is_changed:
+            last_changed_at = now
+            previous_values = (watermark or {}).get("field_values") or {}
+            previous_hashes = previous_hashes or {}
+            changed_fields = {
+                field: (previous_values.get(field), detail.get(field))
+                for field in set(field_hashes) | set(previous_hashes)
+                if field_hashes.get(field) != previous_hashes.get(field)}
+            change = ProcessChange(
+                process_number=process_number, detail=detail,
+                changed_fields=changed_fields, is_new=is_new)
+
+        new_watermark = {
+            "last_update": detail.get("last_update"),
+            "content_hash": content_hash,
+            "field_hashes": field_hashes,
+            "field_values": field_values,
+            "last_checked_at": now,
+            "last_changed_at": last_changed_at,
+            "next_poll_at": now + self.next_interval(now, last_changed_at)}
+        return new_watermark, change
+
+    def _fetch(self, process_number: str) -> dict:
+        """Fetch current detail revalidating client cache entries.
+
+        Cached details are revalidated with a conditional request, so
+        unchanged processes are answered with 304 without body.
+        """
+        return self.tratum_api.get_process_detail(
+            process_number, revalidate=True)
+
+    def poll(self, limit: int = None) -> Iterator[ProcessChange]:
+        """Poll processes which poll is due.
+
+        Fetch errors are kept at `errors` and the process is polled again
+        after `min_interval`. Field hashes and values are saved only for
+        processes which content changed.
+
+        Args:
+            limit (int): = None
+                Maximum number of processes polled.
+
+        Returns:
+            Iterator of `ProcessChange` for processes that changed.
+        """
+        self.errors = {}
+        process_numbers = self.store.due(self.organization_id, limit=limit)
+        results = bounded_map(
+            self._fetch, process_numbers, max_workers=self.max_workers)
+        rows = []
+        schedules = []
+        try:
+            for process_number, detail, exception in results:
+                now = time.time()
+                watermark = self.store.get(
+                    self.organization_id, process_number)
+                if exception is not None:
+                    self.errors[process_number] = exception_to_dict(
+                        exception)
+                    if watermark is not None:
+                        watermark["next_poll_at"] = now + self.min_interval
+                        schedules.append((process_number, watermark))
+                else:
+                    new_watermark, change = self._compare(
+                        process_number, detail, watermark, now)
+                    if watermark is not None and \
+                            watermark["field_hashes"] is not None and \
+                            new_watermark["content_hash"] == \
+                            watermark["content_hash"]:
+                        schedules.append((process_number, new_watermark))
+                    else:
+                        rows.append((process_number, new_watermark))
+                    if change is not None:
+                        yield change
+
+                if len(rows) + len(schedules) >= self.commit_every:
+                    self.store.update(self.organization_id, rows, schedules)
+                    rows = []
+                    schedules = []
+        finally:
+            if rows or schedules:
+                self.store.update(self.organization_id, rows, schedules)
+
+    def watch(self, idle_sleep: float = 60,
+              limit: int = None) -> Iterator[ProcessChange]:
+        """Poll forever yielding changes as they are found.
+
+        Args:
+            idle_sleep (float): = 60
+                Seconds to sleep when no poll is due.
+            limit (int): = None
+                Maximum number of processes polled at each round.
+
+        Returns:
+            Infinite iterator of `ProcessChange`.
+        """
+        while True:
+            is_idle = True
+            for change in self.poll(limit=limit):
+                is_idle = False
+                yield change
+            if is_idle and not self.errors:
+                time.sleep(idle_sleep)
@@ -0,0 +1,342 @@
+"""Circuit breakers of Tratum API end-points.
+
+A breaker records the outcome of the last requests to an end-point. When
+the rate of failed (connection errors, timeouts and 5xx status) or slow
+requests reaches a threshold the circuit opens and requests fail at once
+with `TratumAPICircuitOpenException`, without waiting for the network.
+After `open_timeout` the circuit is half-open: a few probe requests are
+sent, the circuit closes if they succeed and opens again otherwise. A
+probe that ends without outcome (cancelled task, interrupt) must free its
+slot with `release`, a probe not finished after `probe_timeout` counts as
+failed.
+
+Breakers are thread-safe and never block, so the same `CircuitBreakers`
+may be shared by sync and async clients of many organizations. Schedulers
+can read `states` to shed load before calling the clients.
+"""
+import time
+import threading
+import collections
+from tratum_api.exceptions import TratumAPICircuitOpenException
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Status codes that count as failures, throttling (429) is handled by the
+# rate limiter
+FAILURE_STATUS_CODES = (500, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """Circuit breaker over a window of the last requests."""
+
+    def __init__(self, name: str = None, failure_rate: float = 0.5,
+                 slow_call_rate: float = 1.0, slow_call_duration: float = None,
+                 window_size: int = 20, minimum_calls: int = 10,
+                 open_timeout: float = 30, half_open_calls: int = 1,
+                 probe_timeout: float = 60):
+        """__init__.
+
+        Args:
+            name (str): = None
+                Name of the end-point, used at error messages.
+            failure_rate (float): = 0.5
+                Fraction of failed requests at the window that opens the
+                circuit.
+            slow_call_rate (float): = 1.0
+                Fraction of slow requests at the window that opens the
+                circuit.
+            slow_call_duration (float): = None
+                Seconds after which a request is slow, if None latency is
+                not checked.
+            window_size (int): = 20
+                Number of last requests used to compute the rates.
+            minimum_calls (int): = 10
+                Rates are not checked with less requests at the window.
+            open_timeout (float): = 30
+                Seconds the circuit stays open before probing recovery.
+            half_open_calls (int): = 1
+                Number of probe requests at half-open state, all of them
+                must succeed to close the circuit.
+            probe_timeout (float): = 60
+                Seconds after which a probe without outcome counts as
+                failed and opens the circuit again, so a probe that never
+                returns does not keep the circuit half-open forever.
+        """
+        if window_size < 1:
+            raise ValueError("window_size must be greater than zero")
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_duration = slow_call_duration
+        self.window_size = window_size
+        self.minimum_calls = min(minimum_calls, window_size)
+        self.open_timeout = open_timeout
+        self.half_open_calls = half_open_calls
+        self.probe_timeout = probe_timeout
+        self._state = CLOSED
+        self._opened_at = None
+        self._window = collections.deque()
+        self._failures = 0
+        self._slow_calls = 0
+        self._probes = 0
+        self._probe_successes = 0
+        # Start times of probes in flight, oldest first
+        self._probe_started = collections.deque()
+        self._lock = threading.Lock()
+
+    def _expire_probes(self, now: float):
+        """Open half-open circuit if a probe timed out, lock held."""
+        if self._state == HALF_OPEN and self._probe_started and \
+                now - self._probe_started[0] >= self.probe_timeout:
+            self._open(now)
+
+    def _update_state(self, now: float):
+        """Move circuit to half-open or open after timeouts, lock held."""
+        if self._state == OPEN and now - self._opened_at >= self.open_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+            self._probe_started.clear()
+        else:
+            self._expire_probes(now)
+
+    def _open(self, now: float):
+        """Open circuit clearing the window, lock held."""
+        self._state = OPEN
+        self._opened_at = now
+        self._window.clear()
+        self._failures = 0
+        self._slow_calls = 0
+        self._probe_started.clear()
+
+    @property
+    def state(self) -> str:
+        """Current state, `closed`, `open` or `half_open`."""
+        with self._lock:
+            self._update_state(time.monotonic())
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit accepts probe requests."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(
+                self._opened_at + self.open_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Check if a request may be sent, taking a probe if half-open.
+
+        Every allowed request must be followed by a call to `record`, or
+        to `release` if it ended without outcome.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._update_state(now)
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and \
+                    self._probes < self.half_open_calls:
+                self._probes += 1
+                self._probe_started.append(now)
+                return True
+            return False
+
+    def acquire(self):
+        """Raise error if a request may not be sent.
+
+        Raises:
+            TratumAPICircuitOpenException:
+                Raise error if circuit is open or half-open without free
+                probes.
+        """
+        if not self.allow():
+            raise TratumAPICircuitOpenException(
+                message=(
+                    "circuit breaker of Tratum API end-point [{name}] is "
+                    "open").format(name=self.name),
+                payload={
+                    "endpoint": self.name,
+                    "state": self.state,
+                    "retry_in": self.retry_in(),
+                })
+
+    def record(self, failed: bool = False, duration: float = None):
+        """Register the outcome of an allowed request.
+
+        Args:
+            failed (bool): = False
+                If request failed.
+            duration (float): = None
+                Seconds the request took, used to find slow requests.
+        """
+        slow = (
+            self.slow_call_duration is not None and duration is not None and
+            duration > self.slow_call_duration)
+        with self._lock:
+            now = time.monotonic()
+            self._expire_probes(now)
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open(now)
+                    return
+                if self._probe_started:
+                    self._probe_started.popleft()
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._state = CLOSED
+                    self._opened_at = None
+                return
+            if self._state == OPEN:
+                # Request allowed before the circuit opened
+                return
+
+            self._window.append((failed, slow))
+            self._failures += failed
+            self._slow_calls += slow
+            if len(self._window) > self.window_size:
+                old_failed, old_slow = self._window.popleft()
+                self._failures -= old_failed
+                self._slow_calls -= old_slow
+            calls = len(self._window)
+            if calls >= self.minimum_calls and (
+                    self._failures / calls >= self.failure_rate or
+                    self._slow_calls / calls >= self.slow_call_rate):
+                self._open(now)
+
+    def release(self):
+        """Free the probe of an allowed request that ended without outcome.
+
+        Requests cancelled or interrupted before a response do not tell if
+        the end-point recovered, their half-open probe is given to the next
+        request. It does nothing if the circuit is not half-open.
+        """
+        with self._lock:
+            self._expire_probes(time.monotonic())
+            if self._state == HALF_OPEN and self._probe_started:
+                self._probe_started.popleft()
+                self._probes -= 1
+
+    def reset(self):
+        """Close circuit forgetting recorded requests."""
+        with self._lock:
+            self._state = CLOSED
+            self._opened_at = None
+            self._window.clear()
+            self._failures = 0
+            self._slow_calls = 0
+            self._probe_started.clear()
+
+    def to_dict(self) -> dict:
+        """State of the breaker.
+
+        Returns:
+            dict: Keys `state`, `retry_in`, `calls` at the window and
+            `failure_rate` and `slow_call_rate` of those calls.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._update_state(now)
+            calls = len(self._window)
+            retry_in = 0.0
+            if self._state == OPEN:
+                retry_in = max(
+                    self._opened_at + self.open_timeout - now, 0.0)
+            return {
+                "state": self._state,
+                "retry_in": retry_in,
+                "calls": calls,
+                "failure_rate": self._failures / calls if calls else 0.0,
+                "slow_call_rate": self._slow_calls / calls if calls else 0.0,
+            }
+
+
+class CircuitBreakers:
+    """Circuit breaker of each end-point.
+
+    End-point names used by the clients are `login`, `import_process`,
+    `remove_monitor`, `process_detail`, `document_url` and
+    `document_download` (S3).
+    """
+
+    def __init__(self, per_endpoint: dict = None, **defaults):
+        """__init__.
+
+        Args:
+            per_endpoint (dict): = None
+                `CircuitBreaker` or dictionary of its arguments for each
+                end-point name.
+            **defaults:
+                Arguments of `CircuitBreaker` for end-points not at
+                `per_endpoint`.
+        """
+        self.defaults = defaults
+        self._breakers = {}
+        for endpoint, breaker in (per_endpoint or {}).items():
+            if not isinstance(breaker, CircuitBreaker):
+                breaker = CircuitBreaker(name=endpoint, **breaker)
+            self._breakers[endpoint] = breaker
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        """Circuit breaker of the end-point, created on first use."""
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(endpoint)
+                if breaker is None:
+                    breaker = CircuitBreaker(name=endpoint, **self.defaults)
+                    self._breakers[endpoint] = breaker
+        return breaker
+
+    def __getitem__(self, endpoint: str) -> CircuitBreaker:
+        """Circuit breaker of the end-point."""
+        return self.get(endpoint)
+
+    def acquire(self, endpoint: str):
+        """Raise `TratumAPICircuitOpenException` if circuit is open."""
+        self.get(endpoint).acquire()
+
+    def record(self, endpoint: str, status_code: int = None,
+               failed: bool = False, duration: float = None):
+        """Register the result of a request allowed by `acquire`.
+
+        Args:
+            endpoint (str):
+                End-point name.
+            status_code (int): = None
+                Status code returned by the API.
+            failed (bool): = False
+                If request failed without a response.
+            duration (float): = None
+                Seconds the request took.
+        """
+        self.get(endpoint).record(
+            failed=failed or status_code in FAILURE_STATUS_CODES,
+            duration=duration)
+
+    def release(self, endpoint: str):
+        """Free the probe of a request that ended without outcome."""
+        self.get(endpoint).release()
+
+    def is_open(self, endpoint: str) -> bool:
+        """Check if requests to the end-point fail fast."""
+        return self.get(endpoint).state == OPEN
+
+    def states(self) -> dict:
+        """State of the breakers used so far by end-point name."""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            endpoint: breaker.to_dict()
+            for endpoint, breaker in breakers.items()}
+
+    def reset(self):
+        """Close every circuit."""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker.reset()
@@ -0,0 +1,401 @@
+"""Command line interface for bulk operations at Tratum API.
+
+Process numbers are read lazily from CSV, NDJSON or plain text files (or
+standard input) and results are written as NDJSON while requests run, so
+memory does not grow with the input size:
+
+    tratum monitor processes.csv -o results.ndjson --workers 20
+    cat processes.txt | tratum detail - > details.ndjson
+
+Credentials are read from `TRATUM_EMAIL`, `TRATUM_PASSWORD`,
+`ORGANIZATION_ID`, `HOLDER_ID` and `CNPJ` environment variables or from
+command options.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import functools
+import itertools
+from typing import Iterable, Iterator, TextIO
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.data import TratumAPI
+from tratum_api.exceptions import TratumAPIInvalidDocumentException
+from tratum_api.ledger import MonitoringLedger
+from tratum_api.validation import normalize_process_number
+
+# Columns or keys searched for process numbers, in this order
+PROCESS_NUMBER_KEYS = ("process_number", "process", "numero_processo")
+
+_CREDENTIALS = (
+    ("email", "TRATUM_EMAIL"),
+    ("password", "TRATUM_PASSWORD"),
+    ("organization_id", "ORGANIZATION_ID"),
+    ("holder_id", "HOLDER_ID"),
+    ("cnpj", "CNPJ"),
+)
+
+
+def _find_key(keys: list, column: str = None):
+    """Find key of the process number at a header or JSON object."""
+    if column is not None:
+        if column not in keys:
+            raise ValueError(
+                "column [{column}] not found at input".format(
+                    column=column))
+        return column
+    for key in PROCESS_NUMBER_KEYS:
+        if key in keys:
+            return key
+    return None
+
+
+def iter_csv(file: Iterable[str], column: str = None) -> Iterator[str]:
+    """Read process numbers from a CSV file lazily.
+
+    First row is a header when `column` is set or when it has no digits,
+    otherwise the first column of every row is used.
+
+    Args:
+        file (Iterable[str]):
+            Opened CSV file or its lines, plain text with a process per
+            line is also accepted.
+        column (str): = None
+            Column of the process numbers, if None one of
+            `PROCESS_NUMBER_KEYS` or the first column is used.
+
+    Returns:
+        Iterator of process numbers, empty rows are skipped.
+    """
+    reader = csv.reader(file)
+    index = 0
+    for row in reader:
+        if not row:
+            continue
+        is_header = column is not None or not any(
+            character.isdigit() for value in row for character in value)
+        if is_header:
+            key = _find_key(row, column)
+            index = 0 if key is None else row.index(key)
+        elif len(row) > index and row[index].strip():
+            yield row[index].strip()
+        break
+
+    for row in reader:
+        if len(row) > index and row[index].strip():
+            yield row[index].strip()
+
+
+def iter_ndjson(file: Iterable[str],
+                column: str = None) -> Iterator[str]:
+    """Read process numbers from a NDJSON file lazily.
+
+    Args:
+        file (Iterable[str]):
+            Opened NDJSON file or its lines, lines may be objects or
+            strings.
+        column (str): = None
+            Key of the process numbers, if None one of
+            `PROCESS_NUMBER_KEYS` is used.
+
+    Returns:
+        Iterator of process numbers, empty lines are skipped.
+    """
+    for line in file:
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        if isinstance(value, dict):
+            key = _find_key(value, column)
+            if key is None:
+                raise ValueError(
+                    "process number not found at line: {line}".format(
+                        line=line.strip()))
+            value = value[key]
+        yield str(value).strip()
+
+
+def iter_input(file: TextIO, input_format: str = None,
+               column: str = None) -> Iterator[str]:
+    """Read process numbers lazily detecting the input format.
+
+    Args:
+        file (TextIO):
+            Opened input file.
+        input_format (str): = None
+            `csv` or `ndjson`, if None it is detected by file extension or
+            by the first line of the file.
+        column (str): = None
+            Column or key of the process numbers.
+
+    Returns:
+        Iterator of process numbers.
+    """
+    lines = iter(file)
+    if input_format is None:
+        name = getattr(file, "name", None)
+        if isinstance(name, str) and name.endswith((".ndjson", ".jsonl")):
+            input_format = "ndjson"
+        elif isinstance(name, str) and name.endswith(".csv"):
+            input_format = "csv"
+        else:
+            first_line = next(lines, "")
+            input_format = (
+                "ndjson" if first_line.lstrip().startswith(('{', '"'))
+                else "csv")
+            lines = itertools.chain([first_line], lines)
+    if input_format == "ndjson":
+        return iter_ndjson(lines, column)
+    return iter_csv(lines, column)
+
+
+class Progress:
+    """Live counter of processed items, errors and throughput."""
+
+    def __init__(self, stream: TextIO = None, interval: float = 1.0,
+                 enabled: bool = True):
+        """__init__.
+
+        Args:
+            stream (TextIO): = None
+                Where the counter is written, if None standard error.
+            interval (float): = 1.0
+                Minimum seconds between updates.
+            enabled (bool): = True
+                Set False to only count without writing.
+        """
+        self.stream = sys.stderr if stream is None else stream
+        self.interval = interval
+        self.enabled = enabled
+        self.count = 0
+        self.errors = 0
+        self._started_at = time.monotonic()
+        self._written_at = self._started_at
+
+    def update(self, success: bool):
+        """Count an item, counter is written at most once per interval."""
+        self.count += 1
+        self.errors += not success
+        now = time.monotonic()
+        if self.enabled and now - self._written_at >= self.interval:
+            self._written_at = now
+            self._write(now, end="\r")
+
+    def _write(self, now: float, end: str):
+        """Write counter."""
+        elapsed = now - self._started_at
+        self.stream.write(
+            "{count} done, {errors} errors, {rate:.1f}/s, "
+            "{elapsed:.0f}s{end}".format(
+                count=self.count, errors=self.errors,
+                rate=self.count / elapsed if elapsed else 0.0,
+                elapsed=elapsed, end=end))
+        self.stream.flush()
+
+    def close(self):
+        """Write final counter."""
+        if self.enabled:
+            self._write(time.monotonic(), end="\n")
+
+
+def _item_result(process_number: str, result, exception) -> dict:
+    """Format result of a bulk call as `TratumAPI.monitor_processes`."""
+    if exception is None:
+        return {
+            "process_number": process_number,
+            "success": True,
+            "result": result}
+    return {
+        "process_number": process_number,
+        "success": False,
+        "error": exception_to_dict(exception)}
+
+
+def _validate(args, process_numbers: Iterable[str]) -> Iterator[dict]:
+    """Validate process numbers locally."""
+    for process_number in process_numbers:
+        normalized = normalize_process_number(process_number)
+        yield {
+            "process_number": process_number,
+            "success": normalized is not None,
+            "normalized": normalized}
+
+
+def _monitor(args, process_numbers: Iterable[str]) -> Iterator[dict]:
+    """Send processes to monitoring."""
+    return _client(args).monitor_processes(
+        process_numbers, max_workers=args.workers)
+
+
+def _unmonitor(args, process_numbers: Iterable[str]) -> Iterator[dict]:
+    """Remove processes from monitoring."""
+    return _client(args).remove_monitor_processes(
+        process_numbers, max_workers=args.workers)
+
+
+def _detail(args, process_numbers: Iterable[str]) -> Iterator[dict]:
+    """Fetch process details."""
+    tratum_api = _client(args)
+    results = bounded_map(
+        tratum_api.get_process_detail, process_numbers,
+        max_workers=args.workers)
+    for process_number, result, exception in results:
+        yield _item_result(process_number, result, exception)
+
+
+def _download_process(tratum_api, process_number: str, dest_dir: str,
+                      max_workers: int) -> list:
+    """Download documents of a process returning per document results.
+
+    Documents are saved at a directory named with the 20 digits of the
+    process number, input that is not a valid process number raises
+    `TratumAPIInvalidDocumentException` so it never becomes a path.
+    """
+    normalized = normalize_process_number(process_number)
+    if normalized is None:
+        raise TratumAPIInvalidDocumentException(
+            message="Invalid process number",
+            payload={"process_number": process_number})
+    return list(tratum_api.download_process_documents(
+        normalized, os.path.join(dest_dir, normalized),
+        max_workers=max_workers))
+
+
+def _download(args, process_numbers: Iterable[str]) -> Iterator[dict]:
+    """Download documents of processes."""
+    tratum_api = _client(args)
+    download = functools.partial(
+        _download_process, tratum_api, dest_dir=args.dest_dir,
+        max_workers=args.document_workers)
+    results = bounded_map(
+        download, process_numbers, max_workers=args.workers)
+    for process_number, documents, exception in results:
+        if exception is not None:
+            yield _item_result(process_number, None, exception)
+            continue
+        for document in documents:
+            document["process_number"] = process_number
+            yield document
+
+
+def _client(args):
+    """Create client from command options."""
+    missing = [
+        "--" + name.replace("_", "-") for name, _ in _CREDENTIALS
+        if not getattr(args, name)]
+    if missing:
+        raise SystemExit(
+            "tratum: missing credentials {missing}, use options or "
+            "environment variables".format(missing=", ".join(missing)))
+    ledger = None
+    if getattr(args, "ledger", None):
+        ledger = MonitoringLedger(args.ledger)
+    return TratumAPI(
+        tratum_email=args.email, tratum_password=args.password,
+        organization_id=args.organization_id, holder_id=args.holder_id,
+        cnpj=args.cnpj, base_url=args.base_url,
+        pool_maxsize=max(args.workers, 10), monitoring_ledger=ledger)
+
+
+COMMANDS = {
+    "validate": (_validate, "validate process numbers without API calls"),
+    "monitor": (_monitor, "send processes to monitoring"),
+    "unmonitor": (_unmonitor, "remove processes from monitoring"),
+    "detail": (_detail, "fetch process details"),
+    "download": (_download, "download documents of processes"),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Create parser of command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog="tratum", description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument(
+            "input", nargs="?", default="-",
+            help="CSV, NDJSON or text file with process numbers, "
+                 "- for standard input")
+        subparser.add_argument(
+            "-o", "--output", default="-",
+            help="NDJSON file of results, - for standard output")
+        subparser.add_argument(
+            "--format", dest="input_format", choices=("csv", "ndjson"),
+            help="input format, detected if not set")
+        subparser.add_argument(
+            "--column", help="column or key of the process numbers")
+        subparser.add_argument(
+            "--no-progress", action="store_true",
+            help="do not show the progress counter")
+        if name == "validate":
+            continue
+        subparser.add_argument(
+            "--workers", type=int, default=10,
+            help="parallel requests")
+        subparser.add_argument(
+            "--base-url", help="base URL of Tratum API")
+        for option, env in _CREDENTIALS:
+            subparser.add_argument(
+                "--" + option.replace("_", "-"), dest=option,
+                default=os.getenv(env),
+                help="defaults to {env} environment variable".format(
+                    env=env))
+        if name in ("monitor", "unmonitor"):
+            subparser.add_argument(
+                "--ledger",
+                help="SQLite file of the monitoring ledger, processes "
+                     "already at the requested state are skipped")
+        if name == "download":
+            subparser.add_argument(
+                "--dest-dir", required=True,
+                help="directory where documents are saved, one "
+                     "sub-directory per process")
+            subparser.add_argument(
+                "--document-workers", type=int, default=4,
+                help="parallel downloads of each process")
+    return parser
+
+
+def _open(path: str, mode: str, std: TextIO) -> TextIO:
+    """Open file or return standard stream for `-`."""
+    if path == "-":
+        return std
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def main(argv: list = None) -> int:
+    """Run command line interface.
+
+    Returns:
+        int: 0 if every item succeeded, 1 if some item failed.
+    """
+    args = build_parser().parse_args(argv)
+    command = COMMANDS[args.command][0]
+    input_file = _open(args.input, "r", sys.stdin)
+    output_file = _open(args.output, "w", sys.stdout)
+    progress = Progress(enabled=not args.no_progress)
+    try:
+        process_numbers = iter_input(
+            input_file, args.input_format, args.column)
+        for result in command(args, process_numbers):
+            output_file.write(json.dumps(
+                result, ensure_ascii=False, default=str))
+            output_file.write("\n")
+            progress.update(result["success"])
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        progress.close()
+        output_file.flush()
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    return 1 if progress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,46 @@
 """Tratum Python API."""
 import os
+import time
+import hashlib
+import threading
+import functools
 import requests
+from typing import BinaryIO, Iterable, Iterator, Union
+from tratum_api.auth import decode_jwt_expiry, token_refresh_time
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.cache import ProcessDetailCache, SignedURLCache
+from tratum_api.circuit_breaker import CircuitBreakers
+from tratum_api.document_store import DocumentStore
+from tratum_api.documents import (
+    DocumentManifest, document_local_path, iter_document_urls)
+from tratum_api.instrumentation import RequestEvent, body_size, emit
+from tratum_api.json_codec import get_decoder
+from tratum_api.ledger import MonitoringLedger
+from tratum_api.models import ProcessDetail
+from tratum_api.rate_limit import RateLimiter, parse_retry_after
+from tratum_api.retry import DEFAULT_RETRY_POLICIES
+from tratum_api.search import ProcessIndex
+from tratum_api.session import build_session
+from tratum_api.validation import is_process_number_valid
 from tratum_api.exceptions import (
     TratumAPILoginError, TratumAPIProblemAPIException,
-    TratumAPIInvalidDocumentException)
+    TratumAPIInvalidDocumentException, TratumAPIDocumentChecksumException,
+    TratumAPICircuitOpenException)
+
+ENDPOINTS = (
+    "login", "import_process", "remove_monitor", "process_detail",
+    "document_url", "document_download")
+"""Names of Tratum API end-points used by rate limits and metrics."""
+
+# Production URL of Tratum API
+DEFAULT_BASE_URL = "https://search.tratum.com.br"
+
+
+def _iter_file_chunks(file: BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    """Read an open file in chunks, closing it at the end."""
+    with file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            yield chunk
 
 
 class TratumAPI:
@@ -11,7 +48,21 @@ class TratumAPI:
 
     def __init__(self, tratum_email: str, tratum_password: str,
                  organization_id: int, holder_id: int, cnpj: str,
-                 proxy: str = None):
+                 proxy: str = None, token_refresh_margin: float = 60,
+                 session: requests.Session = None,
+                 pool_connections: int = 10, pool_maxsize: int = 10,
+                 pool_block: bool = False, tcp_keepalive: bool = True,
+                 connect_timeout: float = 10, read_timeout: float = 60,
+                 cache: ProcessDetailCache = None,
+                 signed_url_cache: SignedURLCache = None,
+                 rate_limiter: RateLimiter = None,
+                 retry_policies: dict = None,
+                 base_url: str = None, hooks: list = None,
+                 document_store: DocumentStore = None,
+                 lazy_login: bool = False, json_decoder=None,
+                 monitoring_ledger: MonitoringLedger = None,
+                 search_index: ProcessIndex = None,
+                 circuit_breakers: CircuitBreakers = None):
         """__init__.
 
         Args:
@@ -27,17 +78,106 @@ class TratumAPI:
                 Organization document.
             proxy (str): = None
                 Proxy server for end-point calls.
+            token_refresh_margin (float): = 60
+                Seconds before token expiry to login again.
+            session (requests.Session): = None
+                Session used on requests. Pass the same session (see
+                `tratum_api.session.build_session`) to many clients to
+                share the connection pool between organizations. If None
+                a new session is created using pool arguments.
+            pool_connections (int): = 10
+                Number of hosts with cached connection pool, used only if
+                session is not informed.
+            pool_maxsize (int): = 10
+                Maximum number of connections kept for each host, used
+                only if session is not informed.
+            pool_block (bool): = False
+                Wait for a free connection when pool is exhausted, used
+                only if session is not informed.
+            tcp_keepalive (bool): = True
+                Enable TCP keep-alive on connections, used only if session
+                is not informed.
+            connect_timeout (float): = 10
+                Seconds to wait for a connection on every request.
+            read_timeout (float): = 60
+                Seconds to wait for data from server on every request.
+            cache (ProcessDetailCache): = None
+                Read-through cache for `get_process_detail`, if None
+                details are always fetched from the API.
+            signed_url_cache (SignedURLCache): = None
+                Cache of presigned URLs used by `get_process_document_url`
+                while they are valid, if None URLs are always requested.
+            rate_limiter (RateLimiter): = None
+                Rate limits and adaptive concurrency applied to requests,
+                it may be shared by many clients.
+            retry_policies (dict): = None
+                `RetryPolicy` for each end-point name, end-points without
+                policy are not retried. If None `DEFAULT_RETRY_POLICIES`
+                is used.
+            base_url (str): = None
+                Base URL of Tratum API, useful for tests against a local
+                server. If None `TRATUM_API_BASE_URL` environment variable
+                is used, defaulting to `DEFAULT_BASE_URL`.
+            hooks (list): = None
+                Callables receiving a `RequestEvent` at the end of each
+                call to an end-point, see `tratum_api.instrumentation`.
+            document_store (DocumentStore): = None
+                Local store of downloaded documents, documents found at
+                the store are not downloaded again. It may be shared by
+                clients and processes of the host.
+            lazy_login (bool): = False
+                Do not login at creation, login is made by the first
+                request.
+            json_decoder (str | Callable): = None
+                Decoder of response bodies, `orjson`, `ujson`, `json` or a
+                function receiving bytes. If None the fastest installed
+                decoder is used.
+            monitoring_ledger (MonitoringLedger): = None
+                Local record of monitored processes, calls that would not
+                change the monitoring state are not sent to the API.
+            search_index (ProcessIndex): = None
+                Local full-text index, details fetched by
+                `get_process_detail` are indexed when their `last_update`
+                changed.
+            circuit_breakers (CircuitBreakers): = None
+                Circuit breaker of each end-point, requests to end-points
+                with open circuit fail at once with
+                `TratumAPICircuitOpenException`. It may be shared by many
+                clients.
         """
         #
+        if base_url is None:
+            base_url = os.getenv('TRATUM_API_BASE_URL', DEFAULT_BASE_URL)
+        self.base_url = base_url.rstrip('/')
         if proxy is None:
             proxy = os.getenv('TRATUM_API_PROXY')
         self._proxy = proxy
-        self._requests_proxies = {
-          "http": self._proxy, "https": self._proxy}
+        # Without proxy requests uses HTTP_PROXY, HTTPS_PROXY and NO_PROXY
+        self._requests_proxies = None
+        if self._proxy is not None:
+            self._requests_proxies = {
+                "http": self._proxy, "https": self._proxy}
 
-        # Create a Session object and set proxy
-        self.session = requests.Session()
-        self.session.proxies = self._requests_proxies
+        # Create a Session object, proxy is set on each request because
+        # session may be shared with other clients
+        if session is None:
+            session = build_session(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                pool_block=pool_block, tcp_keepalive=tcp_keepalive)
+        self.session = session
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.signed_url_cache = signed_url_cache
+        self.document_store = document_store
+        self.monitoring_ledger = monitoring_ledger
+        self.search_index = search_index
+        self.rate_limiter = rate_limiter
+        self.circuit_breakers = circuit_breakers
+        if retry_policies is None:
+            retry_policies = DEFAULT_RETRY_POLICIES
+        self.retry_policies = retry_policies
+        self.hooks = list(hooks or [])
+        self.json_loads = get_decoder(json_decoder)
 
         # Set global variables
         self.organization_id = organization_id
@@ -48,8 +188,17 @@ class TratumAPI:
         self._tratum_email = tratum_email
         self._tratum_password = tratum_password
 
+        # Token lifecycle, lock makes sure only one thread logs in when
+        # token expires
+        self.token = None
+        self.token_expires_at = None
+        self._token_refresh_at = None
+        self._token_refresh_margin = token_refresh_margin
+        self._token_lock = threading.Lock()
+
         # Login to application
-        self.login()
+        if not lazy_login:
+            self.login()
 
     def login(self):
         """Login at Tratum API.
@@ -57,7 +206,7 @@ class TratumAPI:
         Uses attributes `_tratum_email` and `_tratum_password` to login
         at Tratum and retrive token.
         """
-        url = "https://search.tratum.com.br/v1/login"
+        url = self.base_url + "/v1/login"
         headers = {
             "Content-Type": "application/json"
         }
@@ -65,9 +214,10 @@ class TratumAPI:
             "email": self._tratum_email,
             "password": self._tratum_password}
 
+        response = self._request(
+            "login", "POST", url, authenticate=False, parse_json=True,
+            headers=headers, json=data)
         try:
-            response = self.session.post(
-                url, headers=headers, json=data, timeout=60)
             response.raise_for_status()
         except Exception:
             status_code = response.status_code
@@ -78,10 +228,281 @@ class TratumAPI:
             raise TratumAPILoginError(
                 msg, payload={
                     "status_code": status_code,
+                    "retries": response.retries,
                     "response_payload": response_text})
-        self.token = response.json()['token']
+        self.token = self._json(response)['token']
+        self.token_expires_at = decode_jwt_expiry(self.token)
+        self._token_refresh_at = token_refresh_time(
+            self.token_expires_at, self._token_refresh_margin)
         return True
 
+    def _is_token_expiring(self) -> bool:
+        """Check if token is missing or close to expire."""
+        if self.token is None:
+            return True
+        if self._token_refresh_at is None:
+            return False
+        return time.time() >= self._token_refresh_at
+
+    def _refresh_token(self, stale_token: str = None) -> str:
+        """Login again if token was not already refreshed by other thread.
+
+        Args:
+            stale_token (str): = None
+                Token that was found expired or rejected by the API.
+
+        Returns:
+            str: Valid token.
+        """
+        with self._token_lock:
+            if self.token == stale_token or self._is_token_expiring():
+                self.login()
+            return self.token
+
+    def _get_token(self) -> str:
+        """Return token refreshing it ahead of expiry."""
+        token = self.token
+        if self._is_token_expiring():
+            token = self._refresh_token(token)
+        return token
+
+    def _send(self, endpoint: str, method: str, url: str,
+              event: RequestEvent = None, **kwargs) -> requests.Response:
+        """Send request respecting rate limiter and circuit breakers.
+
+        If `event` is informed, timings and sizes of the attempt are added
+        to it.
+        """
+        breakers = self.circuit_breakers
+        if breakers is not None:
+            breakers.acquire(endpoint)
+        # Half-open probe is released on exits without outcome, such as
+        # interrupts, otherwise the circuit would never close
+        recorded = False
+        try:
+            if event is not None:
+                queued_at = time.perf_counter()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(endpoint)
+            if event is not None:
+                sent_at = time.perf_counter()
+                event.queue_time += sent_at - queued_at
+                event.attempts += 1
+
+            started_at = time.monotonic()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                if breakers is not None:
+                    breakers.record(
+                        endpoint, failed=True,
+                        duration=time.monotonic() - started_at)
+                    recorded = True
+                if event is not None:
+                    event.error = e.__class__.__name__
+                raise
+            finally:
+                if self.rate_limiter is not None:
+                    if response is None:
+                        self.rate_limiter.release(endpoint, failed=True)
+                    else:
+                        self.rate_limiter.release(
+                            endpoint, status_code=response.status_code,
+                            retry_after=parse_retry_after(
+                                response.headers.get('Retry-After')))
+            if breakers is not None:
+                breakers.record(
+                    endpoint, status_code=response.status_code,
+                    duration=time.monotonic() - started_at)
+                recorded = True
+        finally:
+            if breakers is not None and not recorded:
+                breakers.release(endpoint)
+        if event is not None:
+            self._record_response(
+                event, response, sent_at, kwargs.get('stream', False))
+        return response
+
+    @staticmethod
+    def _record_response(event: RequestEvent, response: requests.Response,
+                         sent_at: float, stream: bool):
+        """Add timings and sizes of a response to the event."""
+        elapsed = response.elapsed.total_seconds()
+        event.response_time += elapsed
+        event.transfer_time += max(
+            time.perf_counter() - sent_at - elapsed, 0.0)
+        event.status_code = response.status_code
+        event.error = None
+        event.bytes_sent += body_size(response.request.body)
+        if stream:
+            # Body is read later by the caller, use informed size
+            event.bytes_received += int(
+                response.headers.get('Content-Length') or 0)
+        else:
+            # Bytes read from the wire, before decompression
+            wire_bytes = getattr(response.raw, 'tell', None)
+            event.bytes_received += (
+                wire_bytes() if wire_bytes is not None
+                else len(response.content))
+
+    def _send_authenticated(self, endpoint: str, method: str, url: str,
+                            event: RequestEvent = None,
+                            **kwargs) -> requests.Response:
+        """Send request with token, login again once on status 401."""
+        headers = dict(kwargs.pop('headers', None) or {})
+        token = self._get_token()
+        headers['Authorization'] = 'Bearer {token}'.format(token=token)
+        response = self._send(
+            endpoint, method, url, event=event, headers=headers, **kwargs)
+        if response.status_code == 401:
+            token = self._refresh_token(token)
+            headers['Authorization'] = 'Bearer {token}'.format(token=token)
+            response = self._send(
+                endpoint, method, url, event=event, headers=headers,
+                **kwargs)
+        return response
+
+    def _request(self, endpoint: str, method: str, url: str,
+                 authenticate: bool = True, parse_json: bool = False,
+                 cache_status: str = None,
+                 **kwargs) -> requests.Response:
+        """Make a request to Tratum API.
+
+        Authenticated requests that receive status 401 are retried once
+        after a new login. Connection errors, timeouts and status codes
+        are retried following the end-point retry policy, the number of
+        retries is set at `response.retries`. If client has hooks they
+        receive a `RequestEvent` when the call finishes.
+
+        Args:
+            endpoint (str):
+                Name of the end-point, one of `ENDPOINTS`.
+            method (str):
+                HTTP method.
+            url (str):
+                URL of the request.
+            authenticate (bool): = True
+                If Authorization header must be added to request.
+            parse_json (bool): = False
+                Decode JSON body of the final response once, use `_json`
+                to get it.
+            cache_status (str): = None
+                Cache outcome reported to hooks, `miss` or `stale`.
+            **kwargs:
+                Other arguments passed to `requests.Session.request`.
+
+        Returns:
+            requests.Response: Response of the request.
+
+        Raises:
+            TratumAPIProblemAPIException:
+                Raise error if connection fails after all retries.
+            TratumAPICircuitOpenException:
+                Raise error without sending the request if the end-point
+                circuit breaker is open.
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        if self._requests_proxies is not None:
+            kwargs.setdefault('proxies', self._requests_proxies)
+        send = self._send_authenticated if authenticate else self._send
+        policy = self.retry_policies.get(endpoint)
+        event = None
+        if self.hooks:
+            event = RequestEvent(
+                endpoint, method=method, url=url, cache=cache_status)
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            if policy is not None:
+                kwargs['timeout'] = policy.attempt_timeout(
+                    timeout, started_at)
+            else:
+                kwargs['timeout'] = timeout
+            try:
+                response = send(endpoint, method, url, event=event, **kwargs)
+            except TratumAPICircuitOpenException:
+                if event is not None:
+                    event.error = "CircuitOpen"
+                    emit(self.hooks, event)
+                raise
+            except requests.exceptions.RequestException as e:
+                delay = None
+                if policy is not None and policy.should_retry_exception(e):
+                    delay = policy.next_delay(attempt, started_at)
+                if delay is None:
+                    msg = (
+                        "Error when connecting to Tratum API end-point "
+                        "[{endpoint}]: {error}").format(
+                        endpoint=endpoint, error=e.__class__.__name__)
+                    if event is not None:
+                        emit(self.hooks, event)
+                    raise TratumAPIProblemAPIException(
+                        message=msg, payload={
+                            "endpoint": endpoint,
+                            "error": repr(e),
+                            "retries": attempt - 1})
+                if event is not None:
+                    event.backoff_time += delay
+                time.sleep(delay)
+                continue
+
+            if policy is not None and \
+                    policy.should_retry_status(response.status_code):
+                delay = policy.next_delay(
+                    attempt, started_at, retry_after=parse_retry_after(
+                        response.headers.get('Retry-After')))
+                if delay is not None:
+                    response.close()
+                    if event is not None:
+                        event.backoff_time += delay
+                    time.sleep(delay)
+                    continue
+            response.retries = attempt - 1
+            if parse_json:
+                self._parse_json(response, event)
+            if event is not None:
+                if cache_status == "stale" and response.status_code == 304:
+                    event.cache = "revalidated"
+                emit(self.hooks, event)
+            return response
+
+    def _parse_json(self, response: requests.Response,
+                    event: RequestEvent = None):
+        """Decode JSON body keeping errors to be raised by `_json`.
+
+        Body bytes are decoded once by `json_loads`, success and error
+        branches share the decoded value.
+        """
+        if event is not None:
+            parse_started_at = time.perf_counter()
+        try:
+            response.json_data = self.json_loads(response.content)
+            response.json_error = None
+        except ValueError as e:
+            response.json_data = None
+            response.json_error = e
+        if event is not None:
+            event.parse_time += time.perf_counter() - parse_started_at
+
+    def _json(self, response: requests.Response):
+        """Return JSON body decoded by `_request`.
+
+        Raises the decoding error if body is not a valid JSON, responses
+        not parsed by `_request` are decoded now.
+        """
+        if not hasattr(response, 'json_data'):
+            self._parse_json(response)
+        if response.json_error is not None:
+            raise response.json_error
+        return response.json_data
+
+    def _emit_cache_hit(self, endpoint: str):
+        """Report to hooks a call answered by the client cache."""
+        if self.hooks:
+            emit(self.hooks, RequestEvent(endpoint, cache="hit"))
+
     def is__process_number__valid(self, process_number: str):
         """Check process number validation.
 
@@ -90,6 +511,9 @@ class TratumAPI:
         - Last 2 digits (verification digits) must be validated based on
         initial sequence.
 
+        It does not need login, `tratum_api.validation` has the same check
+        as functions and a batched version for many numbers.
+
         Args:
             process_number (str):
                 process number to be validated.
@@ -97,46 +521,42 @@ class TratumAPI:
         Returns:
             bool: Wether process number is valid.
         """
-        numbers = [int(digit) for digit in process_number if digit.isdigit()]
-        if len(numbers) != 20:
-            return False
+        return is_process_number_valid(process_number)
 
-        numbers = ''.join(str(num) for num in numbers)
-        sequencial = numbers[:7]
-        digito_verificador = numbers[7:9]
-        restante = numbers[9:]
-
-        # Calcula o DV esperado
-        numero_sem_dv = sequencial + restante
-        resto = int(numero_sem_dv) * 100 % 97
-        dv = 98 - resto
-        dv_calculado = f"{dv:02d}"
-
-        if digito_verificador != dv_calculado:
-            return False
-
-        return True
-
-    def monitor_process(self, process_number: str):
+    def monitor_process(self, process_number: str, refresh: bool = False):
         """Send process to monitoring.
 
+        If client has a monitoring ledger and the process is recorded as
+        monitored, the response of the previous call is returned without
+        calling the API. Entries without response, such as the ones set by
+        `MonitoringLedger.reconcile`, are sent to the API again.
+
         Args:
             process_number (str):
                 Process document.
+            refresh (bool): = False
+                Call the API even if ledger has the process as monitored.
         """
+        ledger = self.monitoring_ledger
+        if ledger is not None and not refresh:
+            entry = ledger.get(self.organization_id, process_number)
+            if entry is not None and entry["monitored"] and \
+                    entry["response"] is not None:
+                self._emit_cache_hit("import_process")
+                return entry["response"]
+
         url = (
-            "https://search.tratum.com.br/v2/importProcess/" +
+            self.base_url + "/v2/importProcess/" +
             "{organization_id}/{process_number}/?document={cnpj}").format(
             organization_id=self.organization_id,
             process_number=process_number,
             cnpj=self.cnpj)
-        headers = {
-            'Authorization': 'Bearer {token}'.format(token=self.token)}
+        response = self._request(
+            "import_process", "POST", url, parse_json=True, json={})
         try:
-            response = self.session.post(url, headers=headers, json={})
             response.raise_for_status()
         except Exception:
-            response_json = response.json()
+            response_json = self._json(response)
             obs = response_json.get('obs', "")
             msg = (
                 "Error related to internal problems in APIs "
@@ -145,9 +565,10 @@ class TratumAPI:
                 message=msg, payload={
                     "process_number": process_number,
                     "status_code": response.status_code,
+                    "retries": response.retries,
                     "response_payload": response_json})
 
-        response_json = response.json()
+        response_json = self._json(response)
         # Invalid and other errors at processing are returned with status
         # 200 at the API, but are results of errors. It is necessary to
         # treat using the payload
@@ -164,6 +585,7 @@ class TratumAPI:
                 message=msg, payload={
                     "process_number": process_number,
                     "status_code": response.status_code,
+                    "retries": response.retries,
                     "response_payload": response_json})
 
         # Get if process is INVALID
@@ -178,14 +600,24 @@ class TratumAPI:
                 })
 
         # If passed the tests, it will be returned as valid response
+        if ledger is not None:
+            ledger.set_monitored(
+                self.organization_id, process_number, response_json)
         return response_json
 
-    def remove_monitor_process(self, process_number: str) -> bool:
+    def remove_monitor_process(self, process_number: str,
+                               refresh: bool = False) -> bool:
         """Remove process from monitoring.
 
+        If client has a monitoring ledger and the process is recorded as
+        not monitored, True is returned without calling the API.
+
         Args:
             process_number (str):
                 Process document.
+            refresh (bool): = False
+                Call the API even if ledger has the process as not
+                monitored.
         Raises:
             TratumAPIProblemAPIException:
                 Raise error if get forbiden status.
@@ -194,17 +626,23 @@ class TratumAPI:
             bool: True if operation had success, otherwise false.
         """
         url = (
-            "https://search.tratum.com.br/v1/organization/" +
+            self.base_url + "/v1/organization/" +
             "{organization_id}/process/{process_number}/INACTIVE").format(
             organization_id=self.organization_id,
             process_number=process_number)
-        headers = {
-            'Authorization': 'Bearer {token}'.format(token=self.token)}
+        ledger = self.monitoring_ledger
+        if ledger is not None and not refresh:
+            entry = ledger.get(self.organization_id, process_number)
+            if entry is not None and not entry["monitored"]:
+                self._emit_cache_hit("remove_monitor")
+                return True
+
+        response = self._request(
+            "remove_monitor", "PUT", url, parse_json=True, json={})
         try:
-            response = self.session.put(url, headers=headers, json={})
             response.raise_for_status()
         except Exception:
-            response_json = response.json()
+            response_json = self._json(response)
             obs = response_json.get('obs', "")
             msg = (
                 "Error related to internal problems in APIs "
@@ -213,37 +651,150 @@ class TratumAPI:
                 message=msg, payload={
                     "process_number": process_number,
                     "status_code": response.status_code,
+                    "retries": response.retries,
                     "response_payload": response_json})
 
-        response_json = response.json()
+        response_json = self._json(response)
         operation_success = response_json.get("sucess")
+        if ledger is not None and operation_success:
+            ledger.set_unmonitored(self.organization_id, process_number)
         return operation_success
 
-    def get_process_detail(self, process_number: str):
+    def _bulk(self, func, process_numbers: Iterable[str],
+              max_workers: int) -> Iterator[dict]:
+        """Call `func` for each process number yielding per-item results.
+
+        Errors are converted to dictionary and do not stop the batch.
+        """
+        results = bounded_map(
+            func, process_numbers, max_workers=max_workers)
+        for process_number, result, exception in results:
+            if exception is None:
+                yield {
+                    "process_number": process_number,
+                    "success": True,
+                    "result": result}
+            else:
+                yield {
+                    "process_number": process_number,
+                    "success": False,
+                    "error": exception_to_dict(exception)}
+
+    def monitor_processes(self, process_numbers: Iterable[str],
+                          max_workers: int = 10,
+                          refresh: bool = False) -> Iterator[dict]:
+        """Send processes to monitoring in parallel.
+
+        Processes are sent using a thread pool that shares the client
+        session, results are yielded as soon as each call finishes. An
+        error on one process does not stop the others.
+
+        Args:
+            process_numbers (Iterable[str]):
+                Process documents, consumed lazily.
+            max_workers (int): = 10
+                Number of parallel requests.
+            refresh (bool): = False
+                Call the API even for processes the monitoring ledger has
+                as monitored.
+
+        Returns:
+            Iterator of dictionaries with keys `process_number`, `success`
+            and `result` with `monitor_process` return if success or
+            `error` with `TratumAPIException.to_dict()` if failed.
+        """
+        func = self.monitor_process
+        if refresh:
+            func = functools.partial(func, refresh=True)
+        return self._bulk(func, process_numbers, max_workers=max_workers)
+
+    def remove_monitor_processes(self, process_numbers: Iterable[str],
+                                 max_workers: int = 10,
+                                 refresh: bool = False) -> Iterator[dict]:
+        """Remove processes from monitoring in parallel.
+
+        Args:
+            process_numbers (Iterable[str]):
+                Process documents, consumed lazily.
+            max_workers (int): = 10
+                Number of parallel requests.
+            refresh (bool): = False
+                Call the API even for processes the monitoring ledger has
+                as not monitored.
+
+        Returns:
+            Iterator of dictionaries with keys `process_number`, `success`
+            and `result` with `remove_monitor_process` return if success or
+            `error` with `TratumAPIException.to_dict()` if failed.
+        """
+        func = self.remove_monitor_process
+        if refresh:
+            func = functools.partial(func, refresh=True)
+        return self._bulk(func, process_numbers, max_workers=max_workers)
+
+    def get_process_detail(self, process_number: str,
+                           last_update: str = None,
+                           use_cache: bool = True,
+                           as_model: bool = False,
+                           revalidate: bool = False):
         """Fetch process details in Tratum API.
 
+        If client has a cache, fresh entries are returned without calling
+        the API and stale ones are revalidated.
+
         Args:
             process_number (str):
                 Process document.
+            last_update (str): = None
+                Expected `last_update` of the process, cached details with
+                other `last_update` are fetched again.
+            use_cache (bool): = True
+                Set False to bypass the cache and fetch from API.
+            as_model (bool): = False
+                Return a `ProcessDetail` instead of a dictionary, it uses
+                much less memory when many details are kept.
+            revalidate (bool): = False
+                Revalidate cached details even if fresh, the API answers
+                304 without body if the process did not change.
         """
         url = (
-            "https://search.tratum.com.br/v1/" +
+            self.base_url + "/v1/" +
             "process/{organization_id}/{process_number}").format(
             organization_id=self.organization_id,
             process_number=process_number,
         )
-        headers = {
-            'Authorization': 'Bearer {token}'.format(token=self.token)
-        }
-        response = self.session.get(url, headers=headers)
-        response_json = response.json()
+        cache = self.cache if use_cache else None
+        headers = {}
+        cache_status = None
+        if cache is not None:
+            entry, is_fresh = cache.lookup(
+                self.organization_id, process_number,
+                last_update=last_update, revalidate=revalidate)
+            if is_fresh:
+                self._emit_cache_hit("process_detail")
+                return self._process_detail_result(entry.detail(), as_model)
+            cache_status = "miss" if entry is None else "stale"
+            if entry is not None and last_update is None:
+                headers = entry.conditional_headers()
+
+        response = self._request(
+            "process_detail", "GET", url, parse_json=True,
+            cache_status=cache_status, headers=headers)
+        if response.status_code == 304 and headers:
+            cache.revalidated(self.organization_id, process_number, entry)
+            detail = entry.detail()
+            self._index_detail(process_number, detail)
+            return self._process_detail_result(detail, as_model)
+
+        response_json = self._json(response)
         if response.status_code != 200:
             raise TratumAPIProblemAPIException(
                 message="error related to internal problems in APIs "
                         "or services.",
                 payload={
                     "status_code": response.status_code,
-                    "status_description": response_json.get('status', None)
+                    "status_description": response_json.get('status', None),
+                    "retries": response.retries,
                 }
             )
         elif not self.is__process_number__valid(process_number):
@@ -253,26 +804,56 @@ class TratumAPI:
                     "process_number": process_number,
                 }
             )
-        else:
-            return response_json
 
-    def get_process_document_url(self, document_url: str) -> str:
+        if self.cache is not None:
+            self.cache.store(
+                self.organization_id, process_number, response_json,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'))
+        self._index_detail(process_number, response_json)
+        return self._process_detail_result(response_json, as_model)
+
+    def _index_detail(self, process_number: str, detail: dict):
+        """Ingest detail at the search index, if client has one."""
+        if self.search_index is not None:
+            self.search_index.ingest(
+                self.organization_id, process_number, detail)
+
+    @staticmethod
+    def _process_detail_result(detail: dict, as_model: bool):
+        """Return detail as dictionary or as `ProcessDetail`."""
+        if as_model:
+            return ProcessDetail(detail)
+        return detail
+
+    def get_process_document_url(self, document_url: str,
+                                 use_cache: bool = True) -> str:
         """Get a authenticated url to download the document.
 
         Args:
             document_url (str):
                 Url pointing to pdf.
+            use_cache (bool): = True
+                Set False to request a new URL even if a valid one is
+                cached.
 
         Returns:
             Return the AWS S3 authenticated URL.
         """
-        url = "https://search.tratum.com.br/v1/url?page={document_url}"\
+        if self.signed_url_cache is not None and use_cache:
+            s3_url = self.signed_url_cache.get(document_url)
+            if s3_url is not None:
+                self._emit_cache_hit("document_url")
+                return s3_url
+
+        url = self.base_url + "/v1/url?page={document_url}"\
             .format(document_url=document_url)
-        headers = {
-            'Authorization': 'Bearer {token}'.format(token=self.token)
-        }
+        cache_status = None
+        if self.signed_url_cache is not None:
+            cache_status = "miss"
+        response = self._request(
+            "document_url", "GET", url, cache_status=cache_status)
         try:
-            response = self.session.get(url, headers=headers)
             response.raise_for_status()
         except Exception:
             raise TratumAPIProblemAPIException(
@@ -280,15 +861,21 @@ class TratumAPI:
                         "or services.",
                 payload={
                     "status_code": response.status_code,
+                    "retries": response.retries,
                 }
             )
 
         s3_url = response.text
+        if self.signed_url_cache is not None:
+            self.signed_url_cache.set(document_url, s3_url)
         return s3_url
 
     def download_process_document(self, document_url: str) -> bytes:
         """Download pdf file from process.
 
+        If client has a document store, stored documents are read from
+        disk and downloaded ones are added to the store.
+
         Args:
             document_url (str):
                 Url pointing to pdf.
@@ -296,10 +883,34 @@ class TratumAPI:
         Returns:
             Return the content of the document at the URL.
         """
+        if self.document_store is not None:
+            stored_path = self.document_store.get_path(document_url)
+            if stored_path is not None:
+                try:
+                    with open(stored_path, "rb") as file:
+                        content = file.read()
+                except FileNotFoundError:
+                    # Evicted by other process meanwhile, download it again
+                    pass
+                else:
+                    self._emit_cache_hit("document_download")
+                    return content
+
         authenticated_url = self.get_process_document_url(
             document_url=document_url)
+        response = self._request(
+            "document_download", "GET", authenticated_url,
+            authenticate=False)
+        # Cached presigned URL may have been revoked, ask for a new one
+        # once
+        if response.status_code == 403 and self.signed_url_cache is not None:
+            self.signed_url_cache.invalidate(document_url)
+            authenticated_url = self.get_process_document_url(
+                document_url=document_url, use_cache=False)
+            response = self._request(
+                "document_download", "GET", authenticated_url,
+                authenticate=False)
         try:
-            response = self.session.get(authenticated_url)
             response.raise_for_status()
         except Exception:
             msg = (
@@ -307,5 +918,335 @@ class TratumAPI:
                 "[{status_code}]").format(status_code=response.status_code)
             raise TratumAPIProblemAPIException(
                 message=msg,
-                payload={"status_code": response.status_code})
+                payload={
+                    "status_code": response.status_code,
+                    "retries": response.retries})
+        if self.document_store is not None:
+            self.document_store.add(document_url, response.content)
         return response.content
+
+    def get_process_document_path(self, document_url: str,
+                                  chunk_size: int = 1024 * 1024,
+                                  max_resume_attempts: int = 3) -> str:
+        """Local path of a document, streaming it to the store if missing.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+            chunk_size (int): = 1 MB
+                Size of the chunks read from the connection.
+            max_resume_attempts (int): = 3
+                Number of times the download is resumed before raising.
+
+        Returns:
+            str: Path of the document at the document store, it must not
+            be modified.
+
+        Raises:
+            ValueError:
+                Raise error if client has no document store.
+        """
+        if self.document_store is None:
+            raise ValueError(
+                "client must have a document_store to return local paths")
+        stored_path = self.document_store.get_path(document_url)
+        if stored_path is not None:
+            self._emit_cache_hit("document_download")
+            return stored_path
+        chunks = self.stream_process_document(
+            document_url=document_url, chunk_size=chunk_size,
+            max_resume_attempts=max_resume_attempts)
+        return self.document_store.add_stream(document_url, chunks)
+
+    def open_process_document(self, document_url: str):
+        """Memory map a document, streaming it to the store if missing.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+
+        Returns:
+            mmap.mmap: Read-only map of the document that must be closed by
+            the caller, content is not copied to memory. Empty documents
+            return an empty `io.BytesIO`, see `DocumentStore.open`.
+
+        Raises:
+            ValueError:
+                Raise error if client has no document store.
+        """
+        self.get_process_document_path(document_url)
+        document = self.document_store.open(document_url)
+        if document is None:
+            # Evicted by other process meanwhile, download it again
+            self.get_process_document_path(document_url)
+            document = self.document_store.open(document_url)
+        return document
+
+    def stream_process_document(self, document_url: str,
+                                chunk_size: int = 1024 * 1024,
+                                max_resume_attempts: int = 3
+                                ) -> Iterator[bytes]:
+        """Download pdf file from process as an iterator of chunks.
+
+        Only one chunk is kept in memory. If connection drops during the
+        download it is resumed from the last received byte using HTTP
+        Range requests.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+            chunk_size (int): = 1 MB
+                Size of the chunks read from the connection.
+            max_resume_attempts (int): = 3
+                Number of times the download is resumed before raising.
+
+        Returns:
+            Iterator of bytes with the content of the document.
+        """
+        authenticated_url = self.get_process_document_url(
+            document_url=document_url)
+        offset = 0
+        attempts = 0
+        is_url_renewed = False
+        while True:
+            # Ask for identity encoding so offsets match the file bytes
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = "bytes={offset}-".format(offset=offset)
+            response = None
+            try:
+                response = self._request(
+                    "document_download", "GET", authenticated_url,
+                    authenticate=False, headers=headers, stream=True)
+                # Cached presigned URL may have been revoked, ask for a
+                # new one once
+                if response.status_code == 403 and not is_url_renewed:
+                    is_url_renewed = True
+                    if self.signed_url_cache is not None:
+                        self.signed_url_cache.invalidate(document_url)
+                        authenticated_url = self.get_process_document_url(
+                            document_url=document_url, use_cache=False)
+                        continue
+                if response.status_code >= 400:
+                    msg = (
+                        "Error when downloading file from AWS. Status code: "
+                        "[{status_code}]").format(
+                        status_code=response.status_code)
+                    raise TratumAPIProblemAPIException(
+                        message=msg,
+                        payload={
+                            "status_code": response.status_code,
+                            "retries": response.retries})
+
+                # Server ignored Range header and is sending the whole
+                # file again, received bytes must be skipped
+                skip = offset if response.status_code != 206 else 0
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk[skip:]
+                        skip = 0
+                    offset += len(chunk)
+                    yield chunk
+                return
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                attempts += 1
+                if attempts > max_resume_attempts:
+                    msg = (
+                        "Error when downloading file from AWS, connection "
+                        "dropped after [{offset}] bytes").format(
+                        offset=offset)
+                    raise TratumAPIProblemAPIException(
+                        message=msg, payload={
+                            "document_url": document_url,
+                            "bytes_received": offset,
+                            "resume_attempts": attempts - 1,
+                            "error": repr(e)})
+            finally:
+                if response is not None:
+                    response.close()
+
+    def save_process_document(self, document_url: str,
+                              destination: Union[str, BinaryIO],
+                              chunk_size: int = 1024 * 1024,
+                              max_resume_attempts: int = 3,
+                              expected_checksum: str = None,
+                              checksum_algorithm: str = "sha256") -> dict:
+        """Download pdf file from process writing it to a file.
+
+        Content is streamed to the destination so memory use does not
+        depend on the document size. When destination is a path the file
+        is written to `<destination>.part` and renamed at the end, so a
+        partial download never replaces a complete file. If client has a
+        document store, the document is copied from it.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+            destination (str | BinaryIO):
+                Path of the file or a binary file-like object.
+            chunk_size (int): = 1 MB
+                Size of the chunks read from the connection.
+            max_resume_attempts (int): = 3
+                Number of times the download is resumed before raising.
+            expected_checksum (str): = None
+                Hex digest the content must match.
+            checksum_algorithm (str): = "sha256"
+                Algorithm from `hashlib` used to compute checksum.
+
+        Returns:
+            dict: Dictionary with `document_url`, `size` and `checksum` of
+            the downloaded content.
+
+        Raises:
+            TratumAPIDocumentChecksumException:
+                Raise error if checksum does not match `expected_checksum`.
+        """
+        stored_file = None
+        if self.document_store is not None:
+            # Download to the store once and copy from it
+            stored_path = self.get_process_document_path(
+                document_url=document_url, chunk_size=chunk_size,
+                max_resume_attempts=max_resume_attempts)
+            try:
+                stored_file = open(stored_path, "rb")
+            except FileNotFoundError:
+                # Evicted by other process meanwhile, download it again
+                stored_file = None
+        if stored_file is not None:
+            chunks = _iter_file_chunks(stored_file, chunk_size)
+        else:
+            chunks = self.stream_process_document(
+                document_url=document_url, chunk_size=chunk_size,
+                max_resume_attempts=max_resume_attempts)
+        checksum = hashlib.new(checksum_algorithm)
+        size = 0
+        if isinstance(destination, (str, os.PathLike)):
+            part_path = "{destination}.part".format(
+                destination=os.fspath(destination))
+            try:
+                with open(part_path, "wb") as file:
+                    for chunk in chunks:
+                        file.write(chunk)
+                        checksum.update(chunk)
+                        size += len(chunk)
+            except BaseException:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+        else:
+            for chunk in chunks:
+                destination.write(chunk)
+                checksum.update(chunk)
+                size += len(chunk)
+
+        hexdigest = checksum.hexdigest()
+        is_checksum_invalid = (
+            expected_checksum is not None and
+            hexdigest != expected_checksum.lower())
+        if isinstance(destination, (str, os.PathLike)):
+            if is_checksum_invalid:
+                os.remove(part_path)
+            else:
+                os.replace(part_path, destination)
+        if is_checksum_invalid:
+            msg = (
+                "Downloaded document checksum [{hexdigest}] does not match "
+                "expected [{expected}]").format(
+                hexdigest=hexdigest, expected=expected_checksum)
+            raise TratumAPIDocumentChecksumException(
+                message=msg, payload={
+                    "document_url": document_url,
+                    "checksum_algorithm": checksum_algorithm,
+                    "checksum": hexdigest,
+                    "expected_checksum": expected_checksum})
+        return {
+            "document_url": document_url,
+            "size": size,
+            "checksum": hexdigest}
+
+    def _download_to_dir(self, document_url: str, dest_dir: str,
+                         manifest: DocumentManifest,
+                         verify_checksum: bool) -> dict:
+        """Download one document to `dest_dir` unless already present."""
+        local_path = document_local_path(dest_dir, document_url)
+        if manifest.is_downloaded(
+                document_url, local_path, verify_checksum=verify_checksum):
+            entry = manifest.get(document_url)
+            return {
+                "document_url": document_url,
+                "path": local_path,
+                "skipped": True,
+                "size": entry["size"],
+                "checksum": entry["checksum"],
+                "seconds": 0.0,
+                "bytes_per_second": None}
+
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        start = time.monotonic()
+        result = self.save_process_document(
+            document_url=document_url, destination=local_path)
+        seconds = time.monotonic() - start
+        manifest.add(document_url, result["size"], result["checksum"])
+        result.update({
+            "path": local_path,
+            "skipped": False,
+            "seconds": seconds,
+            "bytes_per_second": result["size"] / seconds if seconds else None,
+        })
+        return result
+
+    def download_process_documents(self, process_number: str,
+                                   dest_dir: str, max_workers: int = 4,
+                                   verify_checksum: bool = False
+                                   ) -> Iterator[dict]:
+        """Download all documents of a process in parallel.
+
+        Documents are found at `documents` and `ref_docs` of the process
+        detail, signed URLs are resolved and files downloaded by a thread
+        pool. Size and checksum of downloaded files are kept at a manifest
+        inside `dest_dir`, files already downloaded are skipped.
+
+        Args:
+            process_number (str):
+                Process document.
+            dest_dir (str):
+                Directory where documents are saved keeping the document
+                URL structure.
+            max_workers (int): = 4
+                Number of parallel downloads.
+            verify_checksum (bool): = False
+                Compare checksum of existing files with manifest before
+                skipping them, otherwise only size is compared.
+
+        Returns:
+            Iterator of dictionaries with keys `document_url`, `path`,
+            `success` and, if success, `skipped`, `size`, `checksum`,
+            `seconds` and `bytes_per_second`; if failed `error` with
+            `TratumAPIException.to_dict()`.
+        """
+        process_detail = self.get_process_detail(process_number)
+        os.makedirs(dest_dir, exist_ok=True)
+        manifest = DocumentManifest(dest_dir)
+        download = functools.partial(
+            self._download_to_dir, dest_dir=dest_dir, manifest=manifest,
+            verify_checksum=verify_checksum)
+        results = bounded_map(
+            download, iter_document_urls(process_detail),
+            max_workers=max_workers)
+        try:
+            for document_url, result, exception in results:
+                if exception is None:
+                    result["success"] = True
+                    yield result
+                else:
+                    yield {
+                        "document_url": document_url,
+                        "path": document_local_path(dest_dir, document_url),
+                        "success": False,
+                        "error": exception_to_dict(exception)}
+        finally:
+            manifest.save()
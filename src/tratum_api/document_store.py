@@ -0,0 +1,292 @@
+"""Persistent content-addressed store of downloaded documents.
+
+Documents are saved once per content at `<root>/blobs/<aa>/<sha256>` and
+indexed by document URL at a SQLite database, so the same filing is not
+downloaded again by any client of the host. Blobs are written to a
+temporary file and renamed into place, so concurrent processes never see
+partial files. The least recently used blobs are removed when the store
+grows above `max_bytes`.
+"""
+import io
+import os
+import mmap
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+from typing import Iterable
+
+
+class DocumentStore:
+    """Size-bounded LRU store of documents shared by processes of a host.
+
+    Paths returned by `get_path` are valid until the blob is evicted,
+    objects returned by `open` keep working after eviction since the file
+    stays mapped.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 10 * 1024 ** 3,
+                 busy_timeout: float = 30):
+        """__init__.
+
+        Args:
+            root (str):
+                Directory of the store, created if it does not exist.
+            max_bytes (int): = 10 GB
+                Maximum total size of stored blobs.
+            busy_timeout (float): = 30
+                Seconds to wait for the index lock held by other
+                processes.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blobs_dir = os.path.join(root, "blobs")
+        self._tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self._blobs_dir, exist_ok=True)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(root, "index.sqlite3"), timeout=busy_timeout,
+            check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS blob ("
+            " digest TEXT PRIMARY KEY, size INTEGER NOT NULL,"
+            " accessed_at REAL NOT NULL)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS blob_accessed_at "
+            "ON blob (accessed_at)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS document ("
+            " document_url TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS document_digest "
+            "ON document (digest)")
+
+    def _blob_path(self, digest: str) -> str:
+        """Path of the blob with the digest."""
+        return os.path.join(self._blobs_dir, digest[:2], digest)
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list:
+        """Execute a statement returning all rows."""
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def get_path(self, document_url: str) -> str:
+        """Path of the stored document marking it as recently used.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+
+        Returns:
+            str: Path of the blob, None if document is not stored.
+        """
+        rows = self._execute(
+            "SELECT digest FROM document WHERE document_url = ?",
+            (document_url,))
+        if not rows:
+            self.misses += 1
+            return None
+        digest = rows[0][0]
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            # Blob was removed by other process, drop stale entries
+            self._remove_blobs([digest])
+            self.misses += 1
+            return None
+        self._execute(
+            "UPDATE blob SET accessed_at = ? WHERE digest = ?",
+            (time.time(), digest))
+        self.hits += 1
+        return path
+
+    def open(self, document_url: str):
+        """Memory map the stored document without copying it.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+
+        Returns:
+            mmap.mmap: Read-only map of the document, it must be closed
+            by the caller. Empty files can not be mapped, they return an
+            empty `io.BytesIO` with the same file interface (`read`,
+            `seek`, `close` and context manager). None if document is
+            not stored.
+        """
+        path = self.get_path(document_url)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return io.BytesIO(b"")
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, document_url: str) -> bool:
+        """Check if document is stored without marking it as used."""
+        return bool(self._execute(
+            "SELECT 1 FROM document WHERE document_url = ?",
+            (document_url,)))
+
+    def add_stream(self, document_url: str,
+                   chunks: Iterable[bytes]) -> str:
+        """Store a document consuming an iterator of chunks.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+            chunks (Iterable[bytes]):
+                Content of the document, for example the iterator of
+                `TratumAPI.stream_process_document`.
+
+        Returns:
+            str: Path of the stored blob.
+        """
+        tmp_path = os.path.join(self._tmp_dir, uuid.uuid4().hex)
+        checksum = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    checksum.update(chunk)
+                    size += len(chunk)
+            digest = checksum.hexdigest()
+            path = self._blob_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Same digest means same content, replacing a blob written by
+            # other process at the same time is harmless
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "INSERT INTO blob (digest, size, accessed_at) "
+                    "VALUES (?, ?, ?) ON CONFLICT (digest) "
+                    "DO UPDATE SET accessed_at = excluded.accessed_at",
+                    (digest, size, now))
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO document (document_url, digest) "
+                    "VALUES (?, ?)", (document_url, digest))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        self.evict(keep=digest)
+        return path
+
+    def add(self, document_url: str, content: bytes) -> str:
+        """Store document content returning the blob path."""
+        return self.add_stream(document_url, [content])
+
+    def remove(self, document_url: str):
+        """Remove document, its blob is kept if other URLs use it."""
+        self._execute(
+            "DELETE FROM document WHERE document_url = ?", (document_url,))
+
+    def _remove_blobs(self, digests: list):
+        """Remove blobs and documents pointing to them."""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for digest in digests:
+                    self._connection.execute(
+                        "DELETE FROM document WHERE digest = ?", (digest,))
+                    self._connection.execute(
+                        "DELETE FROM blob WHERE digest = ?", (digest,))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        for digest in digests:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    @property
+    def size(self) -> int:
+        """Total size of stored blobs in bytes."""
+        return self._execute("SELECT COALESCE(SUM(size), 0) FROM blob")[0][0]
+
+    def evict(self, keep: str = None) -> int:
+        """Remove least recently used blobs until size fits `max_bytes`.
+
+        Args:
+            keep (str): = None
+                Digest that must not be evicted, used to keep the blob
+                just added.
+
+        Returns:
+            int: Number of evicted blobs.
+        """
+        excess = self.size - self.max_bytes
+        if excess <= 0:
+            return 0
+        digests = []
+        rows = self._execute(
+            "SELECT digest, size FROM blob ORDER BY accessed_at")
+        for digest, size in rows:
+            if excess <= 0:
+                break
+            if digest == keep:
+                continue
+            digests.append(digest)
+            excess -= size
+        self._remove_blobs(digests)
+        self.evictions += len(digests)
+        return len(digests)
+
+    def clear_tmp(self, older_than: float = 3600) -> int:
+        """Remove temporary files left by interrupted processes.
+
+        Args:
+            older_than (float): = 3600
+                Only files not modified in this number of seconds are
+                removed, so writes in progress are kept.
+
+        Returns:
+            int: Number of removed files.
+        """
+        removed = 0
+        limit = time.time() - older_than
+        for entry in os.scandir(self._tmp_dir):
+            if entry.stat().st_mtime < limit:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        """Counters of store usage.
+
+        Returns:
+            dict: Number of `hits`, `misses`, `evictions`, stored
+            `documents`, `blobs` and total `size` in bytes.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "documents": self._execute(
+                "SELECT COUNT(*) FROM document")[0][0],
+            "blobs": self._execute("SELECT COUNT(*) FROM blob")[0][0],
+            "size": self.size}
+
+    def close(self):
+        """Close index connection."""
+        self._connection.close()
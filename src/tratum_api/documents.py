@@ -0,0 +1,149 @@
+"""Helpers to download documents attached to Tratum processes."""
+import os
+import json
+import hashlib
+import threading
+from typing import Iterator
+
+MANIFEST_FILENAME = ".tratum_manifest.json"
+"""Name of the file keeping size and checksum of downloaded documents."""
+
+
+def iter_document_urls(process_detail: dict) -> Iterator[str]:
+    """Find document URLs at `documents` and `ref_docs` of a process.
+
+    Both fields are walked recursively, strings starting with `Processos/`
+    or ending with `.pdf` are considered document URLs. Duplicated URLs
+    are yielded only once.
+
+    Args:
+        process_detail (dict):
+            Process detail returned by `get_process_detail`.
+
+    Returns:
+        Iterator of document URLs accepted by `download_process_document`.
+    """
+    seen = set()
+    stack = [
+        process_detail.get(key) for key in ("ref_docs", "documents")]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            is_document = (
+                value.startswith("Processos/") or
+                value.lower().endswith(".pdf"))
+            if is_document and value not in seen:
+                seen.add(value)
+                yield value
+        elif isinstance(value, dict):
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+
+
+def document_local_path(dest_dir: str, document_url: str) -> str:
+    """Path where a document is saved inside `dest_dir`.
+
+    The document URL structure is kept, parts that could point outside
+    `dest_dir` are removed.
+
+    Args:
+        dest_dir (str):
+            Directory where documents are saved.
+        document_url (str):
+            Url pointing to pdf.
+
+    Returns:
+        str: Path of the document file.
+    """
+    path = document_url.split("?")[0].split("://")[-1]
+    parts = [
+        part for part in path.replace("\\", "/").split("/")
+        if part not in ("", ".", "..")]
+    return os.path.join(dest_dir, *parts)
+
+
+def file_checksum(path: str, algorithm: str = "sha256",
+                  chunk_size: int = 1024 * 1024) -> str:
+    """Compute checksum of a file reading it in chunks.
+
+    Args:
+        path (str):
+            Path of the file.
+        algorithm (str): = "sha256"
+            Algorithm from `hashlib`.
+        chunk_size (int): = 1 MB
+            Size of the chunks read from the file.
+
+    Returns:
+        str: Hex digest of the file.
+    """
+    checksum = hashlib.new(algorithm)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+class DocumentManifest:
+    """Size and checksum of documents downloaded to a directory."""
+
+    def __init__(self, dest_dir: str):
+        """__init__.
+
+        Args:
+            dest_dir (str):
+                Directory where documents are saved, manifest is stored
+                at `MANIFEST_FILENAME` inside it.
+        """
+        self.path = os.path.join(dest_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._documents = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self._documents = json.load(file)
+
+    def is_downloaded(self, document_url: str, local_path: str,
+                      verify_checksum: bool = False) -> bool:
+        """Check if document was already downloaded to `local_path`.
+
+        Args:
+            document_url (str):
+                Url pointing to pdf.
+            local_path (str):
+                Path of the document file.
+            verify_checksum (bool): = False
+                If True the file checksum is computed and compared,
+                otherwise only the size is compared.
+
+        Returns:
+            bool: True if file exists and matches the manifest.
+        """
+        with self._lock:
+            entry = self._documents.get(document_url)
+        if entry is None or not os.path.exists(local_path):
+            return False
+        if os.path.getsize(local_path) != entry["size"]:
+            return False
+        if verify_checksum:
+            return file_checksum(local_path) == entry["checksum"]
+        return True
+
+    def get(self, document_url: str) -> dict:
+        """Manifest entry of the document, None if not downloaded."""
+        with self._lock:
+            return self._documents.get(document_url)
+
+    def add(self, document_url: str, size: int, checksum: str):
+        """Register a downloaded document."""
+        with self._lock:
+            self._documents[document_url] = {
+                "size": size, "checksum": checksum}
+
+    def save(self):
+        """Write manifest atomically to disk."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(self._documents, file)
+            os.replace(tmp_path, self.path)
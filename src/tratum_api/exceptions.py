@@ -50,3 +50,13 @@ class TratumAPIInvalidDocumentException(TratumAPIException):
 class TratumAPIProblemAPIException(TratumAPIException):
     """Error when requesting information to API."""
     pass
+
+
+class TratumAPIDocumentChecksumException(TratumAPIException):
+    """Error downloaded document does not match expected checksum."""
+    pass
+
+
+class TratumAPICircuitOpenException(TratumAPIProblemAPIException):
+    """Error end-point circuit breaker is open, request was not sent."""
+    pass
@@ -0,0 +1,298 @@
+"""Streaming export of process details for analytics.
+
+Process details are fetched with bounded concurrency, flattened to the
+scalar fields and written in batches, so memory is bounded by the batch
+size and not by the number of exported processes. Parquet and Arrow
+files need `pyarrow`, NDJSON files have no extra dependency.
+"""
+import os
+import json
+import datetime
+from typing import Iterable, Iterator
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.models import PROCESS_DETAIL_FIELDS, parse_bool
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Nested fields which are not exported as columns
+NESTED_FIELDS = (
+    "court_info", "ref_docs", "documents", "instances", "content_all")
+
+# Scalar fields of the process detail exported as columns
+EXPORT_FIELDS = tuple(
+    field for field in PROCESS_DETAIL_FIELDS if field not in NESTED_FIELDS)
+
+# Column types other than string, values that can not be converted are
+# exported as null
+_FIELD_TYPES = {
+    "has_resource": "bool",
+    "value_claim": "float",
+    "year_distribution_date": "int",
+    "month_distribution_date": "int",
+    "inactive_organization": "bool",
+    "has_session": "bool",
+    "has_session_video": "bool",
+}
+
+_FORMATS = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+def _to_number(value, number_type: type):
+    """Convert API value to int or float."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_string(value) -> str:
+    """Convert API value to string, nested values are JSON encoded."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return str(value)
+
+
+def flatten_process_detail(process_number: str, detail: dict,
+                           fields: tuple = EXPORT_FIELDS) -> dict:
+    """Flatten a process detail to a row of scalar values.
+
+    Args:
+        process_number (str):
+            Process document used to fetch the detail.
+        detail (dict):
+            Process detail returned by `get_process_detail`.
+        fields (tuple): = EXPORT_FIELDS
+            Fields exported as columns.
+
+    Returns:
+        dict: Row with `process_number` and the fields converted to the
+        column types.
+    """
+    row = {"process_number": process_number}
+    for field in fields:
+        value = detail.get(field)
+        field_type = _FIELD_TYPES.get(field)
+        if field_type == "bool":
+            value = parse_bool(value)
+        elif field_type == "int":
+            value = _to_number(value, int)
+        elif field_type == "float":
+            value = _to_number(value, float)
+        else:
+            value = _to_string(value)
+        row[field] = value
+    return row
+
+
+def export_schema(fields: tuple = EXPORT_FIELDS):
+    """Arrow schema of the exported rows."""
+    if pyarrow is None:
+        raise ImportError(
+            "pyarrow is required to export Parquet and Arrow files")
+    arrow_types = {
+        "bool": pyarrow.bool_(),
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+    }
+    columns = [("process_number", pyarrow.string())]
+    for field in fields:
+        arrow_type = arrow_types.get(
+            _FIELD_TYPES.get(field), pyarrow.string())
+        columns.append((field, arrow_type))
+    return pyarrow.schema(columns)
+
+
+class NDJSONWriter:
+    """Write rows as newline delimited JSON."""
+
+    def __init__(self, path: str, fields: tuple = EXPORT_FIELDS):
+        """__init__."""
+        self.columns = ("process_number",) + tuple(fields)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write_batch(self, rows: list):
+        """Write a batch of rows with `fields` columns in order."""
+        self._file.writelines(
+            json.dumps({
+                column: row.get(column) for column in self.columns},
+                ensure_ascii=False) + "\n"
+            for row in rows)
+
+    def close(self):
+        """Close file."""
+        self._file.close()
+
+
+class ParquetWriter:
+    """Write rows as Parquet, each batch is a row group."""
+
+    def __init__(self, path: str, fields: tuple = EXPORT_FIELDS,
+                 compression: str = "zstd"):
+        """__init__."""
+        self.schema = export_schema(fields)
+        self._writer = pyarrow.parquet.ParquetWriter(
+            path, self.schema, compression=compression)
+
+    def write_batch(self, rows: list):
+        """Write a batch of rows as a row group."""
+        self._writer.write_table(
+            pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        """Close file writing Parquet footer."""
+        self._writer.close()
+
+
+class ArrowWriter:
+    """Write rows as Arrow IPC file (Feather v2), one record batch each."""
+
+    def __init__(self, path: str, fields: tuple = EXPORT_FIELDS):
+        """__init__."""
+        self.schema = export_schema(fields)
+        self._sink = pyarrow.OSFile(path, "wb")
+        self._writer = pyarrow.ipc.new_file(self._sink, self.schema)
+
+    def write_batch(self, rows: list):
+        """Write a batch of rows as a record batch."""
+        self._writer.write_batch(
+            pyarrow.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        """Close file."""
+        self._writer.close()
+        self._sink.close()
+
+
+_WRITERS = {
+    "ndjson": NDJSONWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowWriter,
+}
+
+
+def iter_export_batches(tratum_api, process_numbers: Iterable[str],
+                        batch_size: int = 1000, max_workers: int = 8,
+                        fields: tuple = EXPORT_FIELDS,
+                        errors: dict = None) -> Iterator[list]:
+    """Fetch process details yielding batches of flattened rows.
+
+    Args:
+        tratum_api (TratumAPI):
+            Client used to fetch process details.
+        process_numbers (Iterable[str]):
+            Process numbers to be exported, consumed lazily.
+        batch_size (int): = 1000
+            Number of rows at each batch.
+        max_workers (int): = 8
+            Number of parallel requests.
+        fields (tuple): = EXPORT_FIELDS
+            Fields exported as columns.
+        errors (dict): = None
+            If informed, errors of processes that could not be fetched
+            are added to it by process number.
+
+    Returns:
+        Iterator of lists of rows, rows are not in the input order.
+    """
+    batch = []
+    results = bounded_map(
+        tratum_api.get_process_detail, process_numbers,
+        max_workers=max_workers)
+    for process_number, detail, exception in results:
+        if exception is not None:
+            if errors is not None:
+                errors[process_number] = exception_to_dict(exception)
+            continue
+        batch.append(flatten_process_detail(process_number, detail, fields))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_process_details(tratum_api, process_numbers: Iterable[str],
+                           path: str, file_format: str = None,
+                           batch_size: int = 1000, max_workers: int = 8,
+                           fields: tuple = EXPORT_FIELDS) -> dict:
+    """Export process details to a Parquet, Arrow or NDJSON file.
+
+    The file is written to a temporary `.part` path and renamed when the
+    export finishes, so readers never see a partial file.
+
+    Args:
+        tratum_api (TratumAPI):
+            Client used to fetch process details.
+        process_numbers (Iterable[str]):
+            Process numbers to be exported, consumed lazily.
+        path (str):
+            Path of the exported file.
+        file_format (str): = None
+            One of `parquet`, `arrow` or `ndjson`. If None it is inferred
+            from the file extension.
+        batch_size (int): = 1000
+            Number of rows kept in memory and written at once (Parquet row
+            group or Arrow record batch).
+        max_workers (int): = 8
+            Number of parallel requests.
+        fields (tuple): = EXPORT_FIELDS
+            Fields exported as columns.
+
+    Returns:
+        dict: Export summary with `path`, `rows`, `batches`,
+        `started_at`, `finished_at` and `errors` by process number.
+    """
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        file_format = _FORMATS.get(extension)
+    if file_format not in _WRITERS:
+        raise ValueError(
+            "unknown export format {file_format}, use parquet, arrow or "
+            "ndjson".format(file_format=file_format))
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    part_path = path + ".part"
+    writer = _WRITERS[file_format](part_path, fields=fields)
+    errors = {}
+    rows = 0
+    batches = 0
+    try:
+        for batch in iter_export_batches(
+                tratum_api, process_numbers, batch_size=batch_size,
+                max_workers=max_workers, fields=fields, errors=errors):
+            writer.write_batch(batch)
+            rows += len(batch)
+            batches += 1
+        if batches == 0 and file_format != "ndjson":
+            # Write an empty batch so the file has the schema
+            writer.write_batch([])
+    except BaseException:
+        writer.close()
+        os.remove(part_path)
+        raise
+    writer.close()
+    os.replace(part_path, path)
+    return {
+        "path": path,
+        "rows": rows,
+        "batches": batches,
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.datetime.now(
+            datetime.timezone.utc).isoformat(),
+        "errors": errors,
+    }
@@ -0,0 +1,334 @@
+"""Instrumentation of requests made by Tratum API clients.
+
+Clients call each hook with a `RequestEvent` when a call to an end-point
+finishes, including all its retries. Events are only created when the
+client has hooks, so instrumentation costs nothing when disabled.
+
+Adapters to export events as Prometheus metrics and OpenTelemetry spans
+are available when `prometheus_client` and `opentelemetry-api` are
+installed. `MetricsCollector` keeps simple per end-point statistics in
+memory without extra dependencies.
+"""
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+# Buckets of latency histograms in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0)
+
+
+class RequestEvent:
+    """Timings and outcome of a call to a Tratum API end-point.
+
+    Time attributes are in seconds and are summed over all attempts:
+
+    - `queue_time`: waiting for rate limits and concurrency slots.
+    - `response_time`: from sending the request to receiving headers,
+      includes connection setup, TLS and server time.
+    - `transfer_time`: reading the response body.
+    - `backoff_time`: sleeping between retries.
+    - `parse_time`: decoding the JSON body.
+    - `duration`: whole call, from start to the returned response.
+    """
+
+    __slots__ = (
+        "endpoint", "method", "url", "status_code", "error", "attempts",
+        "started_at", "duration", "queue_time", "response_time",
+        "transfer_time", "backoff_time", "parse_time", "bytes_sent",
+        "bytes_received", "cache", "_perf_started_at")
+
+    def __init__(self, endpoint: str, method: str = None, url: str = None,
+                 cache: str = None):
+        """__init__.
+
+        Args:
+            endpoint (str):
+                Name of the end-point, one of `ENDPOINTS`.
+            method (str): = None
+                HTTP method.
+            url (str): = None
+                URL of the request, query string is removed since it may
+                contain credentials of presigned URLs.
+            cache (str): = None
+                Cache outcome: `hit` (no request was made), `miss`,
+                `revalidated` (server answered 304) or `stale` (cached
+                entry was replaced). None if the end-point is not cached.
+        """
+        self.endpoint = endpoint
+        self.method = method
+        self.url = None if url is None else str(url).split('?', 1)[0]
+        self.status_code = None
+        self.error = None
+        self.attempts = 0
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.queue_time = 0.0
+        self.response_time = 0.0
+        self.transfer_time = 0.0
+        self.backoff_time = 0.0
+        self.parse_time = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.cache = cache
+        self._perf_started_at = time.perf_counter()
+
+    @property
+    def retries(self) -> int:
+        """Number of retries made after the first attempt."""
+        return max(self.attempts - 1, 0)
+
+    @property
+    def host(self) -> str:
+        """Host of the request."""
+        if self.url is None:
+            return None
+        return urlsplit(self.url).hostname
+
+    def finish(self):
+        """Set call duration."""
+        self.duration = time.perf_counter() - self._perf_started_at
+
+    def to_dict(self) -> dict:
+        """Convert event to dictionary."""
+        result = {
+            name: getattr(self, name) for name in self.__slots__
+            if not name.startswith("_")}
+        result["retries"] = self.retries
+        return result
+
+    def __repr__(self):
+        """__repr__."""
+        return (
+            "RequestEvent({endpoint}, status={status_code}, "
+            "duration={duration:.4f}, retries={retries})").format(
+            endpoint=self.endpoint, status_code=self.status_code,
+            duration=self.duration, retries=self.retries)
+
+
+def body_size(body) -> int:
+    """Size in bytes of a request body."""
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def emit(hooks: list, event: RequestEvent):
+    """Call hooks with the event, hook errors are logged and ignored."""
+    event.finish()
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Tratum API instrumentation hook failed")
+
+
+class MetricsCollector:
+    """Hook keeping per end-point counters and latencies in memory."""
+
+    def __init__(self, max_samples: int = 10000):
+        """__init__.
+
+        Args:
+            max_samples (int): = 10000
+                Latencies kept per end-point to compute percentiles, older
+                samples are discarded.
+        """
+        self.max_samples = max_samples
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: RequestEvent):
+        """Register event."""
+        with self._lock:
+            stats = self._endpoints.get(event.endpoint)
+            if stats is None:
+                stats = self._endpoints[event.endpoint] = {
+                    "count": 0, "errors": 0, "retries": 0,
+                    "bytes_sent": 0, "bytes_received": 0,
+                    "cache_hits": 0, "status_codes": {}, "latencies": []}
+            stats["count"] += 1
+            is_error = event.error is not None or (
+                event.status_code is not None and event.status_code >= 400)
+            stats["errors"] += is_error
+            stats["retries"] += event.retries
+            stats["bytes_sent"] += event.bytes_sent
+            stats["bytes_received"] += event.bytes_received
+            stats["cache_hits"] += event.cache == "hit"
+            status = stats["status_codes"]
+            status[event.status_code] = status.get(event.status_code, 0) + 1
+            latencies = stats["latencies"]
+            latencies.append(event.duration)
+            if len(latencies) > self.max_samples:
+                del latencies[:len(latencies) - self.max_samples]
+
+    def summary(self) -> dict:
+        """Statistics of each end-point.
+
+        Returns:
+            dict: For each end-point `count`, `errors`, `retries`,
+            `bytes_sent`, `bytes_received`, `cache_hits`, `status_codes`
+            and latency `p50`, `p99` and `max` in seconds.
+        """
+        result = {}
+        with self._lock:
+            for endpoint, stats in self._endpoints.items():
+                latencies = sorted(stats["latencies"])
+                summary = {
+                    key: value for key, value in stats.items()
+                    if key != "latencies"}
+                summary["status_codes"] = dict(stats["status_codes"])
+                summary["p50"] = _percentile(latencies, 0.50)
+                summary["p99"] = _percentile(latencies, 0.99)
+                summary["max"] = latencies[-1] if latencies else None
+                result[endpoint] = summary
+        return result
+
+    def reset(self):
+        """Clear statistics."""
+        with self._lock:
+            self._endpoints.clear()
+
+
+def _percentile(values: list, fraction: float) -> float:
+    """Nearest rank percentile of sorted values."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class PrometheusHook:
+    """Export events as Prometheus counters and histograms."""
+
+    def __init__(self, registry=None, namespace: str = "tratum_api",
+                 buckets: tuple = LATENCY_BUCKETS):
+        """__init__.
+
+        Args:
+            registry (prometheus_client.CollectorRegistry): = None
+                Registry of the metrics, if None the default registry.
+            namespace (str): = "tratum_api"
+                Prefix of the metric names.
+            buckets (tuple): = LATENCY_BUCKETS
+                Buckets of latency histograms in seconds.
+        """
+        if prometheus_client is None:
+            raise ImportError(
+                "prometheus_client is necessary to use PrometheusHook")
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        kwargs = {"namespace": namespace, "registry": registry}
+        self.requests = prometheus_client.Counter(
+            "requests", "Calls to Tratum API end-points.",
+            ["endpoint", "status"], **kwargs)
+        self.retries = prometheus_client.Counter(
+            "retries", "Retries of calls to Tratum API end-points.",
+            ["endpoint"], **kwargs)
+        self.cache = prometheus_client.Counter(
+            "cache", "Cache outcome of calls to Tratum API end-points.",
+            ["endpoint", "result"], **kwargs)
+        self.bytes_sent = prometheus_client.Counter(
+            "sent_bytes", "Bytes sent to Tratum API.",
+            ["endpoint"], **kwargs)
+        self.bytes_received = prometheus_client.Counter(
+            "received_bytes", "Bytes received from Tratum API.",
+            ["endpoint"], **kwargs)
+        self.duration = prometheus_client.Histogram(
+            "request_duration_seconds",
+            "Duration of calls to Tratum API end-points with retries.",
+            ["endpoint"], buckets=buckets, **kwargs)
+        self.phase = prometheus_client.Histogram(
+            "request_phase_seconds",
+            "Time spent at each phase of calls to Tratum API end-points.",
+            ["endpoint", "phase"], buckets=buckets, **kwargs)
+
+    def __call__(self, event: RequestEvent):
+        """Register event."""
+        status = event.error or str(event.status_code)
+        self.requests.labels(event.endpoint, status).inc()
+        if event.retries:
+            self.retries.labels(event.endpoint).inc(event.retries)
+        if event.cache is not None:
+            self.cache.labels(event.endpoint, event.cache).inc()
+        self.bytes_sent.labels(event.endpoint).inc(event.bytes_sent)
+        self.bytes_received.labels(event.endpoint).inc(event.bytes_received)
+        self.duration.labels(event.endpoint).observe(event.duration)
+        for phase in ("queue", "response", "transfer", "backoff", "parse"):
+            value = getattr(event, phase + "_time")
+            if value:
+                self.phase.labels(event.endpoint, phase).observe(value)
+
+
+class OpenTelemetryHook:
+    """Export events as OpenTelemetry client spans."""
+
+    def __init__(self, tracer=None):
+        """__init__.
+
+        Args:
+            tracer (opentelemetry.trace.Tracer): = None
+                Tracer used to create spans, if None the tracer of the
+                global provider.
+        """
+        if otel_trace is None:
+            raise ImportError(
+                "opentelemetry-api is necessary to use OpenTelemetryHook")
+        if tracer is None:
+            tracer = otel_trace.get_tracer("tratum_api")
+        self.tracer = tracer
+
+    def __call__(self, event: RequestEvent):
+        """Create a span of the event."""
+        start_time = int(event.started_at * 1e9)
+        attributes = {
+            "tratum.endpoint": event.endpoint,
+            "tratum.retries": event.retries,
+            "tratum.queue_time": event.queue_time,
+            "tratum.response_time": event.response_time,
+            "tratum.transfer_time": event.transfer_time,
+            "tratum.backoff_time": event.backoff_time,
+            "tratum.parse_time": event.parse_time,
+            "http.request.body.size": event.bytes_sent,
+            "http.response.body.size": event.bytes_received,
+        }
+        if event.method is not None:
+            attributes["http.request.method"] = event.method
+        if event.url is not None:
+            attributes["url.full"] = event.url
+            attributes["server.address"] = event.host
+        if event.status_code is not None:
+            attributes["http.response.status_code"] = event.status_code
+        if event.cache is not None:
+            attributes["tratum.cache"] = event.cache
+        if event.error is not None:
+            attributes["error.type"] = event.error
+
+        span = self.tracer.start_span(
+            "tratum_api {endpoint}".format(endpoint=event.endpoint),
+            kind=otel_trace.SpanKind.CLIENT, start_time=start_time,
+            attributes=attributes)
+        is_error = event.error is not None or (
+            event.status_code is not None and event.status_code >= 500)
+        if is_error:
+            span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR))
+        span.end(end_time=start_time + int(event.duration * 1e9))
@@ -0,0 +1,509 @@
+"""Crash-safe bulk jobs with a local SQLite journal.
+
+`JobRunner` runs `monitor_process` or `remove_monitor_process` over many
+process numbers recording the state of each item at a `JobJournal`:
+`pending`, `in_flight`, `done` or `failed` with the error as returned by
+`TratumAPIException.to_dict()`. When the worker dies the job is run again
+with the same id and only items not done are sent, failed items are sent
+again only when asked.
+
+Items are claimed and results are saved in batches, so the journal costs
+a few transactions per thousand items. Items claimed when the worker died
+may have reached Tratum API. Removing a monitor is idempotent, so they are
+sent again on resume. Monitoring is a POST that is not retried once sent,
+so on resume the state of these items is read from the process details
+first: processes already monitored are done without a new call.
+
+A job is run by one runner at a time. `JobRunner.run` takes a lease of
+the job renewed while items are claimed and saved, other runners of the
+same job fail until the lease expires, so they never reset items in
+flight of a live runner.
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Callable, Iterable, Iterator
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.models import parse_bool
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, IN_FLIGHT, DONE, FAILED)
+
+# Operations of the jobs mapped to `TratumAPI` methods
+OPERATIONS = {
+    "monitor": "monitor_process",
+    "remove_monitor": "remove_monitor_process",
+}
+
+
+class JobJournal:
+    """SQLite journal of bulk jobs and the state of their items."""
+
+    def __init__(self, path: str = ":memory:", busy_timeout: float = 30):
+        """__init__.
+
+        Args:
+            path (str): = ":memory:"
+                Path of the SQLite database file.
+            busy_timeout (float): = 30
+                Seconds to wait for the database lock held by other
+                processes.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS job ("
+            " job_id TEXT PRIMARY KEY, operation TEXT NOT NULL,"
+            " organization_id TEXT, created_at REAL NOT NULL,"
+            " finished_at REAL, runner_id TEXT, lease_expires_at REAL)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS job_item ("
+            " job_id TEXT NOT NULL, item TEXT NOT NULL,"
+            " state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+            " result TEXT, error TEXT, updated_at REAL,"
+            " PRIMARY KEY (job_id, item)) WITHOUT ROWID")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS job_item_state "
+            "ON job_item (job_id, state)")
+        self._connection.commit()
+
+    def create_job(self, job_id: str, operation: str,
+                   items: Iterable[str], organization_id=None) -> int:
+        """Create a job or add items to an existing one.
+
+        Items already at the job keep their state, so creating a job again
+        with the same items is harmless.
+
+        Args:
+            job_id (str):
+                Identifier of the job.
+            operation (str):
+                Operation of the job, one of `OPERATIONS`.
+            items (Iterable[str]):
+                Process documents, consumed lazily.
+            organization_id (int): = None
+                Organization of the job, checked when the job is run.
+
+        Returns:
+            int: Number of added items.
+
+        Raises:
+            ValueError:
+                Raise error if operation is unknown or the job exists
+                with other operation.
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(
+                "operation [{operation}] must be one of {operations}".format(
+                    operation=operation, operations=list(OPERATIONS)))
+        organization_id = (
+            None if organization_id is None else str(organization_id))
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT operation, organization_id FROM job "
+                "WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                self._connection.execute(
+                    "INSERT INTO job (job_id, operation, organization_id, "
+                    "created_at) VALUES (?, ?, ?, ?)",
+                    (job_id, operation, organization_id, now))
+            elif row != (operation, organization_id):
+                raise ValueError(
+                    "job [{job_id}] exists with operation [{operation}] "
+                    "and organization [{organization_id}]".format(
+                        job_id=job_id, operation=row[0],
+                        organization_id=row[1]))
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO job_item "
+                "(job_id, item, state, updated_at) VALUES (?, ?, ?, ?)",
+                ((job_id, item, PENDING, now) for item in items))
+            added = self._connection.total_changes - before
+            if added:
+                self._connection.execute(
+                    "UPDATE job SET finished_at = NULL WHERE job_id = ?",
+                    (job_id,))
+        return added
+
+    def get_job(self, job_id: str) -> dict:
+        """Job attributes and item counts, None if job does not exist."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT operation, organization_id, created_at, finished_at "
+                "FROM job WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": job_id,
+            "operation": row[0],
+            "organization_id": row[1],
+            "created_at": row[2],
+            "finished_at": row[3],
+            "counts": self.counts(job_id)}
+
+    def jobs(self) -> list:
+        """Identifiers of the jobs, oldest first."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT job_id FROM job ORDER BY created_at").fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self, job_id: str) -> dict:
+        """Number of items of the job at each state."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM job_item WHERE job_id = ? "
+                "GROUP BY state", (job_id,)).fetchall()
+        result = dict.fromkeys(STATES, 0)
+        result.update(rows)
+        return result
+
+    def _set_state(self, job_id: str, from_state: str,
+                   to_state: str) -> int:
+        """Move all items of the job between states."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE job_item SET state = ?, updated_at = ? "
+                "WHERE job_id = ? AND state = ?",
+                (to_state, time.time(), job_id, from_state))
+            return cursor.rowcount
+
+    def acquire_lease(self, job_id: str, runner_id: str,
+                      lease_timeout: float) -> bool:
+        """Take or renew the lease of the job for a runner.
+
+        Args:
+            job_id (str):
+                Identifier of the job.
+            runner_id (str):
+                Identifier of the runner.
+            lease_timeout (float):
+                Seconds until the lease expires if not renewed.
+
+        Returns:
+            bool: True if runner holds the lease, False if other runner
+            holds a lease not expired.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE job SET runner_id = ?, lease_expires_at = ? "
+                "WHERE job_id = ? AND (runner_id IS NULL OR runner_id = ? "
+                "OR lease_expires_at < ?)",
+                (runner_id, now + lease_timeout, job_id, runner_id, now))
+            return bool(cursor.rowcount)
+
+    def release_lease(self, job_id: str, runner_id: str):
+        """Release the lease of the job if held by the runner."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE job SET runner_id = NULL, lease_expires_at = NULL "
+                "WHERE job_id = ? AND runner_id = ?", (job_id, runner_id))
+
+    def reset_in_flight(self, job_id: str) -> int:
+        """Mark items left in flight by a dead worker as pending."""
+        return self._set_state(job_id, IN_FLIGHT, PENDING)
+
+    def retry_failed(self, job_id: str) -> int:
+        """Mark failed items as pending to be sent again."""
+        return self._set_state(job_id, FAILED, PENDING)
+
+    def claim(self, job_id: str, limit: int) -> list:
+        """Mark up to `limit` pending items as in flight returning them."""
+        with self._lock, self._connection:
+            items = [row[0] for row in self._connection.execute(
+                "SELECT item FROM job_item WHERE job_id = ? AND state = ? "
+                "LIMIT ?", (job_id, PENDING, limit))]
+            self._connection.executemany(
+                "UPDATE job_item SET state = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE job_id = ? AND item = ?",
+                ((IN_FLIGHT, time.time(), job_id, item) for item in items))
+        return items
+
+    def record(self, job_id: str, rows: list):
+        """Save results of items in a single transaction.
+
+        Args:
+            job_id (str):
+                Identifier of the job.
+            rows (list):
+                Tuples with `(item, state, result, error)`, result and
+                error are JSON serializable or None.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE job_item SET state = ?, result = ?, error = ?, "
+                "updated_at = ? WHERE job_id = ? AND item = ?", ((
+                    state,
+                    None if result is None else json.dumps(
+                        result, default=str),
+                    None if error is None else json.dumps(
+                        error, default=str),
+                    now, job_id, item)
+                    for item, state, result, error in rows))
+
+    def finish(self, job_id: str) -> bool:
+        """Set job as finished if no item is pending or in flight."""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE job SET finished_at = ? WHERE job_id = ? AND "
+                "NOT EXISTS (SELECT 1 FROM job_item WHERE job_id = ? "
+                "AND state IN (?, ?))",
+                (time.time(), job_id, job_id, PENDING, IN_FLIGHT))
+            return bool(cursor.rowcount)
+
+    def items(self, job_id: str, state: str = None) -> Iterator[dict]:
+        """Items of the job with their state, result and error.
+
+        Args:
+            job_id (str):
+                Identifier of the job.
+            state (str): = None
+                Return only items at this state, one of `STATES`.
+
+        Returns:
+            Iterator of dictionaries with keys `process_number`, `state`,
+            `attempts`, `result` and `error`.
+        """
+        sql = (
+            "SELECT item, state, attempts, result, error FROM job_item "
+            "WHERE job_id = ?")
+        parameters = (job_id,)
+        if state is not None:
+            sql += " AND state = ?"
+            parameters += (state,)
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        for item, item_state, attempts, result, error in rows:
+            yield {
+                "process_number": item,
+                "state": item_state,
+                "attempts": attempts,
+                "result": None if result is None else json.loads(result),
+                "error": None if error is None else json.loads(error)}
+
+    def delete_job(self, job_id: str):
+        """Remove job and its items from the journal."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM job_item WHERE job_id = ?", (job_id,))
+            self._connection.execute(
+                "DELETE FROM job WHERE job_id = ?", (job_id,))
+
+    def close(self):
+        """Close database connection."""
+        self._connection.close()
+
+
+class JobRunner:
+    """Run bulk jobs of a client resuming from the journal."""
+
+    def __init__(self, tratum_api, journal: JobJournal,
+                 max_workers: int = 10, commit_every: int = 500,
+                 commit_interval: float = 1.0, lease_timeout: float = 300):
+        """__init__.
+
+        Args:
+            tratum_api (TratumAPI):
+                Client used to call Tratum API.
+            journal (JobJournal):
+                Journal of the jobs.
+            max_workers (int): = 10
+                Number of parallel requests.
+            commit_every (int): = 500
+                Number of items claimed and saved in each transaction.
+            commit_interval (float): = 1.0
+                Maximum seconds between saves of results, so a slow job
+                does not keep many finished items in memory.
+            lease_timeout (float): = 300
+                Seconds the lease of a running job is kept without being
+                renewed, after it a job left by a dead worker can be run
+                again. It must be longer than the slowest request.
+        """
+        self.tratum_api = tratum_api
+        self.journal = journal
+        self.max_workers = max_workers
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.lease_timeout = lease_timeout
+
+    def create(self, job_id: str, operation: str,
+               process_numbers: Iterable[str]) -> int:
+        """Create a job of the client organization.
+
+        Args:
+            job_id (str):
+                Identifier of the job.
+            operation (str):
+                `monitor` or `remove_monitor`.
+            process_numbers (Iterable[str]):
+                Process documents, consumed lazily.
+
+        Returns:
+            int: Number of added items.
+        """
+        return self.journal.create_job(
+            job_id, operation, process_numbers,
+            organization_id=self.tratum_api.organization_id)
+
+    def _claimed_items(self, job_id: str,
+                       runner_id: str) -> Iterator[str]:
+        """Claim pending items in batches as they are consumed.
+
+        Claiming stops if the lease was lost, items already claimed are
+        finished and saved.
+        """
+        while True:
+            if not self.journal.acquire_lease(
+                    job_id, runner_id, self.lease_timeout):
+                return
+            items = self.journal.claim(job_id, self.commit_every)
+            if not items:
+                return
+            yield from items
+
+    def run(self, job_id: str, retry_failed: bool = False,
+            callback: Callable = None) -> dict:
+        """Send items of the job not done yet.
+
+        Args:
+            job_id (str):
+                Identifier of a job created with `create`.
+            retry_failed (bool): = False
+                Send again items that failed on previous runs.
+            callback (Callable): = None
+                Function called with each result, a dictionary with keys
+                `process_number`, `success` and `result` or `error`, as
+                yielded by `TratumAPI.monitor_processes`.
+
+        Returns:
+            dict: Number of items of the job at each state.
+
+        Raises:
+            KeyError:
+                Raise error if the job does not exist.
+            ValueError:
+                Raise error if the job is of other organization or it is
+                being run by other runner.
+        """
+        job = self.journal.get_job(job_id)
+        if job is None:
+            raise KeyError("job [{job_id}] does not exist".format(
+                job_id=job_id))
+        organization_id = str(self.tratum_api.organization_id)
+        if job["organization_id"] not in (None, organization_id):
+            raise ValueError(
+                "job [{job_id}] is of organization [{job_org}], client "
+                "is of organization [{organization_id}]".format(
+                    job_id=job_id, job_org=job["organization_id"],
+                    organization_id=organization_id))
+
+        runner_id = uuid.uuid4().hex
+        if not self.journal.acquire_lease(
+                job_id, runner_id, self.lease_timeout):
+            raise ValueError(
+                "job [{job_id}] is being run by other runner".format(
+                    job_id=job_id))
+        try:
+            return self._run(
+                job_id, runner_id, job["operation"], retry_failed, callback)
+        finally:
+            self.journal.release_lease(job_id, runner_id)
+
+    def _is_monitored(self, process_number: str) -> bool:
+        """Check at Tratum API if the process is monitored."""
+        detail = self.tratum_api.get_process_detail(
+            process_number, use_cache=False)
+        inactive = parse_bool(detail.get("inactive_organization"))
+        if inactive is None:
+            raise ValueError(
+                "inactive_organization [{value}] is not a boolean".format(
+                    value=detail.get("inactive_organization")))
+        return not inactive
+
+    def _resume_monitor(self, job_id: str):
+        """Finish items in flight of a monitor job already monitored.
+
+        Monitoring request of these items may have been sent by the dead
+        runner. Items monitored at Tratum API are done with result None,
+        items whose state could not be read are failed and the others are
+        sent again.
+        """
+        items = [
+            item["process_number"]
+            for item in self.journal.items(job_id, state=IN_FLIGHT)]
+        rows = []
+        results = bounded_map(
+            self._is_monitored, items, max_workers=self.max_workers)
+        for process_number, monitored, exception in results:
+            if exception is not None:
+                rows.append((
+                    process_number, FAILED, None,
+                    exception_to_dict(exception)))
+            elif monitored:
+                rows.append((process_number, DONE, None, None))
+        if rows:
+            self.journal.record(job_id, rows)
+
+    def _run(self, job_id: str, runner_id: str, operation: str,
+             retry_failed: bool, callback: Callable) -> dict:
+        """Send items of the job holding its lease."""
+        func = getattr(self.tratum_api, OPERATIONS[operation])
+        # Items in flight were left by a dead runner, the lease is held
+        if operation == "monitor":
+            self._resume_monitor(job_id)
+        self.journal.reset_in_flight(job_id)
+        if retry_failed:
+            self.journal.retry_failed(job_id)
+
+        rows = []
+        committed_at = time.monotonic()
+        results = bounded_map(
+            func, self._claimed_items(job_id, runner_id),
+            max_workers=self.max_workers)
+        try:
+            for process_number, result, exception in results:
+                if exception is None:
+                    rows.append((process_number, DONE, result, None))
+                    item_result = {
+                        "process_number": process_number,
+                        "success": True,
+                        "result": result}
+                else:
+                    error = exception_to_dict(exception)
+                    rows.append((process_number, FAILED, None, error))
+                    item_result = {
+                        "process_number": process_number,
+                        "success": False,
+                        "error": error}
+
+                now = time.monotonic()
+                if (len(rows) >= self.commit_every or
+                        now - committed_at >= self.commit_interval):
+                    self.journal.record(job_id, rows)
+                    self.journal.acquire_lease(
+                        job_id, runner_id, self.lease_timeout)
+                    rows = []
+                    committed_at = now
+                if callback is not None:
+                    callback(item_result)
+        finally:
+            if rows:
+                self.journal.record(job_id, rows)
+        self.journal.finish(job_id)
+        return self.journal.counts(job_id)
+
+    def failed(self, job_id: str) -> Iterator[dict]:
+        """Failed items of the job with their errors."""
+        return self.journal.items(job_id, state=FAILED)
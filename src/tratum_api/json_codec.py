@@ -0,0 +1,79 @@
+"""Pluggable JSON decoders of Tratum API responses.
+
+Process details carry large `content_all` texts and decoding them with
+the standard library dominates CPU time of bulk workers. `orjson` or
+`ujson` are used when installed, both decode the raw body bytes without
+creating an intermediate string. `dumps` encodes compact JSON bytes with
+`orjson` when installed.
+"""
+import json
+from typing import Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Decoders in order of preference, None if library is not installed
+DECODERS = {
+    "orjson": None if orjson is None else orjson.loads,
+    "ujson": None if ujson is None else ujson.loads,
+    "json": json.loads,
+}
+
+
+def get_decoder(decoder=None) -> Callable:
+    """Return a function decoding JSON bytes.
+
+    Every decoder raises a `ValueError` subclass on invalid documents.
+
+    Args:
+        decoder (str | Callable): = None
+            Name of a decoder at `DECODERS` or a function receiving bytes.
+            If None the fastest installed decoder is used.
+
+    Returns:
+        Callable: Function receiving bytes and returning decoded value.
+
+    Raises:
+        ValueError:
+            Raise error if decoder name is unknown.
+        ImportError:
+            Raise error if decoder library is not installed.
+    """
+    if callable(decoder):
+        return decoder
+    if decoder is None:
+        return next(
+            loads for loads in DECODERS.values() if loads is not None)
+    if decoder not in DECODERS:
+        raise ValueError(
+            "decoder [{decoder}] must be one of {decoders}".format(
+                decoder=decoder, decoders=list(DECODERS)))
+    loads = DECODERS[decoder]
+    if loads is None:
+        raise ImportError(
+            "{decoder} is necessary to use it as JSON decoder".format(
+                decoder=decoder))
+    return loads
+
+
+def dumps(value) -> bytes:
+    """Serialize value as compact UTF-8 JSON bytes.
+
+    Args:
+        value:
+            JSON serializable value.
+
+    Returns:
+        bytes: JSON document, `orjson` is used when installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,243 @@
+"""Local ledger of the monitoring state of processes.
+
+`TratumAPI` with a `MonitoringLedger` does not call Tratum API to monitor
+a process already monitored, or to remove one not monitored, as recorded
+by previous calls. The ledger is kept at a SQLite database that may be
+shared by processes of the host. `reconcile` corrects drift with changes
+made by other systems using `inactive_organization` of process details.
+Process numbers are kept as their 20 digits, so formatted and plain
+numbers share the same entry.
+"""
+import json
+import time
+import sqlite3
+import threading
+from typing import Iterable, Iterator
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.models import parse_bool
+from tratum_api.validation import normalize_process_number
+
+
+def _key(process_number: str) -> str:
+    """Ledger key of the process, invalid numbers are kept as is."""
+    return normalize_process_number(process_number) or process_number
+
+
+class MonitoringLedger:
+    """SQLite index of monitored processes per organization."""
+
+    def __init__(self, path: str = ":memory:", max_age: float = None,
+                 busy_timeout: float = 30):
+        """__init__.
+
+        Args:
+            path (str): = ":memory:"
+                Path of the SQLite database file.
+            max_age (float): = None
+                Seconds an entry is trusted, older entries are unknown so
+                calls are sent to the API again. None to trust entries
+                until they are changed.
+            busy_timeout (float): = 30
+                Seconds to wait for the database lock held by other
+                processes.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False,
+            isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS monitoring ("
+            " organization_id TEXT NOT NULL, process_number TEXT NOT NULL,"
+            " monitored INTEGER NOT NULL, response TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (organization_id, process_number)) WITHOUT ROWID")
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list:
+        """Execute a statement returning all rows."""
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def get(self, organization_id, process_number: str) -> dict:
+        """Monitoring state of the process.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            process_number (str):
+                Process document.
+
+        Returns:
+            dict: Keys `monitored`, `response` with the response of the
+            monitoring call and `updated_at`. None if the process is not
+            at the ledger or its entry is older than `max_age`.
+        """
+        rows = self._execute(
+            "SELECT monitored, response, updated_at FROM monitoring "
+            "WHERE organization_id = ? AND process_number = ?",
+            (str(organization_id), _key(process_number)))
+        if not rows or (
+                self.max_age is not None and
+                time.time() - rows[0][2] > self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        monitored, response, updated_at = rows[0]
+        return {
+            "monitored": bool(monitored),
+            "response": None if response is None else json.loads(response),
+            "updated_at": updated_at}
+
+    def is_monitored(self, organization_id, process_number: str) -> bool:
+        """Check if process is monitored, None if state is unknown."""
+        entry = self.get(organization_id, process_number)
+        return None if entry is None else entry["monitored"]
+
+    def _executemany(self, sql: str, parameters: Iterable[tuple]):
+        """Execute a statement for each parameters in one transaction."""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(sql, parameters)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def set_many(self, organization_id, rows: Iterable[tuple]):
+        """Save monitoring states in a single transaction.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            rows (Iterable[tuple]):
+                Tuples with `(process_number, monitored, response)`,
+                response is JSON serializable or None.
+        """
+        now = time.time()
+        self._executemany(
+            "INSERT OR REPLACE INTO monitoring (organization_id, "
+            "process_number, monitored, response, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)", ((
+                str(organization_id), _key(process_number), int(monitored),
+                None if response is None else json.dumps(response), now)
+                for process_number, monitored, response in rows))
+
+    def set_monitored(self, organization_id, process_number: str,
+                      response: dict = None):
+        """Record process as monitored with the API response."""
+        self.set_many(organization_id, [(process_number, True, response)])
+
+    def set_unmonitored(self, organization_id, process_number: str):
+        """Record process as not monitored."""
+        self.set_many(organization_id, [(process_number, False, None)])
+
+    def forget(self, organization_id, process_numbers: Iterable[str]):
+        """Remove processes from the ledger, their state becomes unknown."""
+        self._executemany(
+            "DELETE FROM monitoring "
+            "WHERE organization_id = ? AND process_number = ?", (
+                (str(organization_id), _key(process_number))
+                for process_number in process_numbers))
+
+    def process_numbers(self, organization_id,
+                        monitored: bool = True) -> Iterator[str]:
+        """Process numbers of the organization with the state."""
+        rows = self._execute(
+            "SELECT process_number FROM monitoring "
+            "WHERE organization_id = ? AND monitored = ? "
+            "ORDER BY process_number",
+            (str(organization_id), int(monitored)))
+        return (row[0] for row in rows)
+
+    def count(self, organization_id, monitored: bool = True) -> int:
+        """Number of processes of the organization with the state."""
+        return self._execute(
+            "SELECT COUNT(*) FROM monitoring "
+            "WHERE organization_id = ? AND monitored = ?",
+            (str(organization_id), int(monitored)))[0][0]
+
+    def reconcile(self, tratum_api, process_numbers: Iterable[str] = None,
+                  max_workers: int = 8, commit_every: int = 500) -> dict:
+        """Refresh ledger with the state at Tratum API.
+
+        State is read from `inactive_organization` of process details
+        fetched bypassing the client cache, details where it is not a
+        boolean are kept at `errors` and their entries are not changed.
+        Changed entries are saved without response, so `monitor_process`
+        calls the API again for them.
+
+        Args:
+            tratum_api (TratumAPI):
+                Client of the organization.
+            process_numbers (Iterable[str]): = None
+                Processes to refresh, if None every process of the
+                organization at the ledger.
+            max_workers (int): = 8
+                Number of parallel requests.
+            commit_every (int): = 500
+                Number of states saved in each transaction.
+
+        Returns:
+            dict: Number of `checked` and `changed` processes and `errors`
+            mapping process numbers to `TratumAPIException.to_dict()`.
+        """
+        organization_id = tratum_api.organization_id
+        if process_numbers is None:
+            process_numbers = [
+                row[0] for row in self._execute(
+                    "SELECT process_number FROM monitoring "
+                    "WHERE organization_id = ?", (str(organization_id),))]
+
+        def fetch(process_number: str) -> dict:
+            """Fetch current detail bypassing client cache."""
+            return tratum_api.get_process_detail(
+                process_number, use_cache=False)
+
+        result = {"checked": 0, "changed": 0, "errors": {}}
+        rows = []
+        results = bounded_map(fetch, process_numbers, max_workers=max_workers)
+        try:
+            for process_number, detail, exception in results:
+                if exception is not None:
+                    result["errors"][process_number] = exception_to_dict(
+                        exception)
+                    continue
+                inactive = parse_bool(detail.get("inactive_organization"))
+                if inactive is None:
+                    result["errors"][process_number] = exception_to_dict(
+                        ValueError(
+                            "inactive_organization [{value}] is not a "
+                            "boolean".format(value=detail.get(
+                                "inactive_organization"))))
+                    continue
+                monitored = not inactive
+                entry = self._execute(
+                    "SELECT monitored, response FROM monitoring "
+                    "WHERE organization_id = ? AND process_number = ?",
+                    (str(organization_id), _key(process_number)))
+                result["checked"] += 1
+                if entry and bool(entry[0][0]) == monitored:
+                    response = entry[0][1]
+                    response = None if response is None else json.loads(
+                        response)
+                else:
+                    result["changed"] += 1
+                    response = None
+                rows.append((process_number, monitored, response))
+                if len(rows) >= commit_every:
+                    self.set_many(organization_id, rows)
+                    rows = []
+        finally:
+            if rows:
+                self.set_many(organization_id, rows)
+        return result
+
+    def close(self):
+        """Close database connection."""
+        self._connection.close()
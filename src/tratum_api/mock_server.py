@@ -0,0 +1,453 @@
+"""Local stand-in of Tratum API for offline tests and benchmarks.
+
+`MockTratumServer` answers the end-points used by the clients with
+generated payloads, it simulates latency, transient errors and payload
+sizes. Use it as a context manager and pass its `url` as `base_url`:
+
+    with MockTratumServer(latency=0.01) as server:
+        tratum_api = TratumAPI(..., base_url=server.url)
+"""
+import re
+import gzip
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import threading
+import collections
+import http.server
+from urllib.parse import urlsplit, parse_qs, quote
+from tratum_api.models import PROCESS_DETAIL_FIELDS
+from tratum_api.validation import (
+    is_process_number_valid, normalize_process_number)
+
+_ROUTES = (
+    ("login", "POST", re.compile(r"^/v1/login$")),
+    ("import_process", "POST", re.compile(
+        r"^/v2/importProcess/(?P<organization_id>[^/]+)/"
+        r"(?P<process_number>[^/]+)/?$")),
+    ("remove_monitor", "PUT", re.compile(
+        r"^/v1/organization/(?P<organization_id>[^/]+)/process/"
+        r"(?P<process_number>[^/]+)/INACTIVE$")),
+    ("process_detail", "GET", re.compile(
+        r"^/v1/process/(?P<organization_id>[^/]+)/"
+        r"(?P<process_number>[^/]+)$")),
+    ("document_url", "GET", re.compile(r"^/v1/url$")),
+    ("document_download", "GET", re.compile(r"^/documents/(?P<path>.+)$")),
+)
+
+# JSON responses smaller than this are not compressed
+_COMPRESS_MIN_SIZE = 1024
+
+
+def _base64url(data: bytes) -> str:
+    """Encode as base64url without padding."""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def make_token(ttl: float) -> str:
+    """Create an unique unsigned JWT expiring in `ttl` seconds."""
+    header = _base64url(b'{"alg":"none","typ":"JWT"}')
+    claims = _base64url(json.dumps({
+        "exp": int(time.time() + ttl), "jti": uuid.uuid4().hex}).encode())
+    return "{header}.{claims}.".format(header=header, claims=claims)
+
+
+class MockTratumServer:
+    """Threaded HTTP server imitating Tratum API and S3 downloads."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503,
+                 retry_after: float = None, detail_size: int = 20_000,
+                 documents_count: int = 5, document_size: int = 256_000,
+                 token_ttl: float = 3600, url_ttl: int = 3600,
+                 compression: bool = False, ignore_range: bool = False,
+                 seed: int = None):
+        """__init__.
+
+        Args:
+            host (str): = "127.0.0.1"
+                Address to listen.
+            port (int): = 0
+                Port to listen, 0 chooses a free port.
+            latency (float): = 0.0
+                Seconds added to every response.
+            latency_jitter (float): = 0.0
+                Random seconds between 0 and this value added to latency.
+            error_rate (float): = 0.0
+                Fraction of requests answered with `error_status`.
+            error_status (int): = 503
+                Status code of injected errors.
+            retry_after (float): = None
+                Retry-After header sent with injected errors.
+            detail_size (int): = 20_000
+                Approximated size in bytes of `content_all` at details.
+            documents_count (int): = 5
+                Number of documents listed at each process detail.
+            document_size (int): = 256_000
+                Size in bytes of downloaded documents.
+            token_ttl (float): = 3600
+                Seconds until login tokens expire.
+            url_ttl (int): = 3600
+                Seconds until presigned document URLs expire.
+            compression (bool): = False
+                Compress JSON responses with gzip when accepted by the
+                client, documents are never compressed.
+            ignore_range (bool): = False
+                Answer document downloads with the whole file and status
+                200 even when a Range is requested.
+            seed (int): = None
+                Seed of the random generator used for latency and errors.
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.detail_size = detail_size
+        self.documents_count = documents_count
+        self.document_size = document_size
+        self.token_ttl = token_ttl
+        self.url_ttl = url_ttl
+        self.compression = compression
+        self.ignore_range = ignore_range
+        self.requests = collections.Counter()
+        self.monitored = set()
+        self._random = random.Random(seed)  # NOQA
+        self._lock = threading.Lock()
+        self._tokens = set()
+        self._document = None
+        self._drops = []
+        self._signatures = set()
+        self._revoked_signatures = set()
+        self._thread = None
+
+        server = self
+
+        class Handler(_MockHandler):
+            mock = server
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server."""
+        host, port = self._server.server_address[:2]
+        return "http://{host}:{port}".format(host=host, port=port)
+
+    def start(self) -> "MockTratumServer":
+        """Start serving at a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and close its socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        """__enter__."""
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        """__exit__."""
+        self.stop()
+
+    def reset(self):
+        """Clear request counters and monitored processes."""
+        with self._lock:
+            self.requests.clear()
+            self.monitored.clear()
+            self._drops.clear()
+
+    def revoke_tokens(self):
+        """Reject every issued token, clients must login again."""
+        with self._lock:
+            self._tokens.clear()
+
+    def revoke_signed_urls(self):
+        """Answer 403 to downloads of presigned URLs issued until now."""
+        with self._lock:
+            self._revoked_signatures.update(self._signatures)
+            self._signatures.clear()
+
+    def _issue_signature(self) -> str:
+        """Create the signature of a presigned URL."""
+        signature = uuid.uuid4().hex
+        with self._lock:
+            self._signatures.add(signature)
+        return signature
+
+    def _is_revoked(self, signature: str) -> bool:
+        """Check if presigned URL was revoked."""
+        with self._lock:
+            return signature in self._revoked_signatures
+
+    def drop_downloads(self, after_bytes: int, count: int = 1):
+        """Close the connection of the next downloads mid-body.
+
+        Args:
+            after_bytes (int):
+                Bytes of the body sent before closing the connection.
+            count (int): = 1
+                Number of downloads dropped.
+        """
+        with self._lock:
+            self._drops.extend([after_bytes] * count)
+
+    def _next_drop(self) -> int:
+        """Bytes sent before dropping the download, None to send all."""
+        with self._lock:
+            return self._drops.pop(0) if self._drops else None
+
+    def _count(self, endpoint: str):
+        """Count a request to the end-point."""
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def _delay(self) -> float:
+        """Seconds to delay the response."""
+        with self._lock:
+            jitter = self._random.uniform(0, self.latency_jitter)
+        return self.latency + jitter
+
+    def _should_fail(self) -> bool:
+        """Decide if request is answered with an injected error."""
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _issue_token(self) -> str:
+        """Create a token accepted by the server."""
+        token = make_token(self.token_ttl)
+        with self._lock:
+            self._tokens.add(token)
+        return token
+
+    def _is_authorized(self, authorization: str) -> bool:
+        """Check Bearer token."""
+        if not authorization or not authorization.startswith("Bearer "):
+            return False
+        token = authorization[len("Bearer "):]
+        with self._lock:
+            return token in self._tokens
+
+    def document(self) -> bytes:
+        """Content of every downloaded document."""
+        document = self._document
+        if document is None or len(document) != self.document_size:
+            pattern = b"%PDF-1.4 mock tratum document\n"
+            repeat = self.document_size // len(pattern) + 1
+            self._document = (pattern * repeat)[:self.document_size]
+        return self._document
+
+    def process_detail(self, process_number: str) -> dict:
+        """Generate detail with every field returned by the API."""
+        digits = normalize_process_number(process_number)
+        detail = {field: None for field in PROCESS_DETAIL_FIELDS}
+        documents = [
+            {"name": "Documento {}".format(index),
+             "url": "Processos/401/{process_number}/doc-{index}.pdf".format(
+                 process_number=process_number, index=index)}
+            for index in range(self.documents_count)]
+        sentence = "Movimentação do processo {}. ".format(process_number)
+        detail.update({
+            "process": process_number,
+            "state": "SP",
+            "id": int(digits[-9:]) if digits is not None else None,
+            "court": "TJSP",
+            "status": "Ativo",
+            "value_claim": 1000.0,
+            "distribution_date": "10/01/2020",
+            "year_distribution_date": 2020,
+            "month_distribution_date": 1,
+            "last_update": "2024-05-01T10:00:00",
+            "inactive_organization": digits not in self.monitored,
+            "ref_docs": [document["url"] for document in documents],
+            "documents": documents,
+            "instances": [{"instance": 1, "movements": [
+                {"date": "01/01/2024", "text": sentence}] * 10}],
+            "content_all": sentence * (
+                self.detail_size // len(sentence) + 1),
+        })
+        return detail
+
+
+class _MockHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler of `MockTratumServer`."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without TCP_NODELAY the
+    # body waits for the delayed ACK of keep-alive clients
+    disable_nagle_algorithm = True
+    mock = None
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+    def _send(self, status: int, body: bytes = b"",
+              content_type: str = "application/json", headers: dict = None,
+              compress: bool = False):
+        """Send response with body, gzip compressed if `compress`."""
+        accept_encoding = self.headers.get("Accept-Encoding") or ""
+        is_compressed = (
+            compress and self.mock.compression and
+            len(body) >= _COMPRESS_MIN_SIZE and
+            "gzip" in accept_encoding.replace(" ", "").split(","))
+        if is_compressed:
+            body = gzip.compress(body, compresslevel=6)
+            headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, payload, headers: dict = None):
+        """Send JSON response."""
+        self._send(status, json.dumps(payload).encode('utf-8'),
+                   headers=headers, compress=True)
+
+    def _route(self):
+        """Find end-point of the request."""
+        path = urlsplit(self.path).path
+        for endpoint, method, pattern in _ROUTES:
+            match = pattern.match(path)
+            if match is not None and method == self.command:
+                return endpoint, match.groupdict()
+        return None, None
+
+    def _handle(self):
+        """Answer any request."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        endpoint, params = self._route()
+        if endpoint is None:
+            return self._send_json(404, {"status": "not found"})
+        self.mock._count(endpoint)
+
+        delay = self.mock._delay()
+        if delay:
+            time.sleep(delay)
+        if self.mock._should_fail():
+            headers = {}
+            if self.mock.retry_after is not None:
+                headers["Retry-After"] = str(self.mock.retry_after)
+            return self._send_json(
+                self.mock.error_status, {"status": "error"}, headers)
+
+        if endpoint == "login":
+            return self._login(body)
+        if endpoint == "document_download":
+            return self._document_download(params)
+        if not self.mock._is_authorized(self.headers.get("Authorization")):
+            return self._send_json(401, {"status": "unauthorized"})
+        return getattr(self, "_" + endpoint)(params)
+
+    do_GET = do_POST = do_PUT = _handle  # NOQA
+
+    def _login(self, body: bytes):
+        """Answer login, any e-mail and password are accepted."""
+        try:
+            credentials = json.loads(body or b"{}")
+        except ValueError:
+            credentials = {}
+        if not credentials.get("email") or not credentials.get("password"):
+            return self._send(400, b"missing credentials", "text/plain")
+        return self._send_json(200, {"token": self.mock._issue_token()})
+
+    def _import_process(self, params: dict):
+        """Answer process monitoring."""
+        process_number = params["process_number"]
+        if not is_process_number_valid(process_number):
+            return self._send_json(200, {
+                "status": "sucess",
+                "process": {"process": process_number, "status": "INVALID"}})
+        with self.mock._lock:
+            self.mock.monitored.add(normalize_process_number(process_number))
+        return self._send_json(200, {
+            "status": "sucess",
+            "process": {"process": process_number, "status": "VALID"}})
+
+    def _remove_monitor(self, params: dict):
+        """Answer process monitoring removal."""
+        with self.mock._lock:
+            self.mock.monitored.discard(
+                normalize_process_number(params["process_number"]))
+        return self._send_json(200, {"sucess": True})
+
+    def _process_detail(self, params: dict):
+        """Answer process detail with ETag revalidation."""
+        process_number = params["process_number"]
+        if not is_process_number_valid(process_number):
+            return self._send_json(404, {"status": "process not found"})
+        body = json.dumps(
+            self.mock.process_detail(process_number)).encode('utf-8')
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())  # NOQA
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304, headers={"ETag": etag})
+        return self._send(200, body, headers={"ETag": etag}, compress=True)
+
+    def _document_url(self, params: dict):
+        """Answer presigned URL of a document."""
+        query = parse_qs(urlsplit(self.path).query)
+        page = query.get("page", [""])[0]
+        signed_url = (
+            "{url}/documents/{page}?X-Amz-Date={date}"
+            "&X-Amz-Expires={expires}&X-Amz-Signature={signature}").format(
+            url=self.mock.url, page=quote(page),
+            date=time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()),
+            expires=self.mock.url_ttl,
+            signature=self.mock._issue_signature())
+        return self._send(200, signed_url.encode('utf-8'), "text/plain")
+
+    def _send_document(self, status: int, body: bytes,
+                       headers: dict = None):
+        """Send document, closing connection mid-body if a drop is set."""
+        drop_after = self.mock._next_drop()
+        if drop_after is None:
+            return self._send(status, body, "application/pdf", headers)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body[:drop_after])
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _document_download(self, params: dict):
+        """Answer document download supporting Range requests."""
+        query = parse_qs(urlsplit(self.path).query)
+        signature = query.get("X-Amz-Signature", [""])[0]
+        if self.mock._is_revoked(signature):
+            return self._send(403, b"<Error>AccessDenied</Error>",
+                              "application/xml")
+        document = self.mock.document()
+        range_header = self.headers.get("Range")
+        match = re.match(r"^bytes=(\d+)-$", range_header or "")
+        if match is None or self.mock.ignore_range:
+            return self._send_document(200, document)
+        start = int(match.group(1))
+        if start >= len(document):
+            return self._send(416, headers={
+                "Content-Range": "bytes */{}".format(len(document))})
+        return self._send_document(
+            206, document[start:], headers={
+                "Content-Range": "bytes {start}-{end}/{size}".format(
+                    start=start, end=len(document) - 1,
+                    size=len(document))})
@@ -0,0 +1,258 @@
+"""Typed and memory-efficient models of Tratum API responses."""
+import sys
+import zlib
+import datetime
+from typing import Optional
+from tratum_api.json_codec import dumps, get_decoder
+
+# Top-level keys of process details in the order returned by the API
+PROCESS_DETAIL_FIELDS = (
+    "process", "state", "id", "resource", "has_resource", "external_code",
+    "classe", "last_class_message", "court", "counrt_type", "value_claim",
+    "value_claim_str", "range_value_claim", "court_name", "judging_organ",
+    "status", "status_custom", "distribution_date",
+    "distribution_date_format", "year_distribution_date",
+    "month_distribution_date", "subject", "jurisdiction", "person_custom",
+    "last_update", "last_update_message", "inactive_organization",
+    "court_info", "ref_docs", "process_organization", "documents",
+    "has_session", "has_session_video", "process_id", "type_court",
+    "instances", "content_all")
+
+# Large subtrees kept serialized and decoded only when accessed
+HEAVY_FIELDS = ("content_all", "documents", "instances")
+
+# Fields parsed as datetime when accessed
+DATE_FIELDS = ("distribution_date", "last_update")
+
+# Strings up to this length are interned, they are mostly repeated values
+# as status, court and class names
+_INTERN_MAX_LENGTH = 64
+
+_DATE_FORMATS = (
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%Y-%m-%d %H:%M:%S")
+
+# Serialized heavy fields larger than this are compressed with zlib
+_COMPRESS_MIN_SIZE = 512
+
+# First byte of zlib streams, JSON documents never start with it
+_ZLIB_HEADER = 0x78
+
+_MISSING = object()
+
+# Decoder of serialized heavy fields, the fastest installed
+_loads = get_decoder()
+
+
+def parse_datetime(value: str) -> datetime.datetime:
+    """Parse dates returned by Tratum API.
+
+    Args:
+        value (str):
+            ISO 8601 date or Brazilian `dd/mm/yyyy` date with optional
+            time.
+
+    Returns:
+        datetime.datetime: Parsed date, None if value is empty or has an
+        unknown format.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_bool(value) -> Optional[bool]:
+    """Parse booleans returned by Tratum API.
+
+    Some fields, as `inactive_organization`, may come as strings or
+    numbers instead of JSON booleans.
+
+    Args:
+        value:
+            Boolean, number or string such as `"true"`, `"0"` or `"sim"`.
+
+    Returns:
+        bool: Parsed value, None if value is not a boolean.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("true", "1", "sim", "s"):
+            return True
+        if value in ("false", "0", "nao", "não", "n", ""):
+            return False
+    return None
+
+
+def _pack(value) -> bytes:
+    """Serialize heavy field compressing it when large."""
+    data = dumps(value)
+    if len(data) >= _COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def _unpack(data: bytes):
+    """Deserialize heavy field packed with `_pack`."""
+    if data[0] == _ZLIB_HEADER:
+        data = zlib.decompress(data)
+    return _loads(data)
+
+
+def _slot_name(field: str) -> str:
+    """Slot used to store the field."""
+    if field in HEAVY_FIELDS or field in DATE_FIELDS:
+        return "_" + field
+    return field
+
+
+def _heavy_property(field: str) -> property:
+    """Property decoding a heavy field at each access."""
+    slot = "_" + field
+
+    def getter(self):
+        value = getattr(self, slot, None)
+        return None if value is None else _unpack(value)
+    getter.__doc__ = (
+        "`{field}` decoded at each access, keep the value if it is used "
+        "many times.").format(field=field)
+    return property(getter)
+
+
+def _date_property(field: str) -> property:
+    """Property parsing a date field at each access."""
+    slot = "_" + field
+
+    def getter(self):
+        return parse_datetime(getattr(self, slot, None))
+    getter.__doc__ = "`{field}` parsed as datetime.".format(field=field)
+    return property(getter)
+
+
+class ProcessDetail:
+    """Process detail with slots and lazily decoded heavy subtrees.
+
+    Scalar fields are attributes with the same name as the API keys.
+    `content_all`, `documents` and `instances` are kept as compact JSON
+    bytes, compressed when large, and decoded when accessed.
+    `distribution_date` and `last_update` are parsed as datetime when
+    accessed. Use `to_dict` to get the same dictionary returned by
+    `get_process_detail`.
+    """
+
+    __slots__ = tuple(
+        _slot_name(field) for field in PROCESS_DETAIL_FIELDS) + (
+        "_keys", "_extra")
+
+    def __init__(self, detail: dict):
+        """__init__.
+
+        Args:
+            detail (dict):
+                Process detail returned by Tratum API.
+        """
+        extra = None
+        for field, value in detail.items():
+            if field not in _KNOWN_FIELDS:
+                if extra is None:
+                    extra = {}
+                extra[field] = value
+            elif field in HEAVY_FIELDS:
+                setattr(self, "_" + field, (
+                    None if value is None else _pack(value)))
+            else:
+                if (isinstance(value, str) and
+                        len(value) <= _INTERN_MAX_LENGTH):
+                    value = sys.intern(value)
+                setattr(self, _slot_name(field), value)
+        self._extra = extra
+        # Key order is kept only when it differs from the API order
+        keys = tuple(detail)
+        self._keys = None if keys == PROCESS_DETAIL_FIELDS else keys
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "ProcessDetail":
+        """Create model from JSON returned by the API."""
+        return cls(_loads(data))
+
+    def __getattr__(self, name: str):
+        """Fields missing at the API response are None."""
+        if name in _KNOWN_SLOTS:
+            return None
+        extra = object.__getattribute__(self, "_extra")
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError(name)
+
+    def get(self, field: str, default=None):
+        """Get raw value of a field as `dict.get`."""
+        value = self._raw(field)
+        return default if value is _MISSING else value
+
+    def _raw(self, field: str):
+        """Value of the field as returned by the API."""
+        if field not in _KNOWN_FIELDS:
+            if self._extra is not None and field in self._extra:
+                return self._extra[field]
+            return _MISSING
+        slot = _slot_name(field)
+        try:
+            value = object.__getattribute__(self, slot)
+        except AttributeError:
+            return _MISSING
+        if field in HEAVY_FIELDS and value is not None:
+            return _unpack(value)
+        return value
+
+    def keys(self) -> tuple:
+        """Fields present at the API response."""
+        if self._keys is None:
+            return PROCESS_DETAIL_FIELDS
+        return self._keys
+
+    def to_dict(self) -> dict:
+        """Dictionary equal to the one returned by the API."""
+        result = {}
+        for field in self.keys():
+            value = self._raw(field)
+            if value is not _MISSING:
+                result[field] = value
+        return result
+
+    def __eq__(self, other):
+        """Compare with other models or dictionaries."""
+        if isinstance(other, ProcessDetail):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        """__repr__."""
+        return "ProcessDetail(process={process})".format(
+            process=self.process)
+
+
+for _field in HEAVY_FIELDS:
+    setattr(ProcessDetail, _field, _heavy_property(_field))
+for _field in DATE_FIELDS:
+    setattr(ProcessDetail, _field, _date_property(_field))
+del _field
+
+_KNOWN_FIELDS = frozenset(PROCESS_DETAIL_FIELDS)
+_KNOWN_SLOTS = frozenset(ProcessDetail.__slots__) | _KNOWN_FIELDS
@@ -0,0 +1,276 @@
+"""Pool of Tratum API clients of many organizations (tenants).
+
+Clients are created on first use and login on their first request, so a
+worker serving thousands of tenants starts without any login. All
+clients share the same connection pool and a limit of requests in
+flight, idle clients are evicted and created again when needed.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable
+from tratum_api.data import TratumAPI
+from tratum_api.rate_limit import AdaptiveConcurrencyLimiter, RateLimiter
+from tratum_api.session import build_session
+
+# Arguments that identify the tenant, the other arguments are shared
+_CREDENTIAL_KEYS = (
+    "tratum_email", "tratum_password", "organization_id", "holder_id",
+    "cnpj")
+
+
+class TratumClientPool:
+    """Lazily created `TratumAPI` clients sharing connections and limits.
+
+    Example:
+        pool = TratumClientPool(max_concurrency=50)
+        pool.register(
+            "customer-a", tratum_email=..., tratum_password=...,
+            organization_id=..., holder_id=..., cnpj=...)
+        pool.get("customer-a").get_process_detail(process_number)
+    """
+
+    def __init__(self, credentials_loader: Callable = None,
+                 max_concurrency: int = 100, max_clients: int = None,
+                 idle_timeout: float = 15 * 60, session=None,
+                 rate_limiter: RateLimiter = None, **client_kwargs):
+        """__init__.
+
+        Args:
+            credentials_loader (Callable): = None
+                Function receiving a tenant id and returning a dictionary
+                with `tratum_email`, `tratum_password`, `organization_id`,
+                `holder_id` and `cnpj`, used for tenants not registered
+                with `register`. It may also return other `TratumAPI`
+                arguments for the tenant.
+            max_concurrency (int): = 100
+                Maximum number of requests in flight summing all tenants,
+                it is also the size of the shared connection pool. The
+                limit is decreased when API throttles requests. None to
+                not limit.
+            max_clients (int): = None
+                Maximum number of clients kept, least recently used are
+                evicted. None to not limit.
+            idle_timeout (float): = 15 minutes
+                Clients not used for this number of seconds are evicted.
+            session (requests.Session): = None
+                Session shared by all clients, if None a session is
+                created with `max_concurrency` connections per host.
+            rate_limiter (RateLimiter): = None
+                Rate limiter shared by all clients, if None one limiting
+                requests in flight to `max_concurrency` is created.
+            **client_kwargs:
+                Other arguments passed to every `TratumAPI`, such as
+                `cache`, `retry_policies` or `hooks`.
+        """
+        self.credentials_loader = credentials_loader
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._owns_session = session is None
+        if session is None:
+            session = build_session(
+                pool_maxsize=max_concurrency or 100,
+                pool_block=max_concurrency is not None)
+        self.session = session
+        if rate_limiter is None and max_concurrency is not None:
+            rate_limiter = RateLimiter(
+                concurrency=AdaptiveConcurrencyLimiter(
+                    initial_limit=max_concurrency,
+                    max_limit=max_concurrency))
+        self.rate_limiter = rate_limiter
+        self.client_kwargs = client_kwargs
+        self.created = 0
+        self.evicted = 0
+        self._tenants = {}
+        self._clients = OrderedDict()
+        self._last_used = {}
+        self._last_eviction = time.monotonic()
+        self._lock = threading.Lock()
+
+    def register(self, tenant_id, tratum_email: str, tratum_password: str,
+                 organization_id: int, holder_id: int, cnpj: str,
+                 **kwargs):
+        """Register credentials of a tenant, no login is made.
+
+        Registering a tenant again replaces its client on next `get`.
+
+        Args:
+            tenant_id:
+                Identifier of the tenant at the pool.
+            tratum_email (str):
+                E-mail for Tratum API.
+            tratum_password (str):
+                Password for Tratum API.
+            organization_id (int):
+                Organization ID in Tratum API.
+            holder_id (int):
+                Holder ID in Tratum API.
+            cnpj (str):
+                Organization document.
+            **kwargs:
+                Other `TratumAPI` arguments for this tenant.
+        """
+        credentials = dict(
+            tratum_email=tratum_email, tratum_password=tratum_password,
+            organization_id=organization_id, holder_id=holder_id,
+            cnpj=cnpj, **kwargs)
+        with self._lock:
+            self._tenants[tenant_id] = credentials
+            self._remove(tenant_id)
+
+    def unregister(self, tenant_id):
+        """Remove tenant credentials and client."""
+        with self._lock:
+            self._tenants.pop(tenant_id, None)
+            self._remove(tenant_id)
+
+    def _remove(self, tenant_id) -> bool:
+        """Remove client of the tenant, lock must be held."""
+        self._last_used.pop(tenant_id, None)
+        return self._clients.pop(tenant_id, None) is not None
+
+    def _credentials(self, tenant_id, credentials: dict) -> dict:
+        """Check credentials loading them if tenant is not registered.
+
+        It is called without the lock, so a slow `credentials_loader`
+        does not block clients of other tenants.
+        """
+        if credentials is None and self.credentials_loader is not None:
+            credentials = self.credentials_loader(tenant_id)
+        if credentials is None:
+            raise KeyError(
+                "tenant [{tenant_id}] is not registered".format(
+                    tenant_id=tenant_id))
+        missing = [key for key in _CREDENTIAL_KEYS if key not in credentials]
+        if missing:
+            raise KeyError(
+                "credentials of tenant [{tenant_id}] miss {missing}".format(
+                    tenant_id=tenant_id, missing=missing))
+        return credentials
+
+    def get(self, tenant_id) -> TratumAPI:
+        """Client of the tenant, created without login if necessary.
+
+        Credentials are loaded and the client is created outside the pool
+        lock. If other thread created the client of the same tenant
+        meanwhile, its client is returned.
+
+        Args:
+            tenant_id:
+                Identifier of the tenant registered or known by
+                `credentials_loader`.
+
+        Returns:
+            TratumAPI: Client that logs in on its first request.
+
+        Raises:
+            KeyError:
+                Raise error if tenant credentials are not found.
+        """
+        now = time.monotonic()
+        if now - self._last_eviction >= min(self.idle_timeout, 60):
+            self.evict_idle()
+
+        while True:
+            with self._lock:
+                client = self._clients.get(tenant_id)
+                if client is not None:
+                    self._clients.move_to_end(tenant_id)
+                    self._last_used[tenant_id] = now
+                    return client
+                registered = self._tenants.get(tenant_id)
+
+            kwargs = dict(self.client_kwargs)
+            kwargs.update(self._credentials(tenant_id, registered))
+            kwargs.setdefault("rate_limiter", self.rate_limiter)
+            new_client = TratumAPI(
+                session=self.session, lazy_login=True, **kwargs)
+
+            with self._lock:
+                if self._tenants.get(tenant_id) is not registered:
+                    # Registered again meanwhile, use new credentials
+                    continue
+                client = self._clients.get(tenant_id)
+                if client is None:
+                    client = new_client
+                    self._clients[tenant_id] = client
+                    self.created += 1
+                    if self.max_clients is not None:
+                        while len(self._clients) > self.max_clients:
+                            oldest = next(iter(self._clients))
+                            self._remove(oldest)
+                            self.evicted += 1
+                else:
+                    self._clients.move_to_end(tenant_id)
+                self._last_used[tenant_id] = now
+            return client
+
+    __getitem__ = get
+
+    def evict_idle(self, idle_timeout: float = None) -> int:
+        """Remove clients not used recently.
+
+        Clients being used by other threads keep working after eviction,
+        they are only dropped from the pool.
+
+        Args:
+            idle_timeout (float): = None
+                Seconds without use to evict a client, if None
+                `self.idle_timeout` is used.
+
+        Returns:
+            int: Number of evicted clients.
+        """
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        now = time.monotonic()
+        with self._lock:
+            self._last_eviction = now
+            idle = [
+                tenant_id for tenant_id, last_used in self._last_used.items()
+                if now - last_used >= idle_timeout]
+            for tenant_id in idle:
+                self._remove(tenant_id)
+            self.evicted += len(idle)
+        return len(idle)
+
+    def __len__(self) -> int:
+        """Number of clients in the pool."""
+        return len(self._clients)
+
+    def __contains__(self, tenant_id) -> bool:
+        """Check if tenant has a client in the pool."""
+        return tenant_id in self._clients
+
+    def stats(self) -> dict:
+        """Counters of pool usage.
+
+        Returns:
+            dict: Number of `clients` in the pool, `logged_in` clients,
+            `registered` tenants and clients `created` and `evicted`.
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            registered = len(self._tenants)
+        return {
+            "clients": len(clients),
+            "logged_in": sum(client.token is not None for client in clients),
+            "registered": registered,
+            "created": self.created,
+            "evicted": self.evicted}
+
+    def close(self):
+        """Drop clients and close the session if created by the pool."""
+        with self._lock:
+            self._clients.clear()
+            self._last_used.clear()
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        """__enter__."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """__exit__."""
+        self.close()
@@ -0,0 +1,321 @@
+"""Client-side rate limiting and adaptive concurrency for Tratum API.
+
+Limiters are thread-safe and can also be awaited from asyncio tasks, so
+the same object may be shared by `TratumAPI` and `AsyncTratumAPI`
+clients of a worker.
+"""
+import time
+import asyncio
+import threading
+import email.utils
+
+# Status codes that signal the API is overloaded
+THROTTLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value: str) -> float:
+    """Parse Retry-After header.
+
+    Args:
+        value (str):
+            Header value, seconds or HTTP date.
+
+    Returns:
+        float: Seconds to wait, None if header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+def _set_waiter_result(waiter: asyncio.Future):
+    """Wake a task waiting at `acquire_async` if it still waits."""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second.
+
+    Tokens are reserved when requested, so callers wait in the order they
+    arrived and the bucket never allows bursts above `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """__init__.
+
+        Args:
+            rate (float):
+                Tokens added to the bucket per second.
+            capacity (float): = None
+                Maximum number of tokens, it is the size of allowed bursts.
+                If None it is equal to `rate` (one second of requests).
+        """
+        if rate <= 0:
+            raise ValueError("rate must be greater than zero")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Reserve tokens returning seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """Block until tokens are available."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1):
+        """Wait without blocking the event loop until tokens are available."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit of requests in flight adjusted by AIMD.
+
+    The limit grows by `increase` for each window of `limit` successful
+    requests and is multiplied by `decrease_factor` when API answers with
+    throttling status codes or the connection fails. Retry-After headers
+    stop new requests until the informed time.
+    """
+
+    def __init__(self, initial_limit: int = 10, min_limit: int = 1,
+                 max_limit: int = 100, increase: float = 1.0,
+                 decrease_factor: float = 0.5,
+                 decrease_cooldown: float = 1.0):
+        """__init__.
+
+        Args:
+            initial_limit (int): = 10
+                Initial number of requests in flight.
+            min_limit (int): = 1
+                Limit is never decreased below this value.
+            max_limit (int): = 100
+                Limit is never increased above this value.
+            increase (float): = 1.0
+                Additive increase of the limit after `limit` successes.
+            decrease_factor (float): = 0.5
+                Multiplicative decrease of the limit on throttling.
+            decrease_cooldown (float): = 1.0
+                Seconds after a decrease in which other failures do not
+                decrease the limit again, requests in flight usually fail
+                together.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self._blocked_until = 0.0
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+        # Futures of tasks waiting at `acquire_async` with their loops
+        self._async_waiters = []
+
+    def _wait_time(self) -> float:
+        """Seconds to wait for a slot, 0 if a slot was taken."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return 0.0
+        return None
+
+    def acquire(self):
+        """Block until a request slot is available."""
+        with self._condition:
+            while True:
+                wait = self._wait_time()
+                if wait == 0.0:
+                    return
+                self._condition.wait(timeout=wait)
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop for a request slot.
+
+        Waiting tasks are woken by `release`, which may run at other
+        threads or event loops, so each task waits on its own future.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                wait = self._wait_time()
+                if wait == 0.0:
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait_for(waiter, timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _notify_all(self):
+        """Wake threads and tasks waiting for a slot, lock held."""
+        self._condition.notify_all()
+        for loop, waiter in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_set_waiter_result, waiter)
+            except RuntimeError:
+                # Event loop of the waiting task is already closed
+                pass
+        self._async_waiters = []
+
+    def release(self, status_code: int = None, retry_after: float = None,
+                failed: bool = False):
+        """Release slot adjusting limit with request result.
+
+        Args:
+            status_code (int): = None
+                Status code returned by the API.
+            retry_after (float): = None
+                Seconds informed by Retry-After header.
+            failed (bool): = False
+                If request failed without a response (connection error or
+                timeout).
+        """
+        is_throttled = failed or status_code in THROTTLE_STATUS_CODES
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if retry_after:
+                self._blocked_until = max(
+                    self._blocked_until, now + retry_after)
+            if is_throttled:
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self.limit = max(
+                        self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                self.limit = min(
+                    self.max_limit, self.limit + self.increase / self.limit)
+            self._notify_all()
+
+
+class RateLimiter:
+    """Per end-point token buckets with optional adaptive concurrency.
+
+    End-point names used by the clients are `login`, `import_process`,
+    `remove_monitor`, `process_detail`, `document_url` and
+    `document_download`.
+    """
+
+    def __init__(self, default_rate: float = None,
+                 per_endpoint: dict = None,
+                 concurrency: AdaptiveConcurrencyLimiter = None):
+        """__init__.
+
+        Args:
+            default_rate (float): = None
+                Requests per second for end-points not at `per_endpoint`,
+                if None they are not rate limited.
+            per_endpoint (dict): = None
+                Requests per second for each end-point name, values may
+                also be `TokenBucket` objects to set burst capacity or to
+                share a bucket between end-points.
+            concurrency (AdaptiveConcurrencyLimiter): = None
+                Limit of requests in flight shared by all end-points.
+        """
+        self.default_rate = default_rate
+        self.concurrency = concurrency
+        self._buckets = {}
+        for endpoint, rate in (per_endpoint or {}).items():
+            if not isinstance(rate, TokenBucket):
+                rate = TokenBucket(rate)
+            self._buckets[endpoint] = rate
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        """Token bucket of the end-point, None if not limited."""
+        bucket = self._buckets.get(endpoint)
+        if bucket is None and self.default_rate is not None:
+            with self._lock:
+                bucket = self._buckets.setdefault(
+                    endpoint, TokenBucket(self.default_rate))
+        return bucket
+
+    def _blocked_time(self, endpoint: str) -> float:
+        """Seconds end-point is blocked by a previous Retry-After."""
+        blocked_until = self._blocked_until.get(endpoint)
+        if blocked_until is None:
+            return 0.0
+        return max(blocked_until - time.monotonic(), 0.0)
+
+    def acquire(self, endpoint: str):
+        """Block until a request to the end-point is allowed."""
+        blocked_time = self._blocked_time(endpoint)
+        if blocked_time:
+            time.sleep(blocked_time)
+        bucket = self._bucket(endpoint)
+        if bucket is not None:
+            bucket.acquire()
+        if self.concurrency is not None:
+            self.concurrency.acquire()
+
+    async def acquire_async(self, endpoint: str):
+        """Wait without blocking the event loop until request is allowed."""
+        blocked_time = self._blocked_time(endpoint)
+        if blocked_time:
+            await asyncio.sleep(blocked_time)
+        bucket = self._bucket(endpoint)
+        if bucket is not None:
+            await bucket.acquire_async()
+        if self.concurrency is not None:
+            await self.concurrency.acquire_async()
+
+    def release(self, endpoint: str, status_code: int = None,
+                retry_after: float = None, failed: bool = False):
+        """Register the result of a request acquired with `acquire`.
+
+        Args:
+            endpoint (str):
+                End-point name.
+            status_code (int): = None
+                Status code returned by the API.
+            retry_after (float): = None
+                Seconds informed by Retry-After header, new requests to
+                the end-point wait this time.
+            failed (bool): = False
+                If request failed without a response.
+        """
+        if retry_after:
+            with self._lock:
+                self._blocked_until[endpoint] = max(
+                    self._blocked_until.get(endpoint, 0.0),
+                    time.monotonic() + retry_after)
+        if self.concurrency is not None:
+            self.concurrency.release(
+                status_code=status_code, retry_after=retry_after,
+                failed=failed)
@@ -0,0 +1,189 @@
+"""Retry policies for Tratum API requests.
+
+Idempotent end-points (GET and PUT) are retried on any transient error.
+The POST to `importProcess` is retried only when the request surely did
+not reach the server (connection could not be opened) or was refused by
+throttling, so a process is never imported twice by the client.
+"""
+import time
+import random
+import asyncio
+import requests
+import urllib3
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def is_connect_error(exception: Exception) -> bool:
+    """Check if request failed before being sent to the server.
+
+    Args:
+        exception (Exception):
+            Exception raised by `requests` or `aiohttp`.
+
+    Returns:
+        bool: True if the connection could not be opened.
+    """
+    if isinstance(exception, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exception, requests.exceptions.ConnectionError):
+        reason = exception.args[0] if exception.args else None
+        # requests wraps urllib3 MaxRetryError, the cause is at `reason`
+        reason = getattr(reason, 'reason', reason)
+        return isinstance(reason, (
+            urllib3.exceptions.NewConnectionError,
+            urllib3.exceptions.ConnectTimeoutError))
+    if aiohttp is not None:
+        return isinstance(exception, aiohttp.ClientConnectorError)
+    return False
+
+
+def is_transient_error(exception: Exception) -> bool:
+    """Check if exception is a connection error or timeout.
+
+    Args:
+        exception (Exception):
+            Exception raised by `requests` or `aiohttp`.
+
+    Returns:
+        bool: True if request may succeed if sent again.
+    """
+    if isinstance(exception, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            asyncio.TimeoutError)):
+        return True
+    if aiohttp is not None:
+        return isinstance(exception, (
+            aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+    return False
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter and a deadline per call."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 30, deadline: float = 120,
+                 retry_status_codes: tuple = (429, 500, 502, 503, 504),
+                 retry_sent_requests: bool = True):
+        """__init__.
+
+        Args:
+            max_attempts (int): = 4
+                Maximum number of attempts including the first one.
+            base_delay (float): = 0.5
+                Backoff of the first retry, it doubles at each retry.
+            max_delay (float): = 30
+                Maximum backoff between attempts.
+            deadline (float): = 120
+                Seconds budget of the call including all attempts and
+                backoffs, a retry is not made if it would end after it
+                and the timeout of each attempt is limited to the seconds
+                left of it.
+            retry_status_codes (tuple): = (429, 500, 502, 503, 504)
+                Status codes that are retried.
+            retry_sent_requests (bool): = True
+                Retry requests that failed after being sent (read timeout,
+                connection reset). It must be False for non idempotent
+                requests, connection errors are always retried.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_status_codes = tuple(retry_status_codes)
+        self.retry_sent_requests = retry_sent_requests
+
+    def backoff(self, attempt: int) -> float:
+        """Random backoff after failed `attempt` (full jitter)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)  # NOQA
+
+    def remaining(self, started_at: float) -> float:
+        """Seconds left of the deadline of a call, at least 1 ms.
+
+        A small positive value makes the attempt fail with a timeout,
+        zero would make sockets non blocking.
+        """
+        elapsed = time.monotonic() - started_at
+        return max(self.deadline - elapsed, 0.001)
+
+    def attempt_timeout(self, timeout, started_at: float):
+        """Timeout of next attempt limited to the deadline of the call.
+
+        Args:
+            timeout (float | tuple):
+                Timeout of `requests`, seconds or (connect, read) tuple,
+                None means no timeout.
+            started_at (float):
+                `time.monotonic()` when the call started.
+
+        Returns:
+            float | tuple: Timeout with each value at most the seconds
+            left of the deadline.
+        """
+        remaining = self.remaining(started_at)
+        if isinstance(timeout, tuple):
+            return tuple(
+                remaining if value is None else min(value, remaining)
+                for value in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def should_retry_exception(self, exception: Exception) -> bool:
+        """Check if request that raised `exception` can be retried."""
+        if is_connect_error(exception):
+            return True
+        return self.retry_sent_requests and is_transient_error(exception)
+
+    def should_retry_status(self, status_code: int) -> bool:
+        """Check if request answered with `status_code` can be retried."""
+        return status_code in self.retry_status_codes
+
+    def next_delay(self, attempt: int, started_at: float,
+                   retry_after: float = None) -> float:
+        """Seconds to wait before next attempt.
+
+        Args:
+            attempt (int):
+                Number of the attempt that failed, starting at 1.
+            started_at (float):
+                `time.monotonic()` when the call started.
+            retry_after (float): = None
+                Seconds informed by Retry-After header, backoff is at least
+                this value.
+
+        Returns:
+            float: Seconds to wait, None if the call must not be retried
+            because attempts or deadline are exhausted.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        elapsed = time.monotonic() - started_at
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
+
+
+IDEMPOTENT_RETRY_POLICY = RetryPolicy()
+"""Default policy for GET and PUT end-points."""
+
+NON_IDEMPOTENT_RETRY_POLICY = RetryPolicy(
+    retry_status_codes=(429, 503), retry_sent_requests=False)
+"""Default policy for POST end-points, retries only refused requests."""
+
+DEFAULT_RETRY_POLICIES = {
+    "login": IDEMPOTENT_RETRY_POLICY,
+    "import_process": NON_IDEMPOTENT_RETRY_POLICY,
+    "remove_monitor": IDEMPOTENT_RETRY_POLICY,
+    "process_detail": IDEMPOTENT_RETRY_POLICY,
+    "document_url": IDEMPOTENT_RETRY_POLICY,
+    "document_download": IDEMPOTENT_RETRY_POLICY,
+}
+"""Retry policy of each end-point used when client has no policies."""
@@ -0,0 +1,360 @@
+"""Local full-text index of process details.
+
+`ProcessIndex` keeps the text of fetched process details at a SQLite FTS5
+index, so keywords of movements and fields such as court, status or
+distribution date are searched without calling Tratum API. A client with
+a `search_index` ingests every detail it fetches, processes whose
+`last_update` did not change are not indexed again.
+"""
+import re
+import time
+import sqlite3
+import datetime
+import threading
+from typing import Iterable
+from tratum_api.models import parse_datetime
+
+# Text columns of the full-text index
+TEXT_COLUMNS = (
+    "subject", "last_update_message", "classe", "movements", "content_all")
+
+# Columns of the process table that can be filtered with equality
+FILTER_COLUMNS = ("court", "state", "status", "classe", "judging_organ")
+
+# Tokenizer names and options, as `unicode61 tokenchars '-.'`
+_TOKENIZE_PATTERN = re.compile(r"^[\w\s'.-]+$")
+
+
+def _text(value) -> str:
+    """Join every string of a JSON value, None for empty values."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return str(value)
+    parts = [_text(item) for item in value]
+    return "\n".join(part for part in parts if part) or None
+
+
+def _movements(detail: dict) -> str:
+    """Text of the movements of every instance."""
+    texts = []
+    for instance in detail.get("instances") or []:
+        if not isinstance(instance, dict):
+            continue
+        for movement in instance.get("movements") or []:
+            text = _text(movement.get("text")) if isinstance(
+                movement, dict) else _text(movement)
+            if text:
+                texts.append(text)
+    return "\n".join(texts) or None
+
+
+def _iso_date(value) -> str:
+    """Convert date, datetime or API date string to `YYYY-MM-DD`."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = parse_datetime(value)
+        if value is None:
+            return None
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.isoformat()
+
+
+def _to_float(value) -> float:
+    """Convert value claim to float, None if not a number."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProcessIndex:
+    """SQLite FTS5 index of process details of many organizations."""
+
+    def __init__(self, path: str = ":memory:", busy_timeout: float = 30,
+                 tokenize: str = "unicode61 remove_diacritics 2"):
+        """__init__.
+
+        Args:
+            path (str): = ":memory:"
+                Path of the SQLite database file.
+            busy_timeout (float): = 30
+                Seconds to wait for the database lock held by other
+                processes.
+            tokenize (str): = "unicode61 remove_diacritics 2"
+                FTS5 tokenizer, the default ignores accents so `decisao`
+                matches `decisão`. Only used when the index is created.
+
+        Raises:
+            ValueError:
+                Raise error if tokenize has characters other than
+                letters, digits, spaces, quotes, `.`, `_` and `-`.
+        """
+        if not isinstance(tokenize, str) or \
+                not _TOKENIZE_PATTERN.match(tokenize):
+            raise ValueError(
+                "tokenize [{tokenize}] is not a valid FTS5 tokenizer".format(
+                    tokenize=tokenize))
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=busy_timeout, check_same_thread=False,
+            isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS process ("
+            " id INTEGER PRIMARY KEY, organization_id TEXT NOT NULL,"
+            " process_number TEXT NOT NULL, last_update TEXT,"
+            " court TEXT, state TEXT, status TEXT, classe TEXT,"
+            " judging_organ TEXT, distribution_date TEXT,"
+            " value_claim REAL, indexed_at REAL NOT NULL,"
+            " UNIQUE (organization_id, process_number))")
+        for column in FILTER_COLUMNS + ("distribution_date",):
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS process_{column} "
+                "ON process ({column})".format(column=column))
+        # DDL does not accept parameters, quotes of options are escaped
+        self._connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS process_text USING fts5("
+            "{columns}, tokenize='{tokenize}')".format(
+                columns=", ".join(TEXT_COLUMNS),
+                tokenize=tokenize.replace("'", "''")))
+
+    def _last_update(self, organization_id: str,
+                     process_number: str) -> tuple:
+        """Row id and `last_update` of an indexed process, lock held."""
+        return self._connection.execute(
+            "SELECT id, last_update FROM process "
+            "WHERE organization_id = ? AND process_number = ?",
+            (organization_id, process_number)).fetchone()
+
+    def _ingest(self, organization_id: str, process_number: str,
+                detail: dict, force: bool) -> bool:
+        """Index a detail inside a transaction, lock held."""
+        last_update = detail.get("last_update")
+        row = self._last_update(organization_id, process_number)
+        if (row is not None and not force and last_update is not None and
+                row[1] == last_update):
+            return False
+
+        values = (
+            last_update, _text(detail.get("court")),
+            _text(detail.get("state")), _text(detail.get("status")),
+            _text(detail.get("classe")), _text(detail.get("judging_organ")),
+            _iso_date(detail.get("distribution_date")),
+            _to_float(detail.get("value_claim")), time.time())
+        if row is None:
+            rowid = self._connection.execute(
+                "INSERT INTO process (organization_id, process_number, "
+                "last_update, court, state, status, classe, judging_organ, "
+                "distribution_date, value_claim, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (organization_id, process_number) + values).lastrowid
+        else:
+            rowid = row[0]
+            self._connection.execute(
+                "UPDATE process SET last_update = ?, court = ?, state = ?, "
+                "status = ?, classe = ?, judging_organ = ?, "
+                "distribution_date = ?, value_claim = ?, indexed_at = ? "
+                "WHERE id = ?", values + (rowid,))
+            self._connection.execute(
+                "DELETE FROM process_text WHERE rowid = ?", (rowid,))
+        self._connection.execute(
+            "INSERT INTO process_text (rowid, {columns}) "  # NOQA
+            "VALUES (?, ?, ?, ?, ?, ?)".format(
+                columns=", ".join(TEXT_COLUMNS)), (
+                rowid, _text(detail.get("subject")),
+                _text(detail.get("last_update_message")),
+                _text(detail.get("classe")), _movements(detail),
+                _text(detail.get("content_all"))))
+        return True
+
+    def ingest_many(self, organization_id,
+                    details: Iterable[tuple], force: bool = False) -> int:
+        """Index process details in a single transaction.
+
+        Args:
+            organization_id (int):
+                Organization ID in Tratum API.
+            details (Iterable[tuple]):
+                Tuples with `(process_number, detail)`, detail is a
+                dictionary as returned by `get_process_detail`.
+            force (bool): = False
+                Index again processes whose `last_update` did not change.
+
+        Returns:
+            int: Number of indexed processes.
+        """
+        organization_id = str(organization_id)
+        indexed = 0
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for process_number, detail in details:
+                    indexed += self._ingest(
+                        organization_id, process_number, detail, force)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return indexed
+
+    def ingest(self, organization_id, process_number: str, detail: dict,
+               force: bool = False) -> bool:
+        """Index a process detail if its `last_update` changed.
+
+        Returns:
+            bool: True if the process was indexed.
+        """
+        return bool(self.ingest_many(
+            organization_id, [(process_number, detail)], force=force))
+
+    def remove(self, organization_id, process_numbers: Iterable[str]):
+        """Remove processes from the index."""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for process_number in process_numbers:
+                    row = self._last_update(
+                        str(organization_id), process_number)
+                    if row is None:
+                        continue
+                    self._connection.execute(
+                        "DELETE FROM process_text WHERE rowid = ?",
+                        (row[0],))
+                    self._connection.execute(
+                        "DELETE FROM process WHERE id = ?", (row[0],))
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def search(self, query: str = None, organization_id=None,
+               columns: Iterable[str] = None,
+               distribution_date_from=None, distribution_date_to=None,
+               limit: int = 100, snippet_tokens: int = 16,
+               **filters) -> list:
+        """Search indexed processes.
+
+        Args:
+            query (str): = None
+                FTS5 query, as `penhora`, `"tutela antecipada"` or
+                `sentença AND NOT recurso`. If None only fields are
+                filtered.
+            organization_id (int): = None
+                Search only processes of the organization.
+            columns (Iterable[str]): = None
+                Text columns searched, subset of `TEXT_COLUMNS`. If None
+                every column is searched.
+            distribution_date_from (datetime.date | str): = None
+                Minimum distribution date, inclusive.
+            distribution_date_to (datetime.date | str): = None
+                Maximum distribution date, inclusive.
+            limit (int): = 100
+                Maximum number of results.
+            snippet_tokens (int): = 16
+                Tokens of the snippet around the matches.
+            **filters:
+                Equality filters of `FILTER_COLUMNS`, as `court="TJSP"`.
+
+        Returns:
+            list: Dictionaries with `organization_id`, `process_number`,
+            `last_update`, the filter columns, `distribution_date`,
+            `value_claim` and, if query is set, `rank` (lower is better)
+            and `snippet` with matches between brackets.
+
+        Raises:
+            ValueError:
+                Raise error if a column or filter is unknown.
+            sqlite3.OperationalError:
+                Raise error if the query has invalid FTS5 syntax.
+        """
+        unknown = set(filters) - set(FILTER_COLUMNS)
+        if unknown:
+            raise ValueError(
+                "filters {unknown} must be in {columns}".format(
+                    unknown=sorted(unknown), columns=FILTER_COLUMNS))
+        conditions = []
+        parameters = []
+        if query is not None:
+            if columns is not None:
+                columns = list(columns)
+                unknown = set(columns) - set(TEXT_COLUMNS)
+                if unknown:
+                    raise ValueError(
+                        "columns {unknown} must be in {columns}".format(
+                            unknown=sorted(unknown), columns=TEXT_COLUMNS))
+                query = "{{{columns}}} : ({query})".format(
+                    columns=" ".join(columns), query=query)
+            conditions.append("process_text MATCH ?")
+            parameters.append(query)
+        if organization_id is not None:
+            conditions.append("p.organization_id = ?")
+            parameters.append(str(organization_id))
+        for column, value in filters.items():
+            conditions.append("p.{column} = ?".format(column=column))
+            parameters.append(value)
+        if distribution_date_from is not None:
+            conditions.append("p.distribution_date >= ?")
+            parameters.append(_iso_date(distribution_date_from))
+        if distribution_date_to is not None:
+            conditions.append("p.distribution_date <= ?")
+            parameters.append(_iso_date(distribution_date_to))
+
+        selected = [
+            "p.organization_id", "p.process_number", "p.last_update"]
+        selected += ["p." + column for column in FILTER_COLUMNS]
+        selected += ["p.distribution_date", "p.value_claim"]
+        names = [column.split(".")[1] for column in selected]
+        if query is not None:
+            selected += [
+                "bm25(process_text)",
+                "snippet(process_text, -1, '[', ']', '...', {tokens})".format(
+                    tokens=int(snippet_tokens))]
+            names += ["rank", "snippet"]
+            # Columns are constants, values are bound as parameters
+            sql = (
+                "SELECT {selected} FROM process_text "  # NOQA
+                "JOIN process p ON p.id = process_text.rowid")
+            order = "ORDER BY bm25(process_text)"
+        else:
+            sql = "SELECT {selected} FROM process p"  # NOQA
+            order = "ORDER BY p.distribution_date DESC, p.process_number"
+        sql = sql.format(selected=", ".join(selected))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " " + order + " LIMIT ?"
+        parameters.append(limit)
+
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [dict(zip(names, row)) for row in rows]
+
+    def count(self, organization_id=None) -> int:
+        """Number of indexed processes."""
+        sql = "SELECT COUNT(*) FROM process"
+        parameters = ()
+        if organization_id is not None:
+            sql += " WHERE organization_id = ?"
+            parameters = (str(organization_id),)
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()[0]
+
+    def optimize(self):
+        """Merge index segments, run after large ingestions."""
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO process_text (process_text) VALUES ('optimize')")
+
+    def close(self):
+        """Close database connection."""
+        self._connection.close()
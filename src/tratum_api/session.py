@@ -0,0 +1,123 @@
+"""HTTP session with a tunable connection pool for Tratum API."""
+import socket
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.request import ACCEPT_ENCODING
+
+# Content encodings in order of preference, smallest payloads first
+_ENCODINGS = ("zstd", "br", "gzip", "deflate")
+
+
+def keepalive_socket_options(idle: int = 60, interval: int = 10,
+                             count: int = 5) -> list:
+    """Socket options enabling TCP keep-alive.
+
+    Options that are not available at the platform are ignored.
+
+    Args:
+        idle (int): = 60
+            Seconds of inactivity before sending keep-alive probes.
+        interval (int): = 10
+            Seconds between keep-alive probes.
+        count (int): = 5
+            Number of failed probes before dropping the connection.
+
+    Returns:
+        list: Socket options to be used by urllib3 connections.
+    """
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle))
+    elif hasattr(socket, 'TCP_KEEPALIVE'):
+        # macOS name for TCP_KEEPIDLE
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval))
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count))
+    return options
+
+
+def accept_encoding() -> str:
+    """Accept-Encoding header with encodings urllib3 can decode.
+
+    Brotli and zstd are only offered when their libraries are installed,
+    gzip and deflate are always available.
+
+    Returns:
+        str: Value of Accept-Encoding header, as `zstd, br, gzip, deflate`.
+    """
+    available = {
+        encoding.strip() for encoding in ACCEPT_ENCODING.split(',')}
+    return ", ".join(
+        encoding for encoding in _ENCODINGS if encoding in available)
+
+
+class TratumHTTPAdapter(HTTPAdapter):
+    """HTTP adapter allowing custom socket options on pooled connections."""
+
+    def __init__(self, socket_options: list = None, **kwargs):
+        """__init__.
+
+        Args:
+            socket_options (list): = None
+                Socket options for new connections, if None urllib3
+                defaults are used.
+            **kwargs:
+                Other arguments passed to `requests.adapters.HTTPAdapter`.
+        """
+        self._socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        """init_poolmanager."""
+        if self._socket_options is not None:
+            kwargs['socket_options'] = self._socket_options
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        """proxy_manager_for."""
+        if self._socket_options is not None:
+            kwargs['socket_options'] = self._socket_options
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def build_session(pool_connections: int = 10, pool_maxsize: int = 10,
+                  pool_block: bool = False,
+                  tcp_keepalive: bool = True) -> requests.Session:
+    """Create a session with a tunable connection pool.
+
+    The same session can be passed to many `TratumAPI` objects (one for
+    each organization) so they share the connection pool.
+
+    Args:
+        pool_connections (int): = 10
+            Number of hosts with a cached connection pool.
+        pool_maxsize (int): = 10
+            Maximum number of connections kept for each host, it should
+            be at least the number of threads making requests.
+        pool_block (bool): = False
+            If True requests wait for a free connection when the pool is
+            exhausted instead of opening connections that are discarded
+            after use.
+        tcp_keepalive (bool): = True
+            Enable TCP keep-alive probes on pooled connections.
+
+    Returns:
+        requests.Session: Session with the adapter mounted for http and
+        https, negotiating compression with `accept_encoding`.
+    """
+    socket_options = None
+    if tcp_keepalive:
+        socket_options = keepalive_socket_options()
+    adapter = TratumHTTPAdapter(
+        socket_options=socket_options,
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+        pool_block=pool_block)
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = accept_encoding()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
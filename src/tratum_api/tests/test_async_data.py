@@ -0,0 +1,163 @@
+"""Test asyncio client."""
+import json
+import asyncio
+import socket
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.exceptions import (
+    TratumAPILoginError, TratumAPIProblemAPIException,
+    TratumAPIInvalidDocumentException)
+
+try:
+    import aiohttp
+    from tratum_api.async_data import AsyncTratumAPI
+except ImportError:
+    aiohttp = None
+
+VALID_PROCESS = "19777928520247108243"
+INVALID_PROCESS = "00000000000000000000"
+
+
+class _Response:
+    """Response with body as read by `AsyncTratumAPI._send`."""
+
+    def __init__(self, body: bytes):
+        """__init__."""
+        self.body = body
+
+
+def _closed_port_url() -> str:
+    """URL of a local port without server."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return "http://127.0.0.1:{port}".format(port=port)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncTratumAPI(unittest.TestCase):
+    """Test asyncio client against the mock server."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.reset()
+
+    def _kwargs(self, **kwargs) -> dict:
+        """Arguments of clients pointing to the mock server."""
+        arguments = {
+            "tratum_email": "email", "tratum_password": "password",
+            "organization_id": 1, "holder_id": 1, "cnpj": "cnpj",
+            "base_url": self.server.url}
+        arguments.update(kwargs)
+        return arguments
+
+    def _run(self, coroutine_function, **kwargs):
+        """Run coroutine function with a logged in client."""
+        async def run():
+            async with AsyncTratumAPI(**self._kwargs(**kwargs)) as client:
+                return await coroutine_function(client)
+        return asyncio.run(run())
+
+    def test__login(self):
+        """Test login and single re-login when token is revoked."""
+        async def run(client):
+            token = client.token
+            self.assertIsNotNone(client.token_expires_at)
+            self.server.revoke_tokens()
+            details = await asyncio.gather(*[
+                client.get_process_detail(VALID_PROCESS)
+                for _ in range(10)])
+            self.assertNotEqual(client.token, token)
+            return details
+
+        details = self._run(run)
+        self.assertEqual(details[0]["process"], VALID_PROCESS)
+        self.assertEqual(self.server.requests["login"], 2)
+
+        async def login(client):
+            pass
+        with self.assertRaises(TratumAPILoginError):
+            self._run(login, tratum_password="")
+        with self.assertRaises(TratumAPILoginError):
+            TratumAPI(**self._kwargs(tratum_password=""))
+
+    def test__json(self):
+        """Test decoding errors are kept and raised by `_json`."""
+        calls = []
+
+        def loads(data: bytes):
+            calls.append(data)
+            return json.loads(data)
+
+        client = AsyncTratumAPI(**self._kwargs(json_decoder=loads))
+        response = _Response(b'{"status": "sucess"}')
+        self.assertEqual(client._json(response), {"status": "sucess"})
+        self.assertEqual(client._json(response), {"status": "sucess"})
+        self.assertEqual(len(calls), 1)
+
+        response = _Response(b'<html>Bad Gateway</html>')
+        client._parse_json(response)
+        self.assertIsNone(response.json_data)
+        with self.assertRaises(ValueError):
+            client._json(response)
+        with self.assertRaises(ValueError):
+            client._json(response)
+        self.assertEqual(len(calls), 2)
+
+    def test__exception_parity(self):
+        """Test async client raises the same errors as `TratumAPI`."""
+        tratum_api = TratumAPI(**self._kwargs())
+
+        async def run(client):
+            errors = []
+            for call in (
+                    lambda api: api.monitor_process(INVALID_PROCESS),
+                    lambda api: api.get_process_detail(INVALID_PROCESS)):
+                with self.assertRaises(Exception) as sync_context:
+                    call(tratum_api)
+                with self.assertRaises(Exception) as async_context:
+                    await call(client)
+                errors.append((sync_context.exception,
+                               async_context.exception))
+            return errors
+
+        errors = self._run(run)
+        self.assertIsInstance(errors[0][0], TratumAPIInvalidDocumentException)
+        self.assertIsInstance(errors[1][0], TratumAPIProblemAPIException)
+        for sync_error, async_error in errors:
+            self.assertIs(type(async_error), type(sync_error))
+            self.assertEqual(
+                set(async_error.payload), set(sync_error.payload))
+
+    def test__connection_error(self):
+        """Test connection errors raise Tratum exception with retries."""
+        base_url = _closed_port_url()
+
+        async def run():
+            client = AsyncTratumAPI(**self._kwargs(
+                base_url=base_url, retry_policies={}))
+            try:
+                await client.login()
+            finally:
+                await client.close()
+
+        with self.assertRaises(TratumAPIProblemAPIException) as context:
+            asyncio.run(run())
+        with self.assertRaises(TratumAPIProblemAPIException) as sync_context:
+            TratumAPI(**self._kwargs(base_url=base_url, retry_policies={}))
+        self.assertEqual(context.exception.payload["endpoint"], "login")
+        self.assertEqual(context.exception.payload["retries"], 0)
+        self.assertEqual(
+            set(context.exception.payload),
+            set(sync_context.exception.payload))
@@ -0,0 +1,95 @@
+"""Test token lifecycle."""
+import json
+import time
+import base64
+import threading
+import unittest
+from tratum_api.auth import decode_jwt_expiry, token_refresh_time
+from tratum_api.bulk import bounded_map
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+
+VALID_PROCESS = "19777928520247108243"
+
+
+def _make_jwt(exp: float) -> str:
+    """Build an unsigned JWT with `exp` claim."""
+    def encode(data):
+        raw = json.dumps(data).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+    return "{}.{}.signature".format(
+        encode({"alg": "HS256", "typ": "JWT"}), encode({"exp": exp}))
+
+
+class CountingTratumAPI(TratumAPI):
+    """TratumAPI counting logins instead of calling the end-point."""
+
+    def login(self):
+        """Fake login returning a token valid for one hour."""
+        self.login_count = getattr(self, 'login_count', 0) + 1
+        time.sleep(0.05)
+        self.token = _make_jwt(time.time() + 3600)
+        self.token_expires_at = decode_jwt_expiry(self.token)
+        self._token_refresh_at = token_refresh_time(
+            self.token_expires_at, self._token_refresh_margin)
+        return True
+
+
+class TestAuth(unittest.TestCase):
+    """Test token lifecycle."""
+
+    def test__decode_jwt_expiry(self):
+        """Test reading exp claim from token."""
+        self.assertEqual(decode_jwt_expiry(_make_jwt(1700000000)),
+                         1700000000.0)
+        self.assertIsNone(decode_jwt_expiry("not-a-jwt"))
+        self.assertIsNone(decode_jwt_expiry(None))
+
+    def test__token_refresh_time(self):
+        """Test refresh margin is limited by token lifetime."""
+        now = time.time()
+        self.assertAlmostEqual(
+            token_refresh_time(now + 3600, 60), now + 3540, places=3)
+        self.assertLess(token_refresh_time(now + 10, 60), now + 10)
+        self.assertGreater(token_refresh_time(now + 10, 60), now + 4)
+        self.assertIsNone(token_refresh_time(None, 60))
+
+    def test__single_flight_refresh(self):
+        """Test only one login is made when many threads see expiry."""
+        tratum_api = CountingTratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj")
+        self.assertEqual(tratum_api.login_count, 1)
+
+        # Force token expiration
+        tratum_api._token_refresh_at = time.time() - 1
+        tokens = []
+        threads = [
+            threading.Thread(
+                target=lambda: tokens.append(tratum_api._get_token()))
+            for _ in range(64)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tratum_api.login_count, 2)
+        self.assertEqual(len(set(tokens)), 1)
+
+    def test__relogin_on_401(self):
+        """Test revoked token triggers a single login for many threads."""
+        with MockTratumServer(detail_size=100) as server:
+            tratum_api = TratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                base_url=server.url)
+            token = tratum_api.token
+            server.revoke_tokens()
+            results = list(bounded_map(
+                tratum_api.get_process_detail, [VALID_PROCESS] * 16,
+                max_workers=8))
+            self.assertTrue(all(
+                exception is None for _, _, exception in results))
+            self.assertEqual(server.requests["login"], 2)
+            self.assertNotEqual(tratum_api.token, token)
+            # Each rejected request is sent again once
+            self.assertLessEqual(server.requests["process_detail"], 24)
@@ -0,0 +1,53 @@
+"""Test bulk helpers."""
+import threading
+import unittest
+from tratum_api.bulk import bounded_map, exception_to_dict
+from tratum_api.exceptions import TratumAPIInvalidDocumentException
+
+
+def _square_or_fail(item):
+    if item % 5 == 0:
+        raise TratumAPIInvalidDocumentException(
+            message="Invalid process number", payload={"item": item})
+    return item * item
+
+
+class TestBulk(unittest.TestCase):
+    """Test bulk helpers."""
+
+    def test__bounded_map_results(self):
+        """Test every item is yielded even when some fail."""
+        results = list(bounded_map(_square_or_fail, range(1, 21),
+                                   max_workers=4))
+        self.assertEqual(len(results), 20)
+        errors = {item for item, _, exception in results if exception}
+        self.assertSetEqual(errors, {5, 10, 15, 20})
+        for item, result, exception in results:
+            if exception is None:
+                self.assertEqual(result, item * item)
+
+    def test__bounded_map_is_lazy(self):
+        """Test items are consumed only when there is room in the pool."""
+        consumed = []
+        lock = threading.Lock()
+
+        def items():
+            for i in range(100):
+                with lock:
+                    consumed.append(i)
+                yield i
+
+        iterator = bounded_map(lambda x: x, items(), max_workers=2,
+                               max_pending=4)
+        next(iterator)
+        self.assertLessEqual(len(consumed), 8)
+        iterator.close()
+
+    def test__exception_to_dict(self):
+        """Test conversion of Tratum and generic exceptions."""
+        error = TratumAPIInvalidDocumentException(
+            message="Invalid process number", payload={"a": 1})
+        self.assertEqual(exception_to_dict(error), error.to_dict())
+        self.assertEqual(
+            exception_to_dict(ValueError("boom")),
+            {"payload": {}, "type": "ValueError", "message": "boom"})
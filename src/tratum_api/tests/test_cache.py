@@ -0,0 +1,229 @@
+"""Test Tratum API caches."""
+import os
+import time
+import tempfile
+import unittest
+from tratum_api.cache import (
+    CacheEntry, MemoryCacheBackend, SQLiteCacheBackend, ProcessDetailCache,
+    SignedURLCache, signed_url_expiry)
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+
+VALID_PROCESS = "19777928520247108243"
+
+
+def _entry(size: int) -> CacheEntry:
+    return CacheEntry(value=b'"' + b'x' * (size - 2) + b'"',
+                      stored_at=time.time())
+
+
+class TestCacheBackends(unittest.TestCase):
+    """Test LRU eviction of cache backends."""
+
+    def _check_lru(self, backend):
+        backend.set("a", _entry(40))
+        backend.set("b", _entry(40))
+        # Access `a` so `b` is the least recently used
+        self.assertIsNotNone(backend.get("a"))
+        backend.set("c", _entry(40))
+        self.assertIsNone(backend.get("b"))
+        self.assertIsNotNone(backend.get("a"))
+        self.assertIsNotNone(backend.get("c"))
+        self.assertEqual(backend.evictions, 1)
+        self.assertEqual(len(backend), 2)
+
+    def test__memory_lru(self):
+        """Test memory backend evicts least recently used entries."""
+        backend = MemoryCacheBackend(max_bytes=100)
+        self._check_lru(backend)
+        self.assertEqual(backend.size, 80)
+
+    def test__sqlite_lru(self):
+        """Test SQLite backend evicts least recently used entries."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            backend = SQLiteCacheBackend(
+                os.path.join(tmp_dir, "cache.db"), max_bytes=100)
+            self._check_lru(backend)
+            self.assertEqual(backend.size, 80)
+            backend.set("a", _entry(30))
+            backend.delete("c")
+            self.assertEqual(backend.size, 30)
+            backend.close()
+
+            # Size is kept at the database between connections
+            backend = SQLiteCacheBackend(
+                os.path.join(tmp_dir, "cache.db"), max_bytes=100)
+            self.assertEqual(backend.size, 30)
+            backend.set("b", _entry(200))
+            backend.clear()
+            self.assertEqual(backend.size, 0)
+            backend.close()
+
+
+class TestProcessDetailCache(unittest.TestCase):
+    """Test process detail cache."""
+
+    def test__ttl_and_stats(self):
+        """Test fresh entries are hits and expired are misses."""
+        cache = ProcessDetailCache(ttl=60)
+        entry, is_fresh = cache.lookup(1, "123")
+        self.assertIsNone(entry)
+        self.assertFalse(is_fresh)
+
+        cache.store(1, "123", {"process": "123", "last_update": "2024"})
+        entry, is_fresh = cache.lookup(1, "123")
+        self.assertTrue(is_fresh)
+        self.assertEqual(entry.detail()["process"], "123")
+
+        # Other organization does not share the entry
+        entry, is_fresh = cache.lookup(2, "123")
+        self.assertIsNone(entry)
+
+        cache.ttl = 0
+        entry, is_fresh = cache.lookup(1, "123")
+        self.assertIsNotNone(entry)
+        self.assertFalse(is_fresh)
+
+        cache.revalidated(1, "123", entry)
+        self.assertDictEqual(cache.stats(), {
+            "hits": 1, "misses": 3, "revalidations": 1, "evictions": 0,
+            "entries": 1})
+
+    def test__last_update_key(self):
+        """Test entry with other `last_update` is not fresh."""
+        cache = ProcessDetailCache(ttl=60)
+        cache.store(1, "123", {"last_update": "2024-01-01"})
+        _, is_fresh = cache.lookup(1, "123", last_update="2024-01-01")
+        self.assertTrue(is_fresh)
+        _, is_fresh = cache.lookup(1, "123", last_update="2024-02-01")
+        self.assertFalse(is_fresh)
+
+    def test__conditional_headers(self):
+        """Test validators are sent back to the server."""
+        cache = ProcessDetailCache()
+        entry = cache.store(1, "123", {}, etag='"abc"',
+                            last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+        self.assertDictEqual(entry.conditional_headers(), {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+
+
+def _signed_url(signed_at: float, expires: int) -> str:
+    return (
+        "https://s3.us-east-2.amazonaws.com/process-files/doc.pdf?"
+        "X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Date={date}&"
+        "X-Amz-Expires={expires}&X-Amz-Signature=abc").format(
+        date=time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(signed_at)),
+        expires=expires)
+
+
+class TestSignedURLCache(unittest.TestCase):
+    """Test presigned URL cache."""
+
+    def test__signed_url_expiry(self):
+        """Test expiry parsing from presigned query string."""
+        self.assertEqual(
+            signed_url_expiry(_signed_url(1700000000, 900)), 1700000900)
+        self.assertEqual(
+            signed_url_expiry("https://s3.aws.com/a.pdf?Expires=1700000000"),
+            1700000000)
+        self.assertIsNone(signed_url_expiry("https://s3.aws.com/a.pdf"))
+
+    def test__cache_until_expiry(self):
+        """Test URL is reused until refresh margin before expiry."""
+        cache = SignedURLCache(refresh_margin=60)
+        valid_url = _signed_url(time.time(), 900)
+        cache.set("doc.pdf", valid_url)
+        self.assertEqual(cache.get("doc.pdf"), valid_url)
+
+        expiring_url = _signed_url(time.time() - 870, 900)
+        cache.set("doc.pdf", expiring_url)
+        self.assertIsNone(cache.get("doc.pdf"))
+
+        cache.set("other.pdf", "https://s3.aws.com/other.pdf")
+        self.assertIsNone(cache.get("other.pdf"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestClientCache(unittest.TestCase):
+    """Test `get_process_detail` through the cache."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.reset()
+        self.events = []
+
+    def _client(self, ttl: float = 300, **kwargs) -> TratumAPI:
+        """Client with cache pointing to the mock server."""
+        return TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, hooks=[self.events.append],
+            cache=ProcessDetailCache(ttl=ttl), **kwargs)
+
+    def test__fresh_hit(self):
+        """Test fresh entries do not call the API."""
+        tratum_api = self._client(ttl=300)
+        detail = tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(tratum_api.get_process_detail(VALID_PROCESS), detail)
+        self.assertEqual(self.server.requests["process_detail"], 1)
+        self.assertEqual(
+            [event.cache for event in self.events[1:]], ["miss", "hit"])
+
+        # Bypassing the cache always calls the API
+        tratum_api.get_process_detail(VALID_PROCESS, use_cache=False)
+        self.assertEqual(self.server.requests["process_detail"], 2)
+
+    def test__stale_revalidation(self):
+        """Test stale entries are revalidated with ETag and 304."""
+        tratum_api = self._client(ttl=0)
+        detail = tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(tratum_api.get_process_detail(VALID_PROCESS), detail)
+        self.assertEqual(self.server.requests["process_detail"], 2)
+        self.assertEqual(self.events[-1].cache, "revalidated")
+        self.assertEqual(self.events[-1].status_code, 304)
+        self.assertEqual(tratum_api.cache.stats()["revalidations"], 1)
+
+    def test__last_update_mismatch(self):
+        """Test entries with other `last_update` are fetched again."""
+        tratum_api = self._client(ttl=300)
+        detail = tratum_api.get_process_detail(VALID_PROCESS)
+        tratum_api.get_process_detail(
+            VALID_PROCESS, last_update=detail["last_update"])
+        self.assertEqual(self.server.requests["process_detail"], 1)
+
+        tratum_api.get_process_detail(
+            VALID_PROCESS, last_update="2099-01-01T00:00:00")
+        self.assertEqual(self.server.requests["process_detail"], 2)
+        # Full response, not a conditional request
+        self.assertEqual(self.events[-1].cache, "stale")
+        self.assertEqual(self.events[-1].status_code, 200)
+        self.assertEqual(tratum_api.cache.stats()["revalidations"], 0)
+
+    def test__revoked_signed_url(self):
+        """Test revoked cached URLs are renewed once on 403."""
+        tratum_api = self._client(signed_url_cache=SignedURLCache())
+        document_url = "Processos/401/1/doc-0.pdf"
+        tratum_api.get_process_document_url(document_url)
+        for download in (
+                tratum_api.download_process_document,
+                lambda url: b"".join(tratum_api.stream_process_document(url))):
+            self.server.reset()
+            self.server.revoke_signed_urls()
+            self.assertEqual(download(document_url), self.server.document())
+            self.assertEqual(self.server.requests["document_url"], 1)
+            self.assertEqual(self.server.requests["document_download"], 2)
+            # Renewed URL was cached
+            download(document_url)
+            self.assertEqual(self.server.requests["document_url"], 1)
@@ -0,0 +1,153 @@
+"""Test incremental change feed."""
+import os
+import tempfile
+import unittest
+from tratum_api.cache import ProcessDetailCache
+from tratum_api.change_feed import ChangeFeed, WatermarkStore
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+
+
+class FakeTratumAPI:
+    """Client returning process details from a dictionary."""
+
+    organization_id = 1
+
+    def __init__(self, details: dict):
+        """__init__."""
+        self.details = details
+        self.calls = []
+
+    def get_process_detail(self, process_number, revalidate=False):
+        """Return the current detail of the process."""
+        self.calls.append(process_number)
+        detail = self.details[process_number]
+        if isinstance(detail, Exception):
+            raise detail
+        return dict(detail)
+
+
+class RecordingStore(WatermarkStore):
+    """Store keeping the process numbers of each saved watermark."""
+
+    def __init__(self):
+        """__init__."""
+        super().__init__()
+        self.rows = []
+        self.schedules = []
+
+    def update(self, organization_id, rows, schedules=()):
+        """Record and save watermarks."""
+        self.rows.extend(process_number for process_number, _ in rows)
+        self.schedules.extend(
+            process_number for process_number, _ in schedules)
+        super().update(organization_id, rows, schedules)
+
+
+class TestChangeFeed(unittest.TestCase):
+    """Test incremental change feed."""
+
+    def test__poll_yields_only_changes(self):
+        """Test unchanged processes are not yielded and diffs are kept."""
+        tratum_api = FakeTratumAPI({
+            "1": {"last_update": "2024-01-01", "status": "Ativo",
+                  "movements": [1]},
+            "2": {"last_update": "2024-01-01", "status": "Ativo"}})
+        feed = ChangeFeed(tratum_api, min_interval=0, interval_factor=0)
+        feed.track(["1", "2"])
+
+        changes = list(feed.poll())
+        self.assertEqual({change.process_number for change in changes},
+                         {"1", "2"})
+        self.assertTrue(all(change.is_new for change in changes))
+        self.assertListEqual(list(feed.poll()), [])
+
+        tratum_api.details["1"] = {
+            "last_update": "2024-02-01", "status": "Arquivado",
+            "movements": [1, 2]}
+        changes = list(feed.poll())
+        self.assertEqual(len(changes), 1)
+        self.assertFalse(changes[0].is_new)
+        self.assertDictEqual(changes[0].changed_fields, {
+            "last_update": ("2024-01-01", "2024-02-01"),
+            "status": ("Ativo", "Arquivado"),
+            "movements": (None, [1, 2])})
+
+    def test__schedule_and_errors(self):
+        """Test quiet processes are not due and errors are kept."""
+        tratum_api = FakeTratumAPI({
+            "1": {"last_update": "2024-01-01"},
+            "2": ValueError("boom")})
+        feed = ChangeFeed(tratum_api, min_interval=60, max_interval=120)
+        feed.track(["1", "2"])
+        self.assertEqual(len(list(feed.poll())), 1)
+        self.assertIn("2", feed.errors)
+        self.assertListEqual(list(feed.poll()), [])
+        self.assertEqual(len(tratum_api.calls), 2)
+
+        watermark = feed.store.get(1, "1")
+        self.assertAlmostEqual(
+            watermark["next_poll_at"] - watermark["last_checked_at"], 60)
+        now = watermark["last_changed_at"] + 1000
+        self.assertEqual(
+            feed.next_interval(now, watermark["last_changed_at"]), 120)
+
+    def test__store_persists(self):
+        """Test watermarks survive reopening the database."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "feed.sqlite3")
+            tratum_api = FakeTratumAPI({"1": {"last_update": "2024-01-01"}})
+            feed = ChangeFeed(
+                tratum_api, store=WatermarkStore(path), min_interval=0)
+            feed.track(["1"])
+            self.assertEqual(len(list(feed.poll())), 1)
+            feed.store.close()
+
+            feed = ChangeFeed(
+                tratum_api, store=WatermarkStore(path), min_interval=0)
+            self.assertListEqual(list(feed.poll()), [])
+            feed.store.close()
+
+    def test__compact_watermark(self):
+        """Test large fields are hashed and unchanged are not rewritten."""
+        content_all = "movimento " * 1000
+        tratum_api = FakeTratumAPI({
+            "1": {"last_update": "2024-01-01", "content_all": content_all},
+            "2": ValueError("boom")})
+        store = RecordingStore()
+        feed = ChangeFeed(
+            tratum_api, store=store, min_interval=0, interval_factor=0)
+        feed.track(["1", "2"])
+        self.assertEqual(len(list(feed.poll())), 1)
+        watermark = store.get(1, "1")
+        self.assertNotIn("content_all", watermark["field_values"])
+        self.assertIn("content_all", watermark["field_hashes"])
+        self.assertListEqual(store.rows, ["1"])
+        self.assertListEqual(store.schedules, ["2"])
+
+        self.assertListEqual(list(feed.poll()), [])
+        self.assertListEqual(store.rows, ["1"])
+        self.assertListEqual(sorted(store.schedules), ["1", "2", "2"])
+        self.assertEqual(store.get(1, "1")["content_hash"],
+                         watermark["content_hash"])
+
+        tratum_api.details["1"] = {
+            "last_update": "2024-01-01", "content_all": content_all + "."}
+        changes = list(feed.poll())
+        self.assertDictEqual(changes[0].changed_fields, {
+            "content_all": (None, content_all + ".")})
+        self.assertListEqual(store.rows, ["1", "1"])
+
+    def test__revalidate_cache(self):
+        """Test polls revalidate cached details instead of bypassing it."""
+        with MockTratumServer(detail_size=1000) as server:
+            tratum_api = TratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                base_url=server.url, cache=ProcessDetailCache(ttl=300))
+            feed = ChangeFeed(tratum_api, min_interval=0, interval_factor=0)
+            feed.track(["19777928520247108243"])
+            self.assertEqual(len(list(feed.poll())), 1)
+            self.assertListEqual(list(feed.poll()), [])
+            self.assertEqual(server.requests["process_detail"], 2)
+            self.assertEqual(tratum_api.cache.stats()["revalidations"], 1)
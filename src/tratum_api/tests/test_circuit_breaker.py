@@ -0,0 +1,185 @@
+"""Test circuit breakers of end-points."""
+import time
+import asyncio
+import unittest
+from tratum_api.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers)
+from tratum_api.data import TratumAPI
+from tratum_api.exceptions import (
+    TratumAPICircuitOpenException, TratumAPIProblemAPIException)
+from tratum_api.mock_server import MockTratumServer
+
+try:
+    import aiohttp
+    from tratum_api.async_data import AsyncTratumAPI
+except ImportError:
+    aiohttp = None
+
+VALID_PROCESS = "19777928520247108243"
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test state transitions of a breaker."""
+
+    def test__failure_rate(self):
+        """Test circuit opens on failures and closes after probes."""
+        breaker = CircuitBreaker(
+            name="process_detail", failure_rate=0.5, window_size=4,
+            minimum_calls=4, open_timeout=0.05, half_open_calls=2)
+        for failed in (False, True, False):
+            breaker.acquire()
+            breaker.record(failed=failed)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record(failed=True)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertGreater(breaker.retry_in(), 0)
+        with self.assertRaises(TratumAPICircuitOpenException) as context:
+            breaker.acquire()
+        self.assertEqual(
+            context.exception.payload["endpoint"], "process_detail")
+        self.assertIsInstance(
+            context.exception, TratumAPIProblemAPIException)
+
+        # Only `half_open_calls` probes are allowed
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        breaker.record()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.to_dict()["calls"], 0)
+
+    def test__slow_calls(self):
+        """Test circuit opens on latency and failed probes reopen it."""
+        breaker = CircuitBreaker(
+            slow_call_rate=0.5, slow_call_duration=1.0, window_size=10,
+            minimum_calls=2, open_timeout=0.05)
+        breaker.record(duration=0.1)
+        breaker.record(duration=0.2)
+        self.assertEqual(breaker.to_dict()["slow_call_rate"], 0.0)
+        breaker.record(duration=2.0)
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record(duration=2.0)
+        self.assertEqual(breaker.state, OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record(duration=2.0)
+        self.assertEqual(breaker.state, OPEN)
+        breaker.reset()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test__probe_release_and_timeout(self):
+        """Test released probes are reused and stale probes reopen."""
+        breaker = CircuitBreaker(
+            minimum_calls=1, open_timeout=0.05, probe_timeout=0.05)
+        breaker.record(failed=True)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.release()
+        self.assertTrue(breaker.allow())
+
+        # Probe without outcome counts as failed after `probe_timeout`
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, OPEN)
+        breaker.record()
+        self.assertEqual(breaker.state, OPEN)
+
+    def test__breakers(self):
+        """Test breakers are kept by end-point."""
+        breakers = CircuitBreakers(
+            per_endpoint={"login": {"minimum_calls": 1}}, minimum_calls=2)
+        breakers.record("login", status_code=503)
+        breakers.record("process_detail", status_code=404)
+        breakers.record("process_detail", status_code=200)
+        breakers.record("process_detail", failed=True)
+        self.assertTrue(breakers.is_open("login"))
+        self.assertFalse(breakers.is_open("process_detail"))
+        states = breakers.states()
+        self.assertEqual(states["login"]["state"], OPEN)
+        self.assertEqual(states["process_detail"]["calls"], 3)
+        self.assertAlmostEqual(
+            states["process_detail"]["failure_rate"], 1 / 3)
+        breakers.reset()
+        self.assertFalse(breakers.is_open("login"))
+
+
+class TestClientCircuitBreaker(unittest.TestCase):
+    """Test client fails fast while circuit is open."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(
+            detail_size=1000, error_status=503).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def tearDown(self):
+        """Stop injecting errors."""
+        self.server.error_rate = 0.0
+        self.server.reset()
+
+    def test__fail_fast(self):
+        """Test open circuit does not send requests."""
+        breakers = CircuitBreakers(
+            window_size=4, minimum_calls=2, open_timeout=0.2)
+        events = []
+        tratum_api = TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, retry_policies={},
+            circuit_breakers=breakers, hooks=[events.append])
+        self.server.error_rate = 1.0
+        for _ in range(2):
+            with self.assertRaises(TratumAPIProblemAPIException):
+                tratum_api.get_process_detail(VALID_PROCESS)
+        with self.assertRaises(TratumAPICircuitOpenException):
+            tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(self.server.requests["process_detail"], 2)
+        self.assertEqual(events[-1].error, "CircuitOpen")
+        self.assertEqual(
+            breakers.states()["process_detail"]["state"], OPEN)
+        self.assertEqual(breakers.states()["login"]["state"], CLOSED)
+
+        # Half-open probe closes the circuit
+        self.server.error_rate = 0.0
+        time.sleep(0.25)
+        tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertFalse(breakers.is_open("process_detail"))
+        self.assertEqual(self.server.requests["process_detail"], 3)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test__async_cancelled_probe(self):
+        """Test cancelled half-open probe frees its slot."""
+        breakers = CircuitBreakers(minimum_calls=1, open_timeout=0.05)
+        breakers.record("process_detail", failed=True)
+        time.sleep(0.06)
+
+        async def run():
+            async with AsyncTratumAPI(
+                    tratum_email="email", tratum_password="password", # NOQA
+                    organization_id=1, holder_id=1, cnpj="cnpj",
+                    base_url=self.server.url, retry_policies={},
+                    circuit_breakers=breakers) as tratum_api:
+                await tratum_api._get_token()
+                self.server.latency = 0.5
+                try:
+                    with self.assertRaises(asyncio.TimeoutError):
+                        await asyncio.wait_for(
+                            tratum_api.get_process_detail(VALID_PROCESS),
+                            0.05)
+                finally:
+                    self.server.latency = 0.0
+                self.assertEqual(breakers["process_detail"].state, HALF_OPEN)
+                await tratum_api.get_process_detail(VALID_PROCESS)
+
+        asyncio.run(run())
+        self.assertEqual(breakers["process_detail"].state, CLOSED)
@@ -0,0 +1,160 @@
+"""Test command line interface."""
+import io
+import os
+import json
+import tempfile
+import itertools
+import unittest
+from tratum_api.cli import iter_input, main
+from tratum_api.mock_server import MockTratumServer
+
+VALID_PROCESS = "19777928520247108243"
+INVALID_PROCESS = "00000000000000000000"
+
+
+class TestInput(unittest.TestCase):
+    """Test lazy reading of process numbers."""
+
+    def test__formats(self):
+        """Test CSV, plain text and NDJSON inputs."""
+        cases = [
+            "process_number,name\n1,a\n\n2,b\n",
+            "name;x\n",
+            "1\n2\n",
+            '{"process": "1"}\n\n{"process": 2}\n',
+            '"1"\n"2"\n',
+        ]
+        results = [list(iter_input(io.StringIO(case))) for case in cases]
+        self.assertEqual(results, [["1", "2"], [], ["1", "2"],
+                                   ["1", "2"], ["1", "2"]])
+        self.assertEqual(list(iter_input(
+            io.StringIO("a,b\n1,2\n"), column="b")), ["2"])
+        self.assertEqual(list(iter_input(
+            io.StringIO('{"id": 1, "b": 2}\n'), "ndjson", "b")), ["2"])
+        with self.assertRaises(ValueError):
+            list(iter_input(io.StringIO("a,b\n1,2\n"), column="c"))
+
+    def test__lazy(self):
+        """Test input is consumed only as process numbers are read."""
+        lines = ("{}\n".format(index) for index in itertools.count())
+        process_numbers = iter_input(lines, "csv")
+        self.assertEqual(
+            list(itertools.islice(process_numbers, 3)), ["0", "1", "2"])
+        self.assertEqual(next(lines), "3\n")
+
+
+class TestCommands(unittest.TestCase):
+    """Test commands against the local mock of Tratum API."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(
+            detail_size=1000, documents_count=2, document_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Create input file."""
+        self.server.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp_dir.name, "processes.csv")
+        self.output = os.path.join(self.tmp_dir.name, "results.ndjson")
+        with open(self.input, "w") as file:
+            file.write("process_number\n{valid}\n{invalid}\n".format(
+                valid=VALID_PROCESS, invalid=INVALID_PROCESS))
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.tmp_dir.cleanup()
+
+    def _run(self, *args) -> tuple:
+        """Run command returning exit code and results."""
+        code = main(list(args) + [
+            self.input, "-o", self.output, "--no-progress"])
+        with open(self.output) as file:
+            results = [json.loads(line) for line in file]
+        return code, sorted(results, key=lambda x: x["process_number"])
+
+    def _api_args(self) -> list:
+        """Credentials and URL of the mock server."""
+        return [
+            "--email", "email", "--password", "password",
+            "--organization-id", "1", "--holder-id", "1", "--cnpj", "cnpj",
+            "--base-url", self.server.url, "--workers", "2"]
+
+    def test__validate(self):
+        """Test validation without API calls."""
+        code, results = self._run("validate")
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            [result["success"] for result in results], [False, True])
+        self.assertEqual(results[1]["normalized"], VALID_PROCESS)
+        self.assertEqual(sum(self.server.requests.values()), 0)
+
+    def test__monitor(self):
+        """Test monitor and unmonitor."""
+        code, results = self._run("monitor", *self._api_args())
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            results[0]["error"]["type"], "TratumAPIInvalidDocumentException")
+        self.assertEqual(results[1]["result"]["process"]["status"], "VALID")
+        self.assertEqual(self.server.monitored, {VALID_PROCESS})
+
+        # Ledger skips processes already monitored
+        ledger = os.path.join(self.tmp_dir.name, "ledger.sqlite3")
+        for _ in range(2):
+            self._run("monitor", *self._api_args(), "--ledger", ledger)
+        self.assertEqual(self.server.requests["import_process"], 5)
+
+        self.input = os.path.join(self.tmp_dir.name, "processes.ndjson")
+        with open(self.input, "w") as file:
+            file.write('{"process": "%s"}\n' % VALID_PROCESS)
+        code, results = self._run("unmonitor", *self._api_args())
+        self.assertEqual(code, 0)
+        self.assertEqual(self.server.monitored, set())
+
+    def test__detail_and_download(self):
+        """Test details and document downloads."""
+        code, results = self._run("detail", *self._api_args())
+        self.assertEqual(results[1]["result"]["process"], VALID_PROCESS)
+
+        dest_dir = os.path.join(self.tmp_dir.name, "documents")
+        code, results = self._run(
+            "download", *self._api_args(), "--dest-dir", dest_dir)
+        documents = [result for result in results if result["success"]]
+        self.assertEqual(len(documents), 2)
+        for document in documents:
+            self.assertEqual(document["process_number"], VALID_PROCESS)
+            self.assertEqual(os.path.getsize(document["path"]), 1000)
+
+    def test__download_path_traversal(self):
+        """Test invalid numbers are item errors and never paths."""
+        self.input = os.path.join(self.tmp_dir.name, "processes.ndjson")
+        with open(self.input, "w") as file:
+            file.write('{"process": "../../escaped"}\n')
+            file.write('{"process": "%s"}\n' % os.path.join(
+                self.tmp_dir.name, "absolute"))
+            file.write('{"process": "1977792-85.2024.7.10.8243"}\n')
+        dest_dir = os.path.join(self.tmp_dir.name, "documents")
+        code, results = self._run(
+            "download", *self._api_args(), "--dest-dir", dest_dir)
+        self.assertEqual(code, 1)
+        errors = [result for result in results if not result["success"]]
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(
+            errors[0]["error"]["type"], "TratumAPIInvalidDocumentException")
+        self.assertListEqual(os.listdir(dest_dir), [VALID_PROCESS])
+        self.assertListEqual(
+            sorted(os.listdir(self.tmp_dir.name)),
+            ["documents", "processes.csv", "processes.ndjson",
+             "results.ndjson"])
+
+    def test__missing_credentials(self):
+        """Test credentials are required for API commands."""
+        with self.assertRaises(SystemExit):
+            main(["monitor", self.input, "--no-progress",
+                  "--email", "", "--password", ""])
@@ -0,0 +1,140 @@
+"""Test content-addressed document store."""
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from tratum_api.data import TratumAPI
+from tratum_api.document_store import DocumentStore
+from tratum_api.mock_server import MockTratumServer
+
+
+class TestDocumentStore(unittest.TestCase):
+    """Test content-addressed document store."""
+
+    def setUp(self):
+        """Create store directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+
+    def tearDown(self):
+        """Remove store directory."""
+        self.tmp_dir.cleanup()
+
+    def test__content_addressed(self):
+        """Test documents with same content share a blob."""
+        store = DocumentStore(self.root)
+        path_a = store.add("Processos/1/a.pdf", b"same content")
+        path_b = store.add("Processos/2/b.pdf", b"same content")
+        self.assertEqual(path_a, path_b)
+        self.assertEqual(store.stats()["blobs"], 1)
+        self.assertEqual(store.stats()["documents"], 2)
+        self.assertIsNone(store.get_path("Processos/3/c.pdf"))
+
+        document = store.open("Processos/1/a.pdf")
+        self.assertEqual(document[:4], b"same")
+        document.close()
+        self.assertListEqual(os.listdir(os.path.join(self.root, "tmp")), [])
+
+        # Other process sees the same index
+        other = DocumentStore(self.root)
+        self.assertEqual(other.get_path("Processos/2/b.pdf"), path_a)
+
+    def test__lru_eviction(self):
+        """Test least recently used blobs are evicted."""
+        store = DocumentStore(self.root, max_bytes=250)
+        store.add("a", b"a" * 100)
+        time.sleep(0.01)
+        store.add("b", b"b" * 100)
+        time.sleep(0.01)
+        store.get_path("a")
+        time.sleep(0.01)
+        store.add("c", b"c" * 100)
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertIn("c", store)
+        self.assertEqual(store.stats()["evictions"], 1)
+        self.assertLessEqual(store.size, 250)
+
+    def test__removed_blob(self):
+        """Test blobs removed by other process are treated as misses."""
+        store = DocumentStore(self.root)
+        os.remove(store.add("a", b"content"))
+        self.assertIsNone(store.get_path("a"))
+        self.assertNotIn("a", store)
+
+    def test__concurrent_writes(self):
+        """Test concurrent writers of the same documents."""
+        stores = [DocumentStore(self.root) for _ in range(4)]
+
+        def add(index):
+            store = stores[index % len(stores)]
+            return store.add("doc-{}".format(index % 5), b"x" * (index % 5))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(add, range(100)))
+        self.assertEqual(stores[0].stats()["documents"], 5)
+        self.assertEqual(stores[0].stats()["blobs"], 5)
+        # Empty and mapped documents share the file interface
+        for document_url, content in (("doc-0", b""), ("doc-2", b"xx")):
+            with stores[0].open(document_url) as document:
+                self.assertEqual(document.read(), content)
+
+
+class TestClientDocumentStore(unittest.TestCase):
+    """Test client downloads using the document store."""
+
+    def test__downloads_once(self):
+        """Test stored documents are not downloaded again."""
+        with tempfile.TemporaryDirectory() as root, \
+                MockTratumServer(document_size=50_000) as server:
+            tratum_api = TratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                base_url=server.url, document_store=DocumentStore(root))
+            document_url = "Processos/401/1/doc-0.pdf"
+            content = tratum_api.download_process_document(document_url)
+            self.assertEqual(
+                tratum_api.download_process_document(document_url), content)
+
+            path = tratum_api.get_process_document_path(document_url)
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), content)
+            document = tratum_api.open_process_document(document_url)
+            self.assertEqual(document[:], content)
+            document.close()
+
+            destination = os.path.join(root, "copy.pdf")
+            result = tratum_api.save_process_document(
+                document_url, destination)
+            self.assertEqual(result["size"], 50_000)
+            self.assertEqual(server.requests["document_download"], 1)
+
+            other_url = "Processos/401/1/doc-1.pdf"
+            tratum_api.save_process_document(other_url, destination)
+            self.assertIn(other_url, tratum_api.document_store)
+            self.assertEqual(server.requests["document_download"], 2)
+
+    def test__evicted_while_reading(self):
+        """Test blobs removed after `get_path` are downloaded again."""
+        with tempfile.TemporaryDirectory() as root, \
+                MockTratumServer(document_size=50_000) as server:
+            tratum_api = TratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                base_url=server.url, document_store=DocumentStore(root))
+            document_url = "Processos/401/1/doc-0.pdf"
+            content = tratum_api.download_process_document(document_url)
+            missing = os.path.join(root, "evicted")
+            with mock.patch.object(
+                    tratum_api.document_store, "get_path",
+                    return_value=missing):
+                self.assertEqual(
+                    tratum_api.download_process_document(document_url),
+                    content)
+                destination = os.path.join(root, "copy.pdf")
+                result = tratum_api.save_process_document(
+                    document_url, destination)
+            self.assertEqual(result["size"], 50_000)
+            self.assertEqual(server.requests["document_download"], 3)
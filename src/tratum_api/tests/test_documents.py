@@ -0,0 +1,96 @@
+"""Test process documents helpers."""
+import os
+import tempfile
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.documents import (
+    DocumentManifest, document_local_path, file_checksum,
+    iter_document_urls)
+from tratum_api.mock_server import MockTratumServer
+
+VALID_PROCESS = "19777928520247108243"
+
+
+class TestDocuments(unittest.TestCase):
+    """Test process documents helpers."""
+
+    def test__iter_document_urls(self):
+        """Test documents are found in nested structures."""
+        process_detail = {
+            "documents": [
+                {"name": "Decisão", "url": "Processos/401/1/a.pdf"},
+                {"name": "Sentença", "files": ["Processos/401/1/b.pdf"]},
+            ],
+            "ref_docs": ["Processos/401/1/a.pdf", "other/c.PDF"],
+            "content_all": "Processos/401/1/ignored.pdf",
+        }
+        self.assertListEqual(
+            list(iter_document_urls(process_detail)),
+            ["Processos/401/1/a.pdf", "Processos/401/1/b.pdf",
+             "other/c.PDF"])
+        self.assertListEqual(list(iter_document_urls({})), [])
+
+    def test__document_local_path(self):
+        """Test document path stays inside destination directory."""
+        with tempfile.TemporaryDirectory() as dest_dir:
+            self.assertEqual(
+                document_local_path(dest_dir, "Processos/401/a.pdf"),
+                os.path.join(dest_dir, "Processos", "401", "a.pdf"))
+            self.assertEqual(
+                document_local_path(dest_dir, "/../../etc/passwd"),
+                os.path.join(dest_dir, "etc", "passwd"))
+
+    def test__manifest(self):
+        """Test manifest skips only files matching size and checksum."""
+        with tempfile.TemporaryDirectory() as dest_dir:
+            local_path = os.path.join(dest_dir, "a.pdf")
+            with open(local_path, "wb") as file:
+                file.write(b"%PDF-1.4 content")
+
+            manifest = DocumentManifest(dest_dir)
+            self.assertFalse(manifest.is_downloaded("a.pdf", local_path))
+            manifest.add("a.pdf", 16, file_checksum(local_path))
+            manifest.save()
+
+            manifest = DocumentManifest(dest_dir)
+            self.assertTrue(manifest.is_downloaded(
+                "a.pdf", local_path, verify_checksum=True))
+
+            with open(local_path, "wb") as file:
+                file.write(b"%PDF-1.4 CONTENT")
+            self.assertTrue(manifest.is_downloaded("a.pdf", local_path))
+            self.assertFalse(manifest.is_downloaded(
+                "a.pdf", local_path, verify_checksum=True))
+
+
+class TestDownloadProcessDocuments(unittest.TestCase):
+    """Test parallel download of process documents."""
+
+    def test__skip_downloaded(self):
+        """Test second run skips every file without downloading."""
+        with MockTratumServer(
+                detail_size=100, documents_count=4,
+                document_size=5000) as server, \
+                tempfile.TemporaryDirectory() as dest_dir:
+            tratum_api = TratumAPI(
+                tratum_email="email", tratum_password="password", # NOQA
+                organization_id=1, holder_id=1, cnpj="cnpj",
+                base_url=server.url)
+            results = list(tratum_api.download_process_documents(
+                VALID_PROCESS, dest_dir, max_workers=2))
+            self.assertEqual(len(results), 4)
+            self.assertTrue(all(
+                result["success"] and not result["skipped"]
+                for result in results))
+            for result in results:
+                with open(result["path"], "rb") as file:
+                    self.assertEqual(file.read(), server.document())
+            self.assertEqual(server.requests["document_download"], 4)
+
+            server.reset()
+            results = list(tratum_api.download_process_documents(
+                VALID_PROCESS, dest_dir, verify_checksum=True))
+            self.assertEqual(len(results), 4)
+            self.assertTrue(all(result["skipped"] for result in results))
+            self.assertEqual(server.requests["document_url"], 0)
+            self.assertEqual(server.requests["document_download"], 0)
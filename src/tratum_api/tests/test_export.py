@@ -0,0 +1,108 @@
+"""Test streaming export of process details."""
+import os
+import json
+import tempfile
+import unittest
+from tratum_api.export import (
+    EXPORT_FIELDS, export_process_details, flatten_process_detail,
+    iter_export_batches)
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class FakeTratumAPI:
+    """Client returning generated process details."""
+
+    def get_process_detail(self, process_number):
+        """Return a process detail, numbers ending with 9 fail."""
+        if process_number.endswith("9"):
+            raise ValueError("not found")
+        return {
+            "process": process_number,
+            "status": "Ativo",
+            "value_claim": "1500.50",
+            "has_resource": True,
+            "year_distribution_date": 2020,
+            "person_custom": {"name": "Maria"},
+            "content_all": "x" * 1000,
+            "documents": [{"url": "Processos/1/a.pdf"}],
+        }
+
+
+def _process_numbers(size: int):
+    """Generate process numbers lazily."""
+    for index in range(size):
+        yield "{:020d}".format(index)
+
+
+class TestExport(unittest.TestCase):
+    """Test streaming export of process details."""
+
+    def test__flatten(self):
+        """Test scalar fields are converted and nested are dropped."""
+        row = flatten_process_detail(
+            "1", FakeTratumAPI().get_process_detail("1"))
+        self.assertListEqual(list(row), ["process_number"] + list(
+            EXPORT_FIELDS))
+        self.assertNotIn("content_all", row)
+        self.assertEqual(row["value_claim"], 1500.5)
+        self.assertEqual(row["year_distribution_date"], 2020)
+        self.assertEqual(row["person_custom"], '{"name": "Maria"}')
+        self.assertIsNone(row["court"])
+
+    def test__batches(self):
+        """Test rows are yielded in batches and errors are kept."""
+        errors = {}
+        batches = list(iter_export_batches(
+            FakeTratumAPI(), _process_numbers(25), batch_size=10,
+            max_workers=4, errors=errors))
+        self.assertListEqual([len(batch) for batch in batches], [10, 10, 3])
+        self.assertEqual(len(errors), 2)
+
+    def test__export_ndjson(self):
+        """Test NDJSON export."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "details.ndjson")
+            summary = export_process_details(
+                FakeTratumAPI(), _process_numbers(25), path, batch_size=10)
+            self.assertEqual(summary["rows"], 23)
+            self.assertEqual(summary["batches"], 3)
+            with open(path, encoding="utf-8") as file:
+                rows = [json.loads(line) for line in file]
+            self.assertEqual(len(rows), 23)
+            self.assertFalse(os.path.exists(path + ".part"))
+
+            export_process_details(
+                FakeTratumAPI(), _process_numbers(5), path,
+                fields=("value_claim", "status"))
+            with open(path, encoding="utf-8") as file:
+                row = json.loads(file.readline())
+            self.assertListEqual(
+                list(row), ["process_number", "value_claim", "status"])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test__export_parquet(self):
+        """Test each batch is written as a Parquet row group."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "details.parquet")
+            export_process_details(
+                FakeTratumAPI(), _process_numbers(25), path, batch_size=10)
+            parquet_file = pyarrow.parquet.ParquetFile(path)
+            self.assertEqual(parquet_file.metadata.num_rows, 23)
+            self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+            table = parquet_file.read()
+            self.assertEqual(str(table.schema.field("has_resource").type),
+                             "bool")
+
+            path = os.path.join(directory, "empty.parquet")
+            export_process_details(FakeTratumAPI(), [], path)
+            self.assertEqual(
+                pyarrow.parquet.ParquetFile(path).metadata.num_rows, 0)
+
+    def test__unknown_format(self):
+        """Test unknown formats raise error."""
+        with self.assertRaises(ValueError):
+            export_process_details(FakeTratumAPI(), [], "details.csv")
@@ -0,0 +1,136 @@
+"""Test instrumentation hooks."""
+import unittest
+from tratum_api.cache import ProcessDetailCache
+from tratum_api.data import TratumAPI
+from tratum_api.instrumentation import (
+    MetricsCollector, OpenTelemetryHook, PrometheusHook, RequestEvent)
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.retry import RetryPolicy
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter)
+except ImportError:
+    TracerProvider = None
+
+VALID_PROCESS = "19777928520247108243"
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test instrumentation hooks."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.error_rate = 0.0
+
+    def _client(self, hooks: list, **kwargs) -> TratumAPI:
+        """Client pointing to the mock server."""
+        return TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, hooks=hooks, **kwargs)
+
+    def test__events(self):
+        """Test events have timings, sizes and cache outcome."""
+        events = []
+        tratum_api = self._client(
+            [events.append], cache=ProcessDetailCache(ttl=0))
+        self.assertEqual(events[0].endpoint, "login")
+        self.assertGreater(events[0].bytes_sent, 0)
+
+        tratum_api.get_process_detail(VALID_PROCESS)
+        tratum_api.get_process_detail(VALID_PROCESS)
+        miss, revalidated = events[1:]
+        self.assertEqual(miss.cache, "miss")
+        self.assertEqual(miss.status_code, 200)
+        self.assertGreater(miss.bytes_received, 1000)
+        self.assertGreater(miss.parse_time, 0)
+        self.assertGreaterEqual(miss.duration, miss.response_time)
+        self.assertNotIn("?", miss.url)
+        self.assertEqual(revalidated.cache, "revalidated")
+        self.assertEqual(revalidated.status_code, 304)
+
+        tratum_api.cache.ttl = 300
+        tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(events[-1].cache, "hit")
+        self.assertIsNone(events[-1].status_code)
+
+    def test__collector_and_retries(self):
+        """Test collector summary counts retries and errors."""
+        collector = MetricsCollector()
+        tratum_api = self._client([collector], retry_policies={
+            "process_detail": RetryPolicy(
+                max_attempts=50, base_delay=0.001, max_delay=0.002)})
+        self.server.error_rate = 0.5
+        for _ in range(5):
+            tratum_api.get_process_detail(VALID_PROCESS)
+        summary = collector.summary()["process_detail"]
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["status_codes"], {200: 5})
+        self.assertEqual(
+            summary["retries"],
+            self.server.requests["process_detail"] - 5)
+        self.assertGreaterEqual(summary["p99"], summary["p50"])
+
+    def test__hook_errors(self):
+        """Test failing hooks do not break requests."""
+        def failing_hook(event):
+            raise ValueError("broken hook")
+
+        tratum_api = self._client([failing_hook])
+        with self.assertLogs("tratum_api.instrumentation", "ERROR"):
+            detail = tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(detail["process"], VALID_PROCESS)
+
+    @unittest.skipIf(prometheus_client is None, "prometheus_client missing")
+    def test__prometheus(self):
+        """Test Prometheus counters and histograms."""
+        registry = prometheus_client.CollectorRegistry()
+        hook = PrometheusHook(registry=registry)
+        event = RequestEvent("process_detail", "GET", "http://host/v1")
+        event.status_code = 200
+        event.attempts = 3
+        event.bytes_received = 100
+        event.finish()
+        hook(event)
+        self.assertEqual(registry.get_sample_value(
+            "tratum_api_requests_total",
+            {"endpoint": "process_detail", "status": "200"}), 1)
+        self.assertEqual(registry.get_sample_value(
+            "tratum_api_retries_total", {"endpoint": "process_detail"}), 2)
+        self.assertEqual(registry.get_sample_value(
+            "tratum_api_request_duration_seconds_count",
+            {"endpoint": "process_detail"}), 1)
+
+    @unittest.skipIf(TracerProvider is None, "opentelemetry-sdk missing")
+    def test__opentelemetry(self):
+        """Test events are exported as client spans."""
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        tratum_api = self._client(
+            [OpenTelemetryHook(tracer=provider.get_tracer("test"))])
+        tratum_api.get_process_detail(VALID_PROCESS)
+        spans = exporter.get_finished_spans()
+        self.assertListEqual(
+            [span.name for span in spans],
+            ["tratum_api login", "tratum_api process_detail"])
+        self.assertEqual(
+            spans[1].attributes["http.response.status_code"], 200)
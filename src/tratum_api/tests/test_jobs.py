@@ -0,0 +1,168 @@
+"""Test crash-safe bulk jobs."""
+import os
+import tempfile
+import unittest
+from tratum_api.exceptions import TratumAPIInvalidDocumentException
+from tratum_api.jobs import JobJournal, JobRunner, DONE, FAILED, IN_FLIGHT
+
+
+class FakeTratumAPI:
+    """Client recording calls, invalid processes raise errors."""
+
+    organization_id = 1
+
+    def __init__(self, invalid: set = ()):
+        """__init__."""
+        self.invalid = set(invalid)
+        self.calls = []
+        self.monitored = set()
+
+    def monitor_process(self, process_number: str) -> dict:
+        """Monitor process."""
+        self.calls.append(process_number)
+        if process_number in self.invalid:
+            raise TratumAPIInvalidDocumentException(
+                message="Process is invalid",
+                payload={"process_number": process_number})
+        self.monitored.add(process_number)
+        return {"process": {"process": process_number, "status": "VALID"}}
+
+    def get_process_detail(self, process_number: str,
+                           use_cache: bool = True) -> dict:
+        """Return detail with the monitoring state of the process."""
+        return {
+            "inactive_organization": process_number not in self.monitored}
+
+    def remove_monitor_process(self, process_number: str) -> bool:
+        """Remove process monitoring."""
+        self.calls.append(process_number)
+        return True
+
+
+class TestJobs(unittest.TestCase):
+    """Test crash-safe bulk jobs."""
+
+    def setUp(self):
+        """Create journal at a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "jobs.sqlite3")
+        self.journal = JobJournal(self.path)
+        self.items = ["{:020d}".format(index) for index in range(50)]
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.journal.close()
+        self.tmp_dir.cleanup()
+
+    def test__run(self):
+        """Test job states, results and errors."""
+        tratum_api = FakeTratumAPI(invalid=self.items[:3])
+        runner = JobRunner(tratum_api, self.journal, max_workers=4,
+                           commit_every=7)
+        self.assertEqual(runner.create("job", "monitor", self.items), 50)
+        self.assertEqual(runner.create("job", "monitor", self.items), 0)
+        results = []
+        counts = runner.run("job", callback=results.append)
+        self.assertEqual(counts[DONE], 47)
+        self.assertEqual(counts[FAILED], 3)
+        self.assertEqual(len(results), 50)
+        self.assertEqual(sorted(tratum_api.calls), self.items)
+        self.assertIsNotNone(self.journal.get_job("job")["finished_at"])
+
+        failed = list(runner.failed("job"))
+        self.assertEqual(
+            sorted(item["process_number"] for item in failed),
+            self.items[:3])
+        self.assertEqual(
+            failed[0]["error"]["type"], "TratumAPIInvalidDocumentException")
+        done = next(self.journal.items("job", state=DONE))
+        self.assertEqual(done["result"]["process"]["status"], "VALID")
+        self.assertEqual(done["attempts"], 1)
+
+        # Nothing is sent again unless failed items are retried
+        tratum_api.calls = []
+        runner.run("job")
+        self.assertEqual(tratum_api.calls, [])
+        tratum_api.invalid = set()
+        counts = runner.run("job", retry_failed=True)
+        self.assertEqual(sorted(tratum_api.calls), self.items[:3])
+        self.assertEqual(counts[DONE], 50)
+
+    def test__resume(self):
+        """Test job resumes after the worker dies."""
+        tratum_api = FakeTratumAPI()
+        runner = JobRunner(tratum_api, self.journal, max_workers=2,
+                           commit_every=5)
+        runner.create("job", "monitor", self.items)
+
+        def crash(result):
+            """Stop the run as a dead worker."""
+            if len(tratum_api.calls) >= 20:
+                raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            runner.run("job", callback=crash)
+        self.journal.close()
+
+        journal = self.journal = JobJournal(self.path)
+        done = {
+            item["process_number"] for item in journal.items("job", DONE)}
+        counts = journal.counts("job")
+        self.assertGreater(counts[IN_FLIGHT], 0)
+        self.assertEqual(counts[DONE], len(done))
+        self.assertIsNone(journal.get_job("job")["finished_at"])
+
+        # Items in flight already monitored are not sent again
+        sent = set(tratum_api.calls)
+        self.assertGreater(len(sent - done), 0)
+        tratum_api.calls = []
+        counts = JobRunner(tratum_api, journal).run("job")
+        self.assertEqual(counts[DONE], 50)
+        self.assertEqual(
+            sorted(tratum_api.calls), sorted(set(self.items) - sent))
+
+    def test__resume_remove_monitor(self):
+        """Test items in flight of idempotent jobs are sent again."""
+        tratum_api = FakeTratumAPI()
+        runner = JobRunner(tratum_api, self.journal)
+        runner.create("job", "remove_monitor", self.items)
+        self.journal.claim("job", 10)
+        self.assertEqual(runner.run("job")[DONE], 50)
+        self.assertEqual(sorted(tratum_api.calls), self.items)
+
+    def test__lease(self):
+        """Test a job is run by one runner until its lease expires."""
+        tratum_api = FakeTratumAPI()
+        runner = JobRunner(tratum_api, self.journal)
+        runner.create("job", "monitor", self.items)
+        self.journal.claim("job", 10)
+        self.assertTrue(self.journal.acquire_lease("job", "other", 60))
+
+        # Items in flight of a live runner are not taken
+        with self.assertRaises(ValueError):
+            runner.run("job")
+        self.assertEqual(self.journal.counts("job")[IN_FLIGHT], 10)
+        self.assertEqual(tratum_api.calls, [])
+
+        # Lease of a dead runner expires
+        self.assertTrue(self.journal.acquire_lease("job", "other", -1))
+        self.assertEqual(runner.run("job")[DONE], 50)
+        self.assertTrue(self.journal.acquire_lease("job", "other", 60))
+
+    def test__validation(self):
+        """Test unknown operations, jobs and organizations."""
+        runner = JobRunner(FakeTratumAPI(), self.journal)
+        with self.assertRaises(ValueError):
+            runner.create("job", "detail", self.items)
+        with self.assertRaises(KeyError):
+            runner.run("job")
+        runner.create("job", "remove_monitor", self.items)
+        with self.assertRaises(ValueError):
+            runner.create("job", "monitor", self.items)
+        other = FakeTratumAPI()
+        other.organization_id = 2
+        with self.assertRaises(ValueError):
+            JobRunner(other, self.journal).run("job")
+        self.assertEqual(self.journal.jobs(), ["job"])
+        self.journal.delete_job("job")
+        self.assertIsNone(self.journal.get_job("job"))
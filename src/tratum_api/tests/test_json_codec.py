@@ -0,0 +1,92 @@
+"""Test JSON decoders and compressed responses."""
+import json
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.exceptions import TratumAPIInvalidDocumentException
+from tratum_api.json_codec import DECODERS, dumps, get_decoder
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.session import accept_encoding, build_session
+
+VALID_PROCESS = "19777928520247108243"
+
+
+class TestDecoders(unittest.TestCase):
+    """Test selection of JSON decoders."""
+
+    def test__get_decoder(self):
+        """Test names, functions and default decoder."""
+        self.assertIs(get_decoder("json"), json.loads)
+        self.assertIs(get_decoder(len), len)
+        default = next(
+            loads for loads in DECODERS.values() if loads is not None)
+        self.assertIs(get_decoder(), default)
+        with self.assertRaises(ValueError):
+            get_decoder("simplejson")
+        for name, loads in DECODERS.items():
+            if loads is None:
+                with self.assertRaises(ImportError):
+                    get_decoder(name)
+                continue
+            self.assertEqual(get_decoder(name)(b'{"a": [1]}'), {"a": [1]})
+            with self.assertRaises(ValueError):
+                loads(b'not json')
+
+    def test__dumps(self):
+        """Test compact UTF-8 encoding decoded by every decoder."""
+        value = {"status": "Sentença", "values": [1, 2.5, None, True]}
+        data = dumps(value)
+        self.assertIsInstance(data, bytes)
+        self.assertNotIn(b" ", data)
+        self.assertIn("Sentença".encode("utf-8"), data)
+        for loads in DECODERS.values():
+            if loads is not None:
+                self.assertEqual(loads(data), value)
+
+    def test__accept_encoding(self):
+        """Test session negotiates compression."""
+        encodings = accept_encoding().split(", ")
+        self.assertIn("gzip", encodings)
+        self.assertEqual(
+            build_session().headers["Accept-Encoding"], accept_encoding())
+
+
+class TestCompressedResponses(unittest.TestCase):
+    """Test clients decode compressed responses once."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server with compression."""
+        cls.server = MockTratumServer(
+            detail_size=20_000, compression=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def test__single_decode(self):
+        """Test each response body is decoded once."""
+        calls = []
+
+        def loads(data: bytes):
+            calls.append(len(data))
+            return json.loads(data)
+
+        tratum_api = TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, json_decoder=loads)
+        self.assertEqual(len(calls), 1)
+
+        events = []
+        tratum_api.hooks.append(events.append)
+        detail = tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(detail, self.server.process_detail(VALID_PROCESS))
+        self.assertEqual(len(calls), 2)
+        # Body was decompressed before decoding
+        self.assertGreater(calls[1], 20_000)
+        self.assertLess(events[0].bytes_received, calls[1])
+
+        with self.assertRaises(TratumAPIInvalidDocumentException):
+            tratum_api.monitor_process("00000000000000000000")
+        self.assertEqual(len(calls), 3)
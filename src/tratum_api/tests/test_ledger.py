@@ -0,0 +1,170 @@
+"""Test local ledger of monitored processes."""
+import os
+import time
+import tempfile
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.ledger import MonitoringLedger
+from tratum_api.mock_server import MockTratumServer
+
+VALID_PROCESS = "19777928520247108243"
+FORMATTED_PROCESS = "1977792-85.2024.7.10.8243"
+INVALID_PROCESS = "00000000000000000000"
+
+
+class FakeTratumAPI:
+    """Client returning `inactive_organization` from a dictionary."""
+
+    organization_id = 1
+
+    def __init__(self, inactive: dict):
+        """__init__."""
+        self.inactive = inactive
+
+    def get_process_detail(self, process_number, use_cache=True):
+        """Return detail with `inactive_organization` of the process."""
+        return {"inactive_organization": self.inactive[process_number]}
+
+
+class TestMonitoringLedger(unittest.TestCase):
+    """Test local ledger of monitored processes."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Create ledger at a temporary directory."""
+        self.server.reset()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "ledger.sqlite3")
+        self.ledger = MonitoringLedger(self.path)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.ledger.close()
+        self.tmp_dir.cleanup()
+
+    def _client(self, organization_id: int = 1) -> TratumAPI:
+        """Client with ledger pointing to the mock server."""
+        return TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=organization_id, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, monitoring_ledger=self.ledger)
+
+    def test__short_circuit(self):
+        """Test calls that would not change state are skipped."""
+        tratum_api = self._client()
+        response = tratum_api.monitor_process(VALID_PROCESS)
+        self.assertEqual(tratum_api.monitor_process(VALID_PROCESS), response)
+        self.assertEqual(self.server.requests["import_process"], 1)
+        tratum_api.monitor_process(VALID_PROCESS, refresh=True)
+        self.assertEqual(self.server.requests["import_process"], 2)
+
+        # Ledger is kept per organization and between clients
+        self._client(organization_id=2).monitor_process(VALID_PROCESS)
+        self.assertEqual(self.server.requests["import_process"], 3)
+        self.ledger.close()
+        self.ledger = MonitoringLedger(self.path)
+        tratum_api = self._client()
+        self.assertTrue(self.ledger.is_monitored(1, VALID_PROCESS))
+        self.assertTrue(tratum_api.remove_monitor_process(VALID_PROCESS))
+        self.assertTrue(tratum_api.remove_monitor_process(VALID_PROCESS))
+        self.assertEqual(self.server.requests["remove_monitor"], 1)
+        self.assertFalse(self.ledger.is_monitored(1, VALID_PROCESS))
+
+    def test__bulk(self):
+        """Test bulk calls use the ledger and errors are not recorded."""
+        tratum_api = self._client()
+        process_numbers = [VALID_PROCESS, INVALID_PROCESS] * 5
+        results = list(tratum_api.monitor_processes(
+            process_numbers, max_workers=1))
+        self.assertEqual(sum(result["success"] for result in results), 5)
+        self.assertEqual(self.server.requests["import_process"], 6)
+        self.assertEqual(self.ledger.count(1), 1)
+        self.assertIsNone(self.ledger.is_monitored(1, INVALID_PROCESS))
+
+        self.server.reset()
+        list(tratum_api.monitor_processes([VALID_PROCESS], refresh=True))
+        self.assertEqual(self.server.requests["import_process"], 1)
+
+    def test__reconcile(self):
+        """Test drift is corrected with process details."""
+        tratum_api = self._client()
+        tratum_api.monitor_process(VALID_PROCESS)
+        # Process removed by other system
+        self.server.monitored.clear()
+        other = "{:07d}".format(1)
+        self.ledger.set_monitored(1, other)
+
+        result = self.ledger.reconcile(tratum_api)
+        self.assertEqual(result["checked"], 1)
+        self.assertEqual(result["changed"], 1)
+        self.assertIn(other, result["errors"])
+        self.assertFalse(self.ledger.is_monitored(1, VALID_PROCESS))
+        self.assertEqual(list(self.ledger.process_numbers(1)), [other])
+
+        tratum_api.monitor_process(VALID_PROCESS)
+        self.assertEqual(self.server.requests["import_process"], 2)
+
+    def test__monitor_after_reconcile(self):
+        """Test entries set by reconcile do not return empty responses."""
+        TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url).monitor_process(VALID_PROCESS)
+        tratum_api = self._client()
+        result = self.ledger.reconcile(
+            tratum_api, process_numbers=[VALID_PROCESS])
+        self.assertEqual(result["changed"], 1)
+        self.assertTrue(self.ledger.is_monitored(1, VALID_PROCESS))
+
+        response = tratum_api.monitor_process(VALID_PROCESS)
+        self.assertIsInstance(response, dict)
+        self.assertEqual(self.server.requests["import_process"], 2)
+        self.assertEqual(tratum_api.monitor_process(VALID_PROCESS), response)
+        self.assertEqual(self.server.requests["import_process"], 2)
+
+    def test__normalized_keys(self):
+        """Test formatted and plain process numbers share the entry."""
+        tratum_api = self._client()
+        tratum_api.monitor_process(FORMATTED_PROCESS)
+        tratum_api.monitor_process(VALID_PROCESS)
+        self.assertEqual(self.server.requests["import_process"], 1)
+        self.assertEqual(list(self.ledger.process_numbers(1)), [VALID_PROCESS])
+        self.ledger.forget(1, [FORMATTED_PROCESS])
+        self.assertIsNone(self.ledger.is_monitored(1, VALID_PROCESS))
+
+    def test__reconcile_string_booleans(self):
+        """Test `inactive_organization` strings and unknown values."""
+        process_numbers = ["{:07d}".format(index) for index in range(4)]
+        self.ledger.set_many(1, [
+            (process_number, True, None)
+            for process_number in process_numbers])
+        tratum_api = FakeTratumAPI(dict(zip(
+            process_numbers, ["false", "true", 1, "maybe"])))
+        result = self.ledger.reconcile(tratum_api)
+        self.assertEqual(result["checked"], 3)
+        self.assertEqual(result["changed"], 2)
+        self.assertListEqual(list(result["errors"]), [process_numbers[3]])
+        self.assertListEqual(
+            list(self.ledger.process_numbers(1)),
+            [process_numbers[0], process_numbers[3]])
+
+    def test__max_age(self):
+        """Test old entries are unknown."""
+        ledger = MonitoringLedger(max_age=0.01)
+        ledger.set_monitored(1, VALID_PROCESS, {"status": "sucess"})
+        self.assertEqual(
+            ledger.get(1, VALID_PROCESS)["response"], {"status": "sucess"})
+        time.sleep(0.02)
+        self.assertIsNone(ledger.get(1, VALID_PROCESS))
+        ledger.forget(1, [VALID_PROCESS])
+        self.assertEqual(ledger.count(1), 0)
+        ledger.close()
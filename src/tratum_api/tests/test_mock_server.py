@@ -0,0 +1,116 @@
+"""Test clients against the local mock of Tratum API."""
+import io
+import asyncio
+import unittest
+from tratum_api.cache import ProcessDetailCache
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.retry import RetryPolicy
+from tratum_api.exceptions import (
+    TratumAPIInvalidDocumentException, TratumAPIProblemAPIException)
+
+try:
+    import aiohttp
+    from tratum_api.async_data import AsyncTratumAPI
+except ImportError:
+    aiohttp = None
+
+VALID_PROCESS = "19777928520247108243"
+INVALID_PROCESS = "00000000000000000000"
+
+
+class TestMockServer(unittest.TestCase):
+    """Test clients against the local mock of Tratum API."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(
+            detail_size=1000, document_size=10_000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.reset()
+        self.server.error_rate = 0.0
+
+    def _client(self, **kwargs) -> TratumAPI:
+        """Client pointing to the mock server."""
+        return TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, **kwargs)
+
+    def test__monitor(self):
+        """Test monitor and remove monitor."""
+        tratum_api = self._client()
+        self.assertIsNotNone(tratum_api.token_expires_at)
+        response = tratum_api.monitor_process(VALID_PROCESS)
+        self.assertEqual(response["process"]["status"], "VALID")
+        with self.assertRaises(TratumAPIInvalidDocumentException):
+            tratum_api.monitor_process(INVALID_PROCESS)
+        self.assertTrue(tratum_api.remove_monitor_process(VALID_PROCESS))
+        self.assertEqual(self.server.requests["import_process"], 2)
+
+    def test__process_detail(self):
+        """Test process detail and revalidation with ETag."""
+        tratum_api = self._client(cache=ProcessDetailCache(ttl=0))
+        detail = tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertEqual(detail["process"], VALID_PROCESS)
+        self.assertEqual(len(detail["documents"]), 5)
+        self.assertEqual(tratum_api.get_process_detail(VALID_PROCESS), detail)
+        self.assertEqual(tratum_api.cache.stats()["revalidations"], 1)
+        with self.assertRaises(TratumAPIProblemAPIException):
+            tratum_api.get_process_detail(INVALID_PROCESS)
+
+        # Formatted process numbers are answered as the digits
+        tratum_api.monitor_process(VALID_PROCESS)
+        detail = tratum_api.get_process_detail(
+            "1977792-85.2024.7.10.8243", use_cache=False)
+        self.assertEqual(detail["id"], int(VALID_PROCESS[-9:]))
+        self.assertFalse(detail["inactive_organization"])
+
+    def test__documents(self):
+        """Test document download and streaming with resume support."""
+        tratum_api = self._client()
+        document_url = "Processos/401/1/doc-0.pdf"
+        content = tratum_api.download_process_document(document_url)
+        self.assertEqual(content, self.server.document())
+        buffer = io.BytesIO()
+        result = tratum_api.save_process_document(
+            document_url, buffer, chunk_size=1024)
+        self.assertEqual(result["size"], 10_000)
+        self.assertEqual(buffer.getvalue(), content)
+
+    def test__injected_errors(self):
+        """Test injected errors are retried by the client."""
+        tratum_api = self._client(retry_policies={
+            "process_detail": RetryPolicy(
+                max_attempts=20, base_delay=0.001, max_delay=0.01)})
+        self.server.error_rate = 0.5
+        for _ in range(5):
+            tratum_api.get_process_detail(VALID_PROCESS)
+        self.assertGreater(self.server.requests["process_detail"], 5)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test__async_client(self):
+        """Test async client against the mock server."""
+        async def run():
+            async with AsyncTratumAPI(
+                    tratum_email="email", tratum_password="password", # NOQA
+                    organization_id=1, holder_id=1, cnpj="cnpj",
+                    base_url=self.server.url) as tratum_api:
+                details = await asyncio.gather(*[
+                    tratum_api.get_process_detail(VALID_PROCESS)
+                    for _ in range(10)])
+                content = await tratum_api.download_process_document(
+                    "Processos/401/1/doc-0.pdf")
+            return details, content
+
+        details, content = asyncio.run(run())
+        self.assertEqual(len(details), 10)
+        self.assertEqual(content, self.server.document())
@@ -0,0 +1,70 @@
+"""Test Tratum API models."""
+import sys
+import datetime
+import unittest
+from tratum_api.models import (
+    PROCESS_DETAIL_FIELDS, ProcessDetail, parse_datetime)
+
+
+def _process_detail(index: int = 0) -> dict:
+    """Process detail with every field returned by the API."""
+    detail = {field: None for field in PROCESS_DETAIL_FIELDS}
+    detail.update({
+        "process": "{:020d}".format(index),
+        "status": "Ativo",
+        "distribution_date": "10/01/2020",
+        "last_update": "2024-05-01T10:00:00Z",
+        "content_all": " ".join(
+            "movimento {}".format(i) for i in range(500)),
+        "documents": [
+            {"name": "Decisão", "url": "Processos/401/1/a.pdf"}],
+        "instances": [{"movements": [{"text": "Citação"}] * 100}],
+    })
+    return detail
+
+
+class TestProcessDetail(unittest.TestCase):
+    """Test process detail model."""
+
+    def test__to_dict(self):
+        """Test model round-trips to the same dictionary."""
+        detail = _process_detail()
+        model = ProcessDetail(detail)
+        self.assertEqual(model.to_dict(), detail)
+        self.assertListEqual(list(model.to_dict()), list(detail))
+        self.assertEqual(model, detail)
+
+        detail = {"status": "Ativo", "process": "1", "new_field": [1]}
+        model = ProcessDetail(detail)
+        self.assertListEqual(list(model.to_dict()), list(detail))
+        self.assertEqual(model.new_field, [1])
+        self.assertIsNone(model.court)
+        self.assertIsNone(model.documents)
+        self.assertEqual(model.get("court", "missing"), "missing")
+        with self.assertRaises(AttributeError):
+            model.unknown_field
+
+    def test__lazy_fields(self):
+        """Test heavy fields are compact bytes decoded when accessed."""
+        detail = _process_detail()
+        model = ProcessDetail(detail)
+        self.assertIsInstance(model._content_all, bytes)
+        self.assertLess(len(model._content_all), len(detail["content_all"]))
+        self.assertEqual(model.content_all, detail["content_all"])
+        self.assertEqual(model.documents, detail["documents"])
+        self.assertEqual(model.instances, detail["instances"])
+        self.assertFalse(hasattr(model, "__dict__"))
+        self.assertIs(model.status, sys.intern("Ativo"))
+
+    def test__dates(self):
+        """Test dates are parsed on access."""
+        model = ProcessDetail(_process_detail())
+        self.assertEqual(
+            model.distribution_date, datetime.datetime(2020, 1, 10))
+        self.assertEqual(
+            model.last_update, datetime.datetime(
+                2024, 5, 1, 10, tzinfo=datetime.timezone.utc))
+        self.assertEqual(
+            model.get("last_update"), "2024-05-01T10:00:00Z")
+        self.assertIsNone(parse_datetime("not a date"))
+        self.assertIsNone(parse_datetime(None))
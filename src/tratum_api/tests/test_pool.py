@@ -0,0 +1,113 @@
+"""Test multi-tenant pool of clients."""
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.pool import TratumClientPool
+
+VALID_PROCESS = "19777928520247108243"
+
+
+def credentials(tenant_id) -> dict:
+    """Credentials of a tenant."""
+    return dict(
+        tratum_email="{}@example.com".format(tenant_id),
+        tratum_password="password", organization_id=tenant_id, # NOQA
+        holder_id=tenant_id, cnpj="cnpj")
+
+
+class TestTratumClientPool(unittest.TestCase):
+    """Test multi-tenant pool of clients."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.reset()
+
+    def test__lazy_login(self):
+        """Test clients login on first request only."""
+        with TratumClientPool(
+                credentials_loader=credentials, max_concurrency=4,
+                base_url=self.server.url) as pool:
+            clients = [pool.get(tenant_id) for tenant_id in range(10)]
+            self.assertEqual(len(pool), 10)
+            self.assertEqual(self.server.requests["login"], 0)
+            self.assertIs(pool.get(3), clients[3])
+
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(
+                    lambda tenant_id: pool.get(tenant_id % 3)
+                    .get_process_detail(VALID_PROCESS), range(30)))
+            self.assertEqual(len(results), 30)
+            self.assertEqual(self.server.requests["login"], 3)
+            self.assertEqual(pool.stats()["logged_in"], 3)
+            for client in clients:
+                self.assertIs(client.session, pool.session)
+                self.assertIs(client.rate_limiter, pool.rate_limiter)
+
+    def test__register(self):
+        """Test registered tenants and unknown tenants."""
+        pool = TratumClientPool(base_url=self.server.url)
+        pool.register("a", **credentials(1))
+        client = pool.get("a")
+        self.assertEqual(client.organization_id, 1)
+        with self.assertRaises(KeyError):
+            pool.get("b")
+        pool.register("a", **credentials(2))
+        self.assertNotIn("a", pool)
+        self.assertEqual(pool["a"].organization_id, 2)
+        pool.unregister("a")
+        with self.assertRaises(KeyError):
+            pool.get("a")
+        pool.close()
+
+    def test__eviction(self):
+        """Test idle and least recently used clients are evicted."""
+        pool = TratumClientPool(
+            credentials_loader=credentials, max_clients=2,
+            idle_timeout=60, base_url=self.server.url)
+        pool.get(1)
+        pool.get(2)
+        pool.get(1)
+        pool.get(3)
+        self.assertIn(1, pool)
+        self.assertNotIn(2, pool)
+        self.assertEqual(pool.stats()["evicted"], 1)
+
+        time.sleep(0.01)
+        pool.get(3)
+        self.assertEqual(pool.evict_idle(idle_timeout=0.005), 1)
+        self.assertNotIn(1, pool)
+        self.assertIn(3, pool)
+        self.assertEqual(pool.stats()["created"], 3)
+        pool.close()
+
+    def test__slow_loader(self):
+        """Test slow credentials loader does not block other tenants."""
+        def slow_credentials(tenant_id):
+            time.sleep(0.2)
+            return credentials(tenant_id)
+
+        pool = TratumClientPool(
+            credentials_loader=slow_credentials, base_url=self.server.url)
+        pool.register("a", **credentials(1))
+        with ThreadPoolExecutor(4) as executor:
+            futures = [executor.submit(pool.get, 2) for _ in range(3)]
+            time.sleep(0.05)
+            start = time.monotonic()
+            pool.get("a")
+            self.assertLess(time.monotonic() - start, 0.1)
+            clients = [future.result() for future in futures]
+        # Threads loading the same tenant share one client
+        self.assertTrue(all(client is clients[0] for client in clients))
+        self.assertEqual(pool.stats()["created"], 2)
+        pool.close()
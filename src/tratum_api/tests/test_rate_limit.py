@@ -0,0 +1,173 @@
+"""Test rate limiter and adaptive concurrency."""
+import time
+import asyncio
+import threading
+import unittest
+from email.utils import formatdate
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.rate_limit import (
+    AdaptiveConcurrencyLimiter, RateLimiter, TokenBucket, parse_retry_after)
+
+try:
+    import aiohttp
+    from tratum_api.async_data import AsyncTratumAPI
+except ImportError:
+    aiohttp = None
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test token bucket."""
+
+    def test__rate(self):
+        """Test requests above capacity wait for new tokens."""
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        elapsed = time.monotonic() - start
+        # 10 tokens above capacity at 100 tokens per second
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test__async(self):
+        """Test bucket can be awaited from many tasks."""
+        bucket = TokenBucket(rate=200, capacity=1)
+
+        async def run():
+            await asyncio.gather(*[bucket.acquire_async() for _ in range(21)])
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    """Test AIMD concurrency limiter."""
+
+    def test__aimd(self):
+        """Test limit grows on success and halves on throttling."""
+        limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=4, max_limit=8, decrease_cooldown=0)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(status_code=200)
+        self.assertGreater(limiter.limit, 4.5)
+        limiter.acquire()
+        limiter.release(status_code=429)
+        self.assertLess(limiter.limit, 3)
+        limiter.acquire()
+        limiter.release(failed=True)
+        self.assertLess(limiter.limit, 1.5)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test__in_flight_limit(self):
+        """Test no more than limit requests are in flight."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=3, max_limit=3)
+        lock = threading.Lock()
+        state = {"in_flight": 0, "max_in_flight": 0}
+
+        def call():
+            limiter.acquire()
+            with lock:
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(
+                    state["max_in_flight"], state["in_flight"])
+            time.sleep(0.01)
+            with lock:
+                state["in_flight"] -= 1
+            limiter.release(status_code=200)
+
+        threads = [threading.Thread(target=call) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state["max_in_flight"], 3)
+
+    def test__async_wake(self):
+        """Test waiting tasks are woken by releases of other threads."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+        limiter.acquire()
+        timer = threading.Timer(
+            0.05, lambda: limiter.release(status_code=200))
+
+        async def run():
+            timer.start()
+            start = time.monotonic()
+            await limiter.acquire_async()
+            elapsed = time.monotonic() - start
+            # Cancelled waiters are removed
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(limiter.acquire_async(), 0.01)
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        timer.join()
+        self.assertGreaterEqual(elapsed, 0.04)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(limiter.in_flight, 1)
+        self.assertEqual(limiter._async_waiters, [])
+
+    def test__retry_after(self):
+        """Test Retry-After blocks new requests."""
+        limiter = AdaptiveConcurrencyLimiter()
+        limiter.acquire()
+        limiter.release(status_code=429, retry_after=0.1)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test per end-point rate limiter."""
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test__async_cancelled(self):
+        """Test cancelled async requests release their slot."""
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+        with MockTratumServer(detail_size=100) as server:
+            async def run():
+                async with AsyncTratumAPI(
+                        tratum_email="email",
+                        tratum_password="password", # NOQA
+                        organization_id=1, holder_id=1, cnpj="cnpj",
+                        base_url=server.url,
+                        rate_limiter=RateLimiter(
+                            concurrency=limiter)) as tratum_api:
+                    server.latency = 0.5
+                    for _ in range(3):
+                        with self.assertRaises(asyncio.TimeoutError):
+                            await asyncio.wait_for(
+                                tratum_api.get_process_detail(
+                                    "19777928520247108243"), 0.05)
+                    self.assertEqual(limiter.in_flight, 0)
+                    server.latency = 0.0
+                    await tratum_api.get_process_detail(
+                        "19777928520247108243")
+
+            asyncio.run(run())
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test__per_endpoint(self):
+        """Test only configured end-points are limited."""
+        rate_limiter = RateLimiter(per_endpoint={"process_detail": 50})
+        start = time.monotonic()
+        for _ in range(20):
+            rate_limiter.acquire("login")
+            rate_limiter.release("login", status_code=200)
+        self.assertLess(time.monotonic() - start, 0.05)
+
+        start = time.monotonic()
+        for _ in range(60):
+            rate_limiter.acquire("process_detail")
+            rate_limiter.release("process_detail", status_code=200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test__parse_retry_after(self):
+        """Test Retry-After in seconds and HTTP date."""
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        seconds = parse_retry_after(formatdate(time.time() + 30, usegmt=True))
+        self.assertGreater(seconds, 25)
+        self.assertLessEqual(seconds, 30)
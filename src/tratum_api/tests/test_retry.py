@@ -0,0 +1,217 @@
+"""Test retry policies."""
+import time
+import asyncio
+import socket
+import threading
+import unittest
+import http.server
+import requests
+from tratum_api.data import TratumAPI
+from tratum_api.exceptions import TratumAPIProblemAPIException
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.retry import (
+    RetryPolicy, NON_IDEMPOTENT_RETRY_POLICY, is_connect_error,
+    is_transient_error)
+
+try:
+    import aiohttp
+    from tratum_api.async_data import AsyncTratumAPI
+except ImportError:
+    aiohttp = None
+
+
+class OfflineTratumAPI(TratumAPI):
+    """TratumAPI with a fake token so no login is made."""
+
+    def login(self):
+        """Fake login."""
+        self.token = "token"  # NOQA
+        return True
+
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    """Answer 503 to the first `failures` requests and then 200."""
+
+    failures = 2
+    requests_count = 0
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+    def do_GET(self):  # NOQA
+        """Answer GET requests."""
+        FlakyHandler.requests_count += 1
+        status = 503 if FlakyHandler.requests_count <= self.failures else 200
+        body = b'{"status": "ok"}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET  # NOQA
+
+
+def _closed_port() -> int:
+    """Return a local port without a server listening."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Test retry policies."""
+
+    def test__backoff_full_jitter(self):
+        """Test backoff is random between zero and exponential ceiling."""
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt, ceiling in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+            for _ in range(50):
+                delay = policy.backoff(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, ceiling)
+
+    def test__next_delay_limits(self):
+        """Test attempts and deadline stop retries."""
+        policy = RetryPolicy(max_attempts=3, base_delay=0.1, deadline=10)
+        started_at = time.monotonic()
+        self.assertIsNotNone(policy.next_delay(2, started_at))
+        self.assertIsNone(policy.next_delay(3, started_at))
+        self.assertIsNone(
+            policy.next_delay(1, started_at, retry_after=20))
+        self.assertIsNone(policy.next_delay(1, started_at - 11))
+
+    def test__attempt_timeout(self):
+        """Test attempt timeout is limited to what is left of deadline."""
+        policy = RetryPolicy(deadline=10)
+        started_at = time.monotonic()
+        self.assertEqual(policy.attempt_timeout((3, 5), started_at), (3, 5))
+        connect, read = policy.attempt_timeout((3, 60), started_at)
+        self.assertEqual(connect, 3)
+        self.assertLessEqual(read, 10)
+        self.assertLessEqual(policy.attempt_timeout(None, started_at), 10)
+        self.assertEqual(
+            policy.attempt_timeout(60, started_at - 20), 0.001)
+
+    def test__error_classification(self):
+        """Test only connection errors are retried for POST."""
+        try:
+            requests.get(
+                "http://127.0.0.1:{}".format(_closed_port()), timeout=1)
+        except requests.exceptions.ConnectionError as e:
+            connect_error = e
+        self.assertTrue(is_connect_error(connect_error))
+        self.assertTrue(
+            NON_IDEMPOTENT_RETRY_POLICY.should_retry_exception(connect_error))
+
+        read_timeout = requests.exceptions.ReadTimeout()
+        self.assertFalse(is_connect_error(read_timeout))
+        self.assertTrue(is_transient_error(read_timeout))
+        self.assertFalse(
+            NON_IDEMPOTENT_RETRY_POLICY.should_retry_exception(read_timeout))
+        self.assertTrue(RetryPolicy().should_retry_exception(read_timeout))
+        self.assertFalse(is_transient_error(ValueError()))
+
+
+class TestClientRetry(unittest.TestCase):
+    """Test retries made by the client."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start local server."""
+        cls.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), FlakyHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:{}/".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop local server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Reset server counter."""
+        FlakyHandler.requests_count = 0
+
+    def test__retry_status(self):
+        """Test 503 is retried for idempotent end-points."""
+        tratum_api = OfflineTratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj", retry_policies={
+                "process_detail": RetryPolicy(base_delay=0.01)})
+        response = tratum_api._request("process_detail", "GET", self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 2)
+
+    def test__retry_exhausted(self):
+        """Test last response is returned when attempts are exhausted."""
+        tratum_api = OfflineTratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj", retry_policies={
+                "process_detail": RetryPolicy(
+                    max_attempts=2, base_delay=0.01)})
+        response = tratum_api._request("process_detail", "GET", self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.retries, 1)
+
+    def test__connection_error(self):
+        """Test connection errors raise Tratum exception with retries."""
+        tratum_api = OfflineTratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj", retry_policies={
+                "import_process": RetryPolicy(
+                    max_attempts=3, base_delay=0.01,
+                    retry_sent_requests=False)})
+        url = "http://127.0.0.1:{}/".format(_closed_port())
+        with self.assertRaises(TratumAPIProblemAPIException) as context:
+            tratum_api._request("import_process", "POST", url, json={})
+        self.assertEqual(context.exception.payload["retries"], 2)
+
+
+class TestDeadline(unittest.TestCase):
+    """Test deadline limits slow attempts."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=100).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state."""
+        self.server.reset()
+        self.kwargs = {
+            "tratum_email": "email", "tratum_password": "password", # NOQA
+            "organization_id": 1, "holder_id": 1, "cnpj": "cnpj",
+            "base_url": self.server.url, "retry_policies": {
+                "process_detail": RetryPolicy(deadline=0.3)}}
+
+    def tearDown(self):
+        """Remove server latency."""
+        self.server.latency = 0.0
+
+    def test__slow_attempt(self):
+        """Test attempt slower than deadline is cut at the deadline."""
+        tratum_api = TratumAPI(**self.kwargs)
+        self.server.latency = 2
+        start = time.monotonic()
+        with self.assertRaises(TratumAPIProblemAPIException):
+            tratum_api.get_process_detail("19777928520247108243")
+        self.assertLess(time.monotonic() - start, 1)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test__slow_attempt_async(self):
+        """Test async attempt slower than deadline is cut at the deadline."""
+        async def run():
+            async with AsyncTratumAPI(**self.kwargs) as tratum_api:
+                self.server.latency = 2
+                await tratum_api.get_process_detail("19777928520247108243")
+
+        start = time.monotonic()
+        with self.assertRaises(TratumAPIProblemAPIException):
+            asyncio.run(run())
+        self.assertLess(time.monotonic() - start, 1)
@@ -0,0 +1,141 @@
+"""Test local full-text index of process details."""
+import os
+import datetime
+import tempfile
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.search import ProcessIndex
+
+VALID_PROCESS = "19777928520247108243"
+
+
+def _detail(last_update: str, movement: str, court: str = "TJSP",
+            distribution_date: str = "10/01/2020") -> dict:
+    """Process detail with a single movement."""
+    return {
+        "last_update": last_update, "court": court, "state": "SP",
+        "status": "Ativo", "classe": "Execução Fiscal",
+        "distribution_date": distribution_date, "value_claim": "1500.5",
+        "subject": "Dívida ativa",
+        "instances": [{"instance": 1, "movements": [
+            {"date": "01/01/2024", "text": movement}]}],
+        "content_all": None}
+
+
+class TestProcessIndex(unittest.TestCase):
+    """Test ingestion and queries of the index."""
+
+    def setUp(self):
+        """Create index at a temporary directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "index.sqlite3")
+        self.index = ProcessIndex(self.path)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test__incremental(self):
+        """Test processes are indexed again only if they changed."""
+        detail = _detail("2024-01-01T10:00:00", "Penhora realizada")
+        self.assertTrue(self.index.ingest(1, "1", detail))
+        self.assertFalse(self.index.ingest(1, "1", detail))
+        self.assertTrue(self.index.ingest(1, "1", detail, force=True))
+        self.assertEqual(len(self.index.search("penhora")), 1)
+
+        changed = _detail("2024-02-01T10:00:00", "Sentença proferida")
+        self.assertTrue(self.index.ingest(1, "1", changed))
+        self.assertEqual(self.index.search("penhora"), [])
+        self.assertEqual(len(self.index.search("sentenca")), 1)
+
+        # Index is kept between connections and per organization
+        self.index.close()
+        self.index = ProcessIndex(self.path)
+        self.assertFalse(self.index.ingest(1, "1", changed))
+        self.assertTrue(self.index.ingest(2, "1", changed))
+        self.assertEqual(self.index.count(), 2)
+        self.assertEqual(self.index.count(organization_id=1), 1)
+        self.index.remove(2, ["1", "missing"])
+        self.assertEqual(self.index.count(), 1)
+
+    def test__tokenize(self):
+        """Test tokenizer options are accepted and SQL is rejected."""
+        index = ProcessIndex(tokenize="unicode61 tokenchars '-.'")
+        index.close()
+        for tokenize in ("porter'); DROP TABLE process; --", "", None):
+            with self.assertRaises(ValueError):
+                ProcessIndex(tokenize=tokenize)
+
+    def test__search(self):
+        """Test keyword, column and field queries."""
+        self.assertEqual(self.index.ingest_many(1, [
+            ("1", _detail("a", "Tutela antecipada deferida")),
+            ("2", _detail("a", "Recurso de apelação", court="TJRJ",
+                          distribution_date="05/03/2022")),
+            ("3", _detail("a", "Antecipada a audiência",
+                          distribution_date="2021-06-01")),
+        ]), 3)
+
+        results = self.index.search('"tutela antecipada"')
+        self.assertEqual([r["process_number"] for r in results], ["1"])
+        self.assertEqual(results[0]["court"], "TJSP")
+        self.assertEqual(results[0]["distribution_date"], "2020-01-10")
+        self.assertEqual(results[0]["value_claim"], 1500.5)
+        self.assertIn("[Tutela antecipada]", results[0]["snippet"])
+
+        # Accents are ignored
+        results = self.index.search("apelacao")
+        self.assertEqual([r["process_number"] for r in results], ["2"])
+        self.assertEqual(
+            len(self.index.search("divida", columns=["subject"])), 3)
+        self.assertEqual(
+            self.index.search("divida", columns=["movements"]), [])
+        self.assertEqual(
+            [r["process_number"] for r in self.index.search(
+                "antecipada", court="TJSP",
+                distribution_date_from="2021-01-01")], ["3"])
+
+        # Fields only, newest distribution first
+        results = self.index.search(
+            distribution_date_from=datetime.date(2021, 1, 1))
+        self.assertEqual(
+            [r["process_number"] for r in results], ["2", "3"])
+        self.assertNotIn("snippet", results[0])
+        results = self.index.search(
+            court="TJSP", distribution_date_to="31/12/2020")
+        self.assertEqual([r["process_number"] for r in results], ["1"])
+
+        with self.assertRaises(ValueError):
+            self.index.search("penhora", columns=["process"])
+        with self.assertRaises(ValueError):
+            self.index.search(organization="1")
+
+
+class TestClientIndex(unittest.TestCase):
+    """Test client ingests fetched details."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(detail_size=1000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def test__get_process_detail(self):
+        """Test details are indexed when fetched."""
+        index = ProcessIndex()
+        tratum_api = TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url, search_index=index)
+        tratum_api.get_process_detail(VALID_PROCESS)
+        results = index.search("movimentacao", organization_id=1)
+        self.assertEqual(
+            [r["process_number"] for r in results], [VALID_PROCESS])
+        self.assertEqual(results[0]["status"], "Ativo")
+        index.close()
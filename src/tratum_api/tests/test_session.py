@@ -0,0 +1,72 @@
+"""Test HTTP session construction."""
+import os
+import socket
+import unittest
+from unittest import mock
+import requests
+from tratum_api.data import TratumAPI
+from tratum_api.exceptions import TratumAPIProblemAPIException
+from tratum_api.session import (
+    build_session, keepalive_socket_options, TratumHTTPAdapter)
+
+
+class RecordingSession(requests.Session):
+    """Session recording request arguments without sending them."""
+
+    def request(self, method, url, **kwargs):
+        """Record arguments and fail as a connection error."""
+        self.last_kwargs = kwargs
+        raise requests.exceptions.ConnectionError("not sent")
+
+
+class TestSession(unittest.TestCase):
+    """Test HTTP session construction."""
+
+    def test__build_session_pool(self):
+        """Test pool arguments are set on mounted adapters."""
+        session = build_session(pool_connections=4, pool_maxsize=32,
+                                pool_block=True)
+        adapter = session.get_adapter("https://search.tratum.com.br")
+        self.assertIsInstance(adapter, TratumHTTPAdapter)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'],
+                         32)
+        self.assertTrue(adapter.poolmanager.connection_pool_kw['block'])
+        self.assertIs(
+            adapter, session.get_adapter("http://localhost"))
+
+    def test__keepalive_options(self):
+        """Test keep-alive is set on pooled connections."""
+        session = build_session()
+        adapter = session.get_adapter("https://search.tratum.com.br")
+        socket_options = (
+            adapter.poolmanager.connection_pool_kw['socket_options'])
+        self.assertIn(
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), socket_options)
+        self.assertEqual(socket_options, keepalive_socket_options())
+
+    def test__without_keepalive(self):
+        """Test urllib3 default socket options when keep-alive disabled."""
+        session = build_session(tcp_keepalive=False)
+        adapter = session.get_adapter("https://search.tratum.com.br")
+        self.assertNotIn(
+            'socket_options', adapter.poolmanager.connection_pool_kw)
+
+    def test__environment_proxies(self):
+        """Test environment proxies are used only without client proxy."""
+        url = "https://search.tratum.com.br/v1/login"
+        environ = {"HTTPS_PROXY": "http://proxy.example:3128"}
+        for proxy, expected in (
+                (None, "http://proxy.example:3128"),
+                ("http://client.example:8080", "http://client.example:8080")):
+            session = RecordingSession()
+            with mock.patch.dict(os.environ, environ):
+                with self.assertRaises(TratumAPIProblemAPIException):
+                    TratumAPI(
+                        tratum_email="email",
+                        tratum_password="password", # NOQA
+                        organization_id=1, holder_id=1, cnpj="cnpj",
+                        proxy=proxy, session=session, retry_policies={})
+                settings = session.merge_environment_settings(
+                    url, session.last_kwargs.get("proxies") or {},
+                    None, None, None)
+            self.assertEqual(settings["proxies"]["https"], expected)
@@ -0,0 +1,81 @@
+"""Test document streaming with resume and checksum."""
+import os
+import hashlib
+import tempfile
+import unittest
+from tratum_api.data import TratumAPI
+from tratum_api.mock_server import MockTratumServer
+from tratum_api.exceptions import TratumAPIDocumentChecksumException
+
+DOCUMENT_URL = "Processos/401/1/doc-0.pdf"
+
+
+class TestStreamDocument(unittest.TestCase):
+    """Test document streaming against the mock server."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start mock server."""
+        cls.server = MockTratumServer(document_size=10_000).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop mock server."""
+        cls.server.stop()
+
+    def setUp(self):
+        """Reset server state and create a temporary directory."""
+        self.server.reset()
+        self.server.ignore_range = False
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tratum_api = TratumAPI(
+            tratum_email="email", tratum_password="password", # NOQA
+            organization_id=1, holder_id=1, cnpj="cnpj",
+            base_url=self.server.url)
+
+    def tearDown(self):
+        """Remove temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test__resume(self):
+        """Test dropped download is resumed with a Range request."""
+        self.server.drop_downloads(after_bytes=3000)
+        chunks = list(self.tratum_api.stream_process_document(
+            DOCUMENT_URL, chunk_size=1024))
+        self.assertEqual(b"".join(chunks), self.server.document())
+        self.assertEqual(self.server.requests["document_download"], 2)
+
+    def test__range_ignored(self):
+        """Test bytes already received are skipped on status 200."""
+        self.server.ignore_range = True
+        self.server.drop_downloads(after_bytes=3000)
+        chunks = list(self.tratum_api.stream_process_document(
+            DOCUMENT_URL, chunk_size=1024))
+        self.assertEqual(b"".join(chunks), self.server.document())
+        self.assertEqual(self.server.requests["document_download"], 2)
+
+    def test__save_checksum(self):
+        """Test checksum is verified and `.part` file is removed."""
+        path = os.path.join(self.tmp_dir.name, "doc.pdf")
+        checksum = hashlib.sha256(self.server.document()).hexdigest()
+        self.server.drop_downloads(after_bytes=5000)
+        result = self.tratum_api.save_process_document(
+            DOCUMENT_URL, path, chunk_size=1024,
+            expected_checksum=checksum.upper())
+        self.assertEqual(result["checksum"], checksum)
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), self.server.document())
+
+        other_path = os.path.join(self.tmp_dir.name, "other.pdf")
+        with self.assertRaises(TratumAPIDocumentChecksumException):
+            self.tratum_api.save_process_document(
+                DOCUMENT_URL, other_path, expected_checksum="0" * 64)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir.name)), ["doc.pdf"])
+
+    def test__save_open_error(self):
+        """Test error opening the `.part` file is not replaced."""
+        path = os.path.join(self.tmp_dir.name, "missing", "doc.pdf")
+        with self.assertRaises(FileNotFoundError) as context:
+            self.tratum_api.save_process_document(DOCUMENT_URL, path)
+        self.assertIsNone(context.exception.__context__)
@@ -0,0 +1,96 @@
+"""Test process number validation."""
+import random
+import unittest
+from tratum_api.validation import (
+    is_process_number_valid, normalize_process_number,
+    validate_process_numbers)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _reference_is_valid(process_number: str) -> bool:
+    """Check digit algorithm as first implemented at `TratumAPI`."""
+    numbers = [int(digit) for digit in process_number if digit.isdigit()]
+    if len(numbers) != 20:
+        return False
+
+    numbers = ''.join(str(num) for num in numbers)
+    sequencial = numbers[:7]
+    digito_verificador = numbers[7:9]
+    restante = numbers[9:]
+    numero_sem_dv = sequencial + restante
+    resto = int(numero_sem_dv) * 100 % 97
+    dv = 98 - resto
+    return digito_verificador == f"{dv:02d}"
+
+
+def _random_process_numbers(size: int, seed: int = 42) -> list:
+    """Mix of valid, invalid and formatted process numbers."""
+    rng = random.Random(seed)  # NOQA
+    process_numbers = []
+    for _ in range(size):
+        digits = ''.join(rng.choice('0123456789') for _ in range(18))
+        dv = 98 - int(digits) * 100 % 97
+        number = digits[:7] + f"{dv:02d}" + digits[7:]
+        choice = rng.random()
+        if choice < 0.25:
+            # Wrong verification digits
+            number = number[:7] + f"{(dv + 1) % 100:02d}" + number[9:]
+        elif choice < 0.4:
+            number = number[:rng.randint(0, 19)]
+        elif choice < 0.7:
+            number = "{}-{}.{}.{}.{}.{}".format(
+                number[:7], number[7:9], number[9:13], number[13],
+                number[14:16], number[16:])
+        process_numbers.append(number)
+    return process_numbers
+
+
+class TestValidation(unittest.TestCase):
+    """Test process number validation."""
+
+    def test__same_as_reference(self):
+        """Test results are equal to the first implementation."""
+        process_numbers = _random_process_numbers(5000) + [
+            "", "00000000000000000000", "19777928520247108243",
+            "1977792-85.2024.7.10.8243", "١٩٧٧٧٩٢٨٥٢٠٢٤٧١٠٨٢٤٣"]
+        for process_number in process_numbers:
+            self.assertEqual(
+                is_process_number_valid(process_number),
+                _reference_is_valid(process_number), process_number)
+
+    def test__normalize(self):
+        """Test normalization removes punctuation of valid numbers."""
+        self.assertEqual(
+            normalize_process_number("1977792-85.2024.7.10.8243"),
+            "19777928520247108243")
+        self.assertIsNone(normalize_process_number("00000000000000000000"))
+
+    def test__validate_iterable(self):
+        """Test batched validation of an iterable of strings."""
+        process_numbers = _random_process_numbers(1000)
+        mask, normalized = validate_process_numbers(iter(process_numbers))
+        self.assertListEqual(
+            mask, [_reference_is_valid(x) for x in process_numbers])
+        for is_valid, value in zip(mask, normalized):
+            self.assertEqual(is_valid, value is not None)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test__validate_numpy(self):
+        """Test vectorized validation gives same results as scalar."""
+        process_numbers = _random_process_numbers(5000) + [
+            "", "١٩٧٧٧٩٢٨٥٢٠٢٤٧١٠٨٢٤٣"]
+        expected_mask, expected_normalized = validate_process_numbers(
+            process_numbers)
+        for values in [np.array(process_numbers),
+                       np.array(process_numbers[:-1], dtype='S'),
+                       np.array(process_numbers, dtype=object)]:
+            mask, normalized = validate_process_numbers(values)
+            size = len(values)
+            self.assertListEqual(mask.tolist(), expected_mask[:size])
+            self.assertListEqual(
+                normalized.tolist(),
+                [x or '' for x in expected_normalized[:size]])
@@ -0,0 +1,185 @@
+"""Validation of CNJ process numbers without calling Tratum API.
+
+Process numbers follow the CNJ format `NNNNNNN-DD.AAAA.J.TR.OOOO`, where
+`DD` are verification digits computed with ISO 7064 MOD 97-10 over the
+other 18 digits. Punctuation is ignored, only digits are considered.
+"""
+from typing import Iterable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Translation table removing every byte that is not an ASCII digit
+_NON_DIGITS = bytes(c for c in range(256) if not 48 <= c <= 57)
+
+# Rows validated at once by the vectorized path, limits the memory of the
+# intermediate arrays
+_NUMPY_BATCH_SIZE = 1_000_000
+
+if np is not None:
+    # Columns of the digits without verification digits and their
+    # positional value
+    _NUMBER_COLUMNS = list(range(7)) + list(range(9, 20))
+    _NUMBER_POWERS = 10 ** np.arange(17, -1, -1, dtype=np.int64)
+
+
+def _is_process_number_valid_unicode(process_number: str) -> bool:
+    """Validate process number with non-ASCII characters.
+
+    Keeps the behaviour of `str.isdigit`, which also accepts unicode
+    digits.
+    """
+    numbers = [int(digit) for digit in process_number if digit.isdigit()]
+    if len(numbers) != 20:
+        return False
+
+    numbers = ''.join(str(num) for num in numbers)
+    numero_sem_dv = numbers[:7] + numbers[9:]
+    dv = 98 - int(numero_sem_dv) * 100 % 97
+    return numbers[7:9] == f"{dv:02d}"
+
+
+def _process_number_digits(process_number: str) -> bytes:
+    """Return the 20 digits of a valid process number, None if invalid."""
+    if not process_number.isascii():
+        if not _is_process_number_valid_unicode(process_number):
+            return None
+        return ''.join(
+            str(int(digit)) for digit in process_number
+            if digit.isdigit()).encode()
+
+    digits = process_number.encode('ascii').translate(None, _NON_DIGITS)
+    if len(digits) != 20:
+        return None
+    resto = int(digits[:7] + digits[9:]) * 100 % 97
+    if int(digits[7:9]) != 98 - resto:
+        return None
+    return digits
+
+
+def is_process_number_valid(process_number: str) -> bool:
+    """Check process number validation.
+
+    - Must have exactly 20 digits.
+    - First 7 digits must follow a specific sequence.
+    - Last 2 digits (verification digits) must be validated based on
+    initial sequence.
+
+    Args:
+        process_number (str):
+            process number to be validated.
+
+    Returns:
+        bool: Wether process number is valid.
+    """
+    return _process_number_digits(process_number) is not None
+
+
+def normalize_process_number(process_number: str) -> str:
+    """Return the 20 digits of a process number without punctuation.
+
+    Args:
+        process_number (str):
+            process number to be normalized.
+
+    Returns:
+        str: 20 digits of the process number, None if it is not valid.
+    """
+    digits = _process_number_digits(process_number)
+    if digits is None:
+        return None
+    return digits.decode('ascii')
+
+
+def _validate_numpy_batch(codes):
+    """Validate a matrix of character codes, one process number per row.
+
+    Returns:
+        Tuple with boolean mask and matrix with the 20 digits of each row,
+        digits of invalid rows are undefined.
+    """
+    is_digit = (codes >= 48) & (codes <= 57)
+    has_20_digits = is_digit.sum(axis=1) == 20
+    digits = np.zeros((codes.shape[0], 20), dtype=np.uint8)
+    # Boolean indexing is row-major, so digits of each row are kept in
+    # order and every selected row has exactly 20 of them
+    selected = codes[has_20_digits]
+    digits[has_20_digits] = (
+        selected[is_digit[has_20_digits]].reshape(-1, 20) - 48)
+
+    # The 18 digits without verification digits are below 10**18, so the
+    # number fits at int64 before computing MOD 97
+    number = digits[:, _NUMBER_COLUMNS].astype(np.int64) @ _NUMBER_POWERS
+    resto = number % 97 * 100 % 97
+    dv = digits[:, 7].astype(np.int64) * 10 + digits[:, 8]
+    mask = has_20_digits & (dv == 98 - resto)
+    return mask, digits
+
+
+def _validate_numpy(process_numbers):
+    """Vectorized validation of a numpy array of process numbers."""
+    values = np.asarray(process_numbers).ravel()
+    if values.dtype.kind not in ('U', 'S'):
+        values = values.astype(str)
+    size = values.shape[0]
+    mask = np.zeros(size, dtype=bool)
+    normalized = np.zeros(size, dtype='U20')
+    if size == 0 or values.dtype.itemsize == 0:
+        return mask, normalized
+
+    code_type = np.uint32 if values.dtype.kind == 'U' else np.uint8
+    width = values.dtype.itemsize // np.dtype(code_type).itemsize
+    for start in range(0, size, _NUMPY_BATCH_SIZE):
+        batch = np.ascontiguousarray(values[start:start + _NUMPY_BATCH_SIZE])
+        codes = batch.view(code_type).reshape(-1, width)
+        batch_mask, digits = _validate_numpy_batch(codes)
+
+        # Non-ASCII characters may be unicode digits, use scalar path
+        non_ascii = np.nonzero((codes > 127).any(axis=1))[0]
+        for index in non_ascii:
+            value = batch[index]
+            if isinstance(value, bytes):
+                value = value.decode('latin-1')
+            result = normalize_process_number(str(value))
+            batch_mask[index] = result is not None
+            if result is not None:
+                digits[index] = [int(digit) for digit in result]
+
+        batch_normalized = (digits + 48).view('S20')
+        batch_normalized = batch_normalized.ravel().astype('U20')
+        batch_normalized[~batch_mask] = ''
+        mask[start:start + len(batch)] = batch_mask
+        normalized[start:start + len(batch)] = batch_normalized
+    return mask, normalized
+
+
+def validate_process_numbers(process_numbers: Iterable[str]) -> tuple:
+    """Validate many process numbers at once.
+
+    Numpy arrays are validated with vectorized operations, other
+    iterables are validated one by one without creating intermediate
+    objects.
+
+    Args:
+        process_numbers (Iterable[str]):
+            Process numbers to be validated, a numpy array or any iterable
+            of strings.
+
+    Returns:
+        tuple: `(mask, normalized)`. For numpy arrays `mask` is a boolean
+        array and `normalized` an array of 20 digits strings, with empty
+        strings for invalid numbers. For other iterables both are lists
+        and invalid numbers are normalized as None.
+    """
+    if np is not None and isinstance(process_numbers, np.ndarray):
+        return _validate_numpy(process_numbers)
+
+    mask = []
+    normalized = []
+    for process_number in process_numbers:
+        result = normalize_process_number(process_number)
+        mask.append(result is not None)
+        normalized.append(result)
+    return mask, normalized